@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark del lector de tramas
+Sistema PrestaLab SOA
+
+Compara el lector original (data_received += chunk, decode y json.loads)
+con protocol.FrameReader (recv_into sobre un buffer preasignado) leyendo
+una respuesta de reporte de ~1 MB, como la de gerep.get_historial en PDF.
+
+Uso:
+    python bench_frame_reader.py [--size-mb 1] [--rounds 50]
+"""
+
+import argparse
+import base64
+import json
+import os
+import socket
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "services"))
+from common import protocol
+
+
+def build_report(size_mb: float) -> bytes:
+    """Respuesta gerep con un 'PDF' en base64 de aproximadamente size_mb."""
+    raw = os.urandom(int(size_mb * 1024 * 1024 * 3 / 4))
+    payload = {
+        "usuario_id": 1,
+        "formato": "pdf",
+        "filename": "historial_1.pdf",
+        "content": base64.b64encode(raw).decode('ascii'),
+    }
+    return protocol.format_response("gerep", "OK", json.dumps(payload))
+
+
+def legacy_read(sock: socket.socket):
+    """Lector original de los servicios y clientes, extendido a multi-trama."""
+    parts = b''
+    while True:
+        length_bytes = sock.recv(5)
+        amount_expected = int(length_bytes.decode('utf-8'))
+        data_received = b''
+        while len(data_received) < amount_expected:
+            chunk = sock.recv(amount_expected - len(data_received))
+            if not chunk:
+                break
+            data_received += chunk
+        meta, data = protocol.parse_meta(data_received[7:])
+        parts += data
+        if meta.get("more") != "1":
+            break
+    return json.loads(parts.decode('utf-8'))
+
+
+def frame_reader_read(reader: protocol.FrameReader):
+    return reader.read_response().json()
+
+
+def run(label: str, frames: bytes, rounds: int, read_once):
+    sender, receiver = socket.socketpair()
+
+    def send_all():
+        for _ in range(rounds):
+            sender.sendall(frames)
+
+    thread = threading.Thread(target=send_all)
+    start = time.perf_counter()
+    thread.start()
+    read = read_once(receiver)
+    for _ in range(rounds):
+        result = read()
+    elapsed = time.perf_counter() - start
+    thread.join()
+    sender.close()
+    receiver.close()
+
+    assert result["filename"] == "historial_1.pdf"
+    per_message = elapsed / rounds * 1000
+    throughput = len(frames) * rounds / elapsed / (1024 * 1024)
+    print(f"{label:<28} {per_message:8.2f} ms/mensaje  {throughput:8.1f} MB/s")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size-mb", type=float, default=1.0)
+    parser.add_argument("--rounds", type=int, default=50)
+    args = parser.parse_args()
+
+    frames = build_report(args.size_mb)
+    print(f"Mensaje de {len(frames) / 1024:.0f} KB en tramas de continuación, {args.rounds} rondas\n")
+
+    legacy = run("data += chunk (original)", frames, args.rounds,
+                 lambda sock: (lambda: legacy_read(sock)))
+    fast = run("FrameReader (recv_into)", frames, args.rounds,
+               lambda sock: (lambda reader=protocol.FrameReader(sock): frame_reader_read(reader)))
+    print(f"\nMejora: {legacy / fast:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,253 @@
+"""
+Bus SOA local (reemplazo compatible de jrgiadach/soabus)
+Sistema PrestaLab SOA
+
+Implementa el mismo protocolo NNNNNSSSSS y el registro sinit, de modo que
+servicios, gateway y clientes de consola funcionan sin cambios:
+
+1. Una conexión que envía "00010sinitSSSSS" queda registrada como proveedor
+   del servicio SSSSS. Varios proveedores pueden registrarse con el mismo
+   nombre (por ejemplo, los workers de SERVICE_WORKERS) y el bus reparte
+   las transacciones entre ellos (least_loaded o round_robin).
+2. Cualquier otra conexión es un cliente: cada transacción se reenvía a
+   un proveedor y la respuesta vuelve al cliente. Si la transacción trae
+   cid, la respuesta se envía apenas llega (con el mismo cid); si no, en el
+   orden en que el cliente envió sus transacciones.
+3. Hacia los proveedores el bus usa sus propios cid, únicos por conexión,
+   de modo que un proveedor puede responder fuera de orden sin que se
+   mezclen transacciones de distintos clientes. Una respuesta sin cid (un
+   servicio que no lo soporta) se asocia con la transacción pendiente más
+   antigua de esa conexión.
+
+Una transacción cuyo plazo (dl) ya venció se responde con NK sin
+reenviarla. DATOS se reenvía sin decodificar ni descomprimir. La
+pseudo-operación "_bus_ stats" retorna, por servicio, la cantidad de
+proveedores, las transacciones pendientes (profundidad de cola) y los
+contadores de latencia.
+
+Uso local:
+    python backend/bus/app.py          # escucha en 0.0.0.0:5000
+"""
+
+import asyncio
+import json
+import os
+import sys
+import time
+from itertools import count
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "services"))
+from common import deadline, protocol
+from common.log import elapsed_ms, get_logger, truncate
+from common.registry import OperationStats
+
+BUS_HOST = os.getenv("BUS_LISTEN_HOST", "0.0.0.0")
+BUS_PORT = int(os.getenv("BUS_PORT", "5000"))
+BUS_DISPATCH = os.getenv("BUS_DISPATCH", "least_loaded")   # least_loaded | round_robin
+BUS_SERVICE = "_bus_"
+
+log = get_logger("bus")
+
+
+class Provider:
+    """Conexión de un servicio registrado con sinit."""
+
+    def __init__(self, service: str, provider_id: int, reader: asyncio.StreamReader,
+                 writer: asyncio.StreamWriter):
+        self.service = service
+        self.provider_id = provider_id
+        self.reader = reader
+        self.writer = writer
+        self.pending = {}   # cid del bus -> future, en el orden en que se enviaron
+        self.served = 0
+        self._cids = count(1)
+
+    @property
+    def in_flight(self) -> int:
+        return len(self.pending)
+
+    def send(self, message: protocol.Message) -> asyncio.Future:
+        """Reenvía la transacción con un cid del bus; el future se resuelve con la respuesta."""
+        cid = str(next(self._cids))
+        future = asyncio.get_running_loop().create_future()
+        # Sin await entre registrar y escribir: el orden de pending es el del socket
+        self.pending[cid] = future
+        self.writer.write(protocol.format_request(self.service, message.data, dict(message.meta, cid=cid)))
+        return future
+
+    async def read_responses(self):
+        """Entrega cada respuesta a la transacción con su cid (o a la más antigua)."""
+        while True:
+            response = await protocol.read_response(self.reader, decompress=False)
+            if response is None:
+                return
+            cid = response.meta.pop("cid", None)
+            if cid is None and self.pending:
+                cid = next(iter(self.pending))
+            future = self.pending.pop(cid, None)
+            if future is None:
+                log.warning("Respuesta sin transacción pendiente", service=self.service,
+                            provider=self.provider_id)
+                continue
+            self.served += 1
+            if not future.done():
+                future.set_result(response)
+
+    def fail_pending(self):
+        pending, self.pending = self.pending, {}
+        for future in pending.values():
+            if not future.done():
+                future.set_exception(ConnectionResetError("El proveedor cerró la conexión"))
+
+    def snapshot(self) -> dict:
+        return {"id": self.provider_id, "in_flight": self.in_flight, "served": self.served}
+
+
+class ServiceEntry:
+    """Proveedores y contadores de un nombre de servicio."""
+
+    def __init__(self, name: str, dispatch: str):
+        self.name = name
+        self.dispatch = dispatch
+        self.providers = []
+        self.stats = OperationStats()
+        self._next = 0
+
+    def pick(self) -> Provider:
+        if self.dispatch == "round_robin":
+            self._next = (self._next + 1) % len(self.providers)
+            return self.providers[self._next]
+        # least_loaded: menos transacciones pendientes; a igual carga, rota
+        self._next += 1
+        start = self._next % len(self.providers)
+        ordered = self.providers[start:] + self.providers[:start]
+        return min(ordered, key=lambda provider: provider.in_flight)
+
+    @property
+    def queue_depth(self) -> int:
+        return sum(provider.in_flight for provider in self.providers)
+
+    def snapshot(self) -> dict:
+        return {
+            "providers": [provider.snapshot() for provider in self.providers],
+            "queue_depth": self.queue_depth,
+            **self.stats.snapshot(),
+        }
+
+
+class Bus:
+    def __init__(self, dispatch: str = BUS_DISPATCH):
+        self.dispatch = dispatch
+        self.services = {}
+        self._ids = count(1)
+
+    def _entry(self, name: str) -> ServiceEntry:
+        entry = self.services.get(name)
+        if entry is None:
+            entry = self.services[name] = ServiceEntry(name, self.dispatch)
+        return entry
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            message = await protocol.read_request(reader, decompress=False)
+            if message is None:
+                return
+            if message.service == "sinit":
+                await self._serve_provider(message.text().strip(), reader, writer)
+            else:
+                await self._serve_client(message, reader, writer)
+        except (ConnectionResetError, BrokenPipeError, ValueError) as e:
+            log.warning("Conexión terminada", error=e)
+        finally:
+            writer.close()
+
+    # --- Proveedores ---
+
+    async def _serve_provider(self, service: str, reader, writer):
+        provider = Provider(service, next(self._ids), reader, writer)
+        entry = self._entry(service)
+        await protocol.write_frame(writer, protocol.format_response("sinit", "OK", service))
+        entry.providers.append(provider)
+        log.info("Servicio registrado", service=service, provider=provider.provider_id,
+                 providers=len(entry.providers))
+        try:
+            await provider.read_responses()
+        finally:
+            entry.providers.remove(provider)
+            provider.fail_pending()
+            log.info("Proveedor desconectado", service=service, provider=provider.provider_id,
+                     providers=len(entry.providers))
+
+    # --- Clientes ---
+
+    async def _serve_client(self, message: protocol.Message, reader, writer):
+        """Atiende las transacciones de un cliente, varias a la vez."""
+        responses = protocol.ResponseWriter(writer)
+        in_flight = set()
+        try:
+            while message is not None:
+                client_cid = message.meta.pop("cid", None)
+                task = responses.submit(self._dispatch(message, client_cid), ordered=client_cid is None)
+                in_flight.add(task)
+                task.add_done_callback(in_flight.discard)
+                message = await protocol.read_request(reader, decompress=False)
+            if in_flight:
+                await asyncio.gather(*in_flight)
+        finally:
+            for task in in_flight:
+                task.cancel()
+
+    async def _dispatch(self, message: protocol.Message, client_cid: str = None) -> bytes:
+        """Reenvía la transacción y retorna la respuesta formateada para el cliente."""
+        service = message.service
+        meta = {"cid": client_cid} if client_cid else {}
+        if service == BUS_SERVICE:
+            return protocol.format_response(BUS_SERVICE, "OK", json.dumps(self.stats()), meta)
+
+        if deadline.expired(message.meta):
+            # El cliente ya no espera la respuesta: no ocupar al servicio
+            return _error(service, deadline.EXPIRED_ERROR, meta)
+
+        entry = self.services.get(service)
+        if entry is None or not entry.providers:
+            log.warning("Servicio no disponible", service=service)
+            return _error(service, f"Servicio no disponible: {service}", meta)
+
+        provider = entry.pick()
+        if log.debug_enabled(service):
+            log.debug("Reenviando transacción", op=service, provider=provider.provider_id,
+                      data=truncate(message.data))
+        start = time.perf_counter()
+        try:
+            response = await provider.send(message)
+        except ConnectionResetError:
+            entry.stats.record(elapsed_ms(start), False)
+            return _error(service, f"El servicio {service} cerró la conexión", meta)
+        entry.stats.record(elapsed_ms(start), response.status == "OK")
+        return protocol.format_response(response.service, response.status, response.data,
+                                        dict(response.meta, **meta))
+
+    def stats(self) -> dict:
+        return {
+            "dispatch": self.dispatch,
+            "services": {name: entry.snapshot() for name, entry in self.services.items()},
+        }
+
+
+def _error(service: str, message: str, meta: dict = None) -> bytes:
+    return protocol.format_response(service, "NK", json.dumps({"error": message}), meta)
+
+
+async def main():
+    bus = Bus()
+    server = await asyncio.start_server(bus.handle_connection, BUS_HOST, BUS_PORT)
+    log.info("Bus SOA local escuchando", address=f"{BUS_HOST}:{BUS_PORT}", dispatch=bus.dispatch)
+    async with server:
+        await server.serve_forever()
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
@@ -9,11 +9,17 @@ import socket
 import json
 import base64
 import os
+import sys
 from datetime import datetime, timedelta
 from typing import Optional, Tuple, Dict, Any
 
+# Protocolo compartido con los servicios (soporta mensajes de más de 99.999 bytes)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "services"))
+from common import compression, deadline, protocol
+
 # Configuración del Bus SOA
 BUS_ADDRESS = ('localhost', 5000)
+REQUEST_TIMEOUT = 10  # segundos
 
 # Estado de sesión del usuario
 class Session:
@@ -62,40 +68,28 @@ def send_to_bus(service: str, operation: str, payload: dict) -> Tuple[Optional[s
     """
     try:
         # Preparar el mensaje según protocolo: NNNNNSSSSSDATOS
-        service_padded = service.ljust(5)[:5]
         data_str = f"{operation} {json.dumps(payload)}"
-        message_body = f"{service_padded}{data_str}"
-        message_len = len(message_body)
-        formatted_message = f"{message_len:05d}{message_body}".encode('utf-8')
+        # az: el servicio puede comprimir respuestas grandes; recv_response las descomprime
+        # dl: el servicio descarta la transacción si este cliente ya dejó de esperar
+        meta = deadline.stamp({"az": compression.accept_header()}, REQUEST_TIMEOUT)
+        formatted_message = protocol.format_request(service, data_str, meta)
         
         # Conectar y enviar
         sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        sock.settimeout(10)  # Timeout de 10 segundos
+        sock.settimeout(REQUEST_TIMEOUT)
         
         try:
             sock.connect(BUS_ADDRESS)
             sock.sendall(formatted_message)
             
-            # Leer respuesta: NNNNNSSSSSSTDATOS
-            length_bytes = sock.recv(5)
-            if not length_bytes:
+            # Leer respuesta: NNNNNSSSSSSTDATOS (una o más tramas)
+            response = protocol.recv_response(sock)
+            if response is None:
                 return None, {"error": "Sin respuesta del bus"}
             
-            amount_expected = int(length_bytes.decode('utf-8'))
-            data_received = b''
-            
-            while len(data_received) < amount_expected:
-                chunk = sock.recv(amount_expected - len(data_received))
-                if not chunk:
-                    break
-                data_received += chunk
-            
-            response_str = data_received.decode('utf-8')
-            
             # Parsear respuesta
-            # response_service = response_str[:5]  # No usado
-            status = response_str[5:7]  # OK o NK
-            response_data = response_str[7:]
+            status = response.status  # OK o NK
+            response_data = response.text()
             
             # Intentar parsear como JSON
             try:
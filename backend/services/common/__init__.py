@@ -0,0 +1,6 @@
+"""
+Código compartido por los servicios de PrestaLab SOA.
+
+- protocol: armado y lectura de tramas NNNNNSSSSS del Bus SOA.
+- runtime:  bucle asíncrono que registra el servicio (sinit) y despacha transacciones.
+"""
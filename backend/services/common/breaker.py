@@ -0,0 +1,122 @@
+"""
+Circuit breakers por servicio para el gateway.
+
+Si un servicio está caído, el bus igual acepta la trama y cada request
+espera el timeout completo, ocupando conexiones del pool que necesitan
+los servicios sanos. El breaker de cada servicio cuenta los fallos
+consecutivos (timeouts, errores de conexión, servicio no disponible):
+
+- closed:    las transacciones pasan; failure_threshold fallos seguidos lo abren.
+- open:      se rechazan de inmediato (CircuitOpenError) durante reset_timeout s.
+- half_open: pasa una sola transacción de prueba; si responde se cierra, si
+             falla vuelve a abrirse. Las demás se rechazan mientras tanto.
+"""
+
+import time
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    def __init__(self, service: str, retry_after: float):
+        super().__init__(f"Servicio {service} no disponible (circuito abierto)")
+        self.service = service
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    def __init__(self, service: str, failure_threshold: int, reset_timeout: float):
+        """
+        failure_threshold: fallos consecutivos que abren el circuito (0 lo desactiva).
+        reset_timeout:     segundos abierto antes de dejar pasar una prueba.
+        """
+        self.service = service
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.state_since = time.monotonic()
+        self.opened_at = 0.0
+        self.probing = False
+        self.consecutive_failures = 0
+        self.successes = 0
+        self.failures = 0
+        self.rejected = 0
+        self.trips = 0
+        self.last_error = None
+
+    def _set_state(self, state: str):
+        self.state = state
+        self.state_since = time.monotonic()
+
+    def retry_after(self) -> float:
+        return max(self.opened_at + self.reset_timeout - time.monotonic(), 0.0)
+
+    def before_call(self):
+        """Lanza CircuitOpenError si la transacción no puede pasar; si pasa, hay que llamar a record() o abandon()."""
+        if self.failure_threshold <= 0 or self.state == CLOSED:
+            return
+        if self.state == OPEN and self.retry_after() <= 0:
+            self._set_state(HALF_OPEN)
+        if self.state == HALF_OPEN and not self.probing:
+            self.probing = True
+            return
+        self.rejected += 1
+        raise CircuitOpenError(self.service, self.retry_after() or self.reset_timeout)
+
+    def record(self, ok: bool, error: str = None):
+        """Resultado de una transacción que pasó por before_call()."""
+        self.probing = False
+        if ok:
+            self.successes += 1
+            self.consecutive_failures = 0
+            if self.state != CLOSED:
+                self._set_state(CLOSED)
+            return
+        self.failures += 1
+        self.consecutive_failures += 1
+        self.last_error = error
+        if self.failure_threshold <= 0:
+            return
+        if self.state == HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+            if self.state != OPEN:
+                self.trips += 1
+            self.opened_at = time.monotonic()
+            self._set_state(OPEN)
+
+    def abandon(self):
+        """La transacción se canceló sin resultado (el cliente HTTP cortó): libera la prueba."""
+        self.probing = False
+
+    def stats(self) -> dict:
+        return {
+            "state": self.state,
+            "state_for_s": round(time.monotonic() - self.state_since, 3),
+            "retry_after_s": round(self.retry_after(), 3) if self.state == OPEN else 0.0,
+            "consecutive_failures": self.consecutive_failures,
+            "successes": self.successes,
+            "failures": self.failures,
+            "rejected": self.rejected,
+            "trips": self.trips,
+            "last_error": self.last_error,
+        }
+
+
+class CircuitBreakers:
+    """Un breaker por servicio, creado en su primera transacción."""
+
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.breakers = {}
+
+    def get(self, service: str) -> CircuitBreaker:
+        breaker = self.breakers.get(service)
+        if breaker is None:
+            breaker = CircuitBreaker(service, self.failure_threshold, self.reset_timeout)
+            self.breakers[service] = breaker
+        return breaker
+
+    def stats(self) -> dict:
+        return {service: breaker.stats() for service, breaker in sorted(self.breakers.items())}
@@ -0,0 +1,212 @@
+"""
+Caché de respuestas de lectura del gateway (TTL + LRU) y single-flight.
+
+Los servicios marcan con ro=1 en el meta las respuestas de operaciones de
+solo lectura. El gateway guarda esas respuestas (si son OK) con clave
+(servicio, operación, payload normalizado) y las reutiliza hasta que
+venza el TTL. Una respuesta sin ro=1 es de una escritura e invalida las
+entradas del servicio al recibirse; no antes de enviarla, porque el
+gateway todavía no sabe si la operación es una lectura. Las respuestas que además llevan nc=1 (login) son lecturas que
+no se guardan ni se comparten.
+
+Varios servicios leen tablas que escribe otro (prart lista las solicitudes
+que aprueba regist, regist muestra el bloqueo que pone multa). Las
+dependencias declaradas (parse_dependencies) indican qué servicios invalida
+además una escritura:
+
+    regist:prart+gerep,multa:regist
+
+Los nombres de servicio se usan como los identifica el bus
+(protocol.service_name).
+
+Cada servicio tiene un número de generación que aumenta con cada
+invalidación: una lectura que empezó antes de una escritura no guarda su
+respuesta, porque podría ser anterior al cambio.
+
+La versión de un servicio (para ETag) cambia con cada invalidación y, a
+más tardar, cada version_ttl segundos: así un cliente que revalida con
+If-None-Match puede recibir 304 sin llamar al bus, y las escrituras que
+no pasan por este gateway se ven cuando vence la versión.
+
+SingleFlight agrupa las lecturas idénticas que llegan mientras otra igual
+está en curso: todas esperan la misma transacción al bus.
+"""
+
+import asyncio
+import json
+import time
+from collections import OrderedDict, defaultdict
+
+from common.protocol import service_name
+
+
+def parse_dependencies(text: str) -> dict:
+    """"escritor:lector+lector, ..." -> {escritor: {lectores}}; ValueError si alguna está mal escrita."""
+    dependencies = defaultdict(set)
+    for entry in filter(None, (part.strip() for part in text.split(","))):
+        writer, _, readers = entry.partition(":")
+        readers = [service_name(reader) for reader in readers.split("+") if reader.strip()]
+        if not writer.strip() or not readers:
+            raise ValueError(f"Dependencia de caché inválida: {entry}")
+        dependencies[service_name(writer)].update(readers)
+    return dict(dependencies)
+
+
+class ResponseCache:
+    def __init__(self, max_entries: int, ttl: float, version_ttl: float = 0, dependencies: dict = None):
+        """
+        max_entries:  entradas como máximo; al superarlo se descarta la menos usada.
+        ttl:          segundos de vigencia de cada entrada (0 desactiva la caché).
+        version_ttl:  segundos de vigencia de la versión de un servicio (0 desactiva los ETag).
+        dependencies: servicios que invalida además una escritura en cada servicio (parse_dependencies).
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.version_ttl = version_ttl
+        self.dependencies = dependencies or {}
+        self.entries = OrderedDict()
+        self.read_only = set()
+        self.uncacheable = set()
+        self.generations = defaultdict(int)
+        self.versions = {}
+        self.version_seq = 0
+        # Un gateway reiniciado no reutiliza versiones anteriores
+        self.boot = f"{int(time.time()):x}"
+        self.not_modified = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0 and self.max_entries > 0
+
+    @staticmethod
+    def key(service: str, operation: str, payload: dict):
+        """Clave con el payload normalizado: el orden de los campos no importa."""
+        return service, operation, json.dumps(payload, sort_keys=True, separators=(",", ":"))
+
+    def is_read_only(self, service: str, operation: str) -> bool:
+        """True si el servicio ya marcó la operación con ro=1 (y no con nc=1)."""
+        return (service, operation) in self.read_only
+
+    def is_uncacheable(self, service: str, operation: str) -> bool:
+        """True si la operación es una lectura que no se guarda (nc=1): no invalida ni se comparte."""
+        return (service, operation) in self.uncacheable
+
+    def learn(self, service: str, operation: str, cacheable: bool = True):
+        (self.read_only if cacheable else self.uncacheable).add((service, operation))
+
+    def generation(self, service: str) -> int:
+        return self.generations[service]
+
+    def version(self, service: str):
+        """Versión vigente de los datos del servicio, o None si los ETag están desactivados."""
+        if self.version_ttl <= 0:
+            return None
+        now = time.monotonic()
+        entry = self.versions.get(service)
+        if entry is None or entry[1] <= now:
+            self.version_seq += 1
+            entry = (f"{self.boot}-{self.version_seq}", now + self.version_ttl)
+            self.versions[service] = entry
+        return entry[0]
+
+    def matches(self, version, if_none_match: str) -> bool:
+        """True si algún ETag de If-None-Match corresponde a version (se responde 304)."""
+        if version is None or not if_none_match:
+            return False
+        tags = {tag.strip().removeprefix("W/").strip('"') for tag in if_none_match.split(",")}
+        if version not in tags:
+            return False
+        self.not_modified += 1
+        return True
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        expires, value = entry
+        if expires <= time.monotonic():
+            del self.entries[key]
+            self.expirations += 1
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key, value, generation: int):
+        """Guarda value salvo que el servicio se haya invalidado desde generation."""
+        if not self.enabled or generation != self.generations[key[0]]:
+            return
+        self.entries[key] = (time.monotonic() + self.ttl, value)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, service: str):
+        """Escritura en service: descarta sus lecturas y las de los servicios que dependen de él."""
+        services = {service} | self.dependencies.get(service, set())
+        for name in services:
+            self.generations[name] += 1
+            self.versions.pop(name, None)
+        stale = [key for key in self.entries if key[0] in services]
+        for key in stale:
+            del self.entries[key]
+        if stale:
+            self.invalidations += 1
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "entries": len(self.entries),
+            "max_entries": self.max_entries,
+            "ttl_s": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations,
+            "version_ttl_s": self.version_ttl,
+            "not_modified": self.not_modified,
+        }
+
+
+class SingleFlight:
+    def __init__(self):
+        self.calls = {}
+        self.leaders = 0
+        self.shared = 0
+
+    async def run(self, key, call):
+        """
+        Ejecuta call() (una coroutine) salvo que ya haya una en curso con la
+        misma clave; en ese caso espera su resultado. La llamada corre en su
+        propia tarea, así que si el primer solicitante se cancela (el cliente
+        HTTP cortó) los demás igual reciben la respuesta.
+        """
+        task = self.calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(call())
+            self.calls[key] = task
+            task.add_done_callback(lambda done: self._finished(key, done))
+            self.leaders += 1
+        else:
+            self.shared += 1
+        return await asyncio.shield(task)
+
+    def _finished(self, key, task):
+        self.calls.pop(key, None)
+        if not task.cancelled():
+            # Marca la excepción como recuperada aunque todos los solicitantes se hayan ido
+            task.exception()
+
+    def stats(self) -> dict:
+        return {"in_flight": len(self.calls), "leaders": self.leaders, "shared": self.shared}
@@ -0,0 +1,312 @@
+"""
+Clientes asíncronos del Bus SOA para el gateway HTTP.
+
+- BusPool: pool acotado de conexiones persistentes. Cada request HTTP toma
+  una conexión, envía su transacción, espera la respuesta y la devuelve
+  para que la reutilice el siguiente request, sin pagar un handshake TCP
+  por llamada. Funciona con cualquier bus.
+- MultiplexedBusClient: pocas conexiones con muchas transacciones en vuelo
+  cada una, correlacionadas por cid. Las respuestas pueden llegar en
+  cualquier orden. Requiere un bus que reenvíe el cid (backend/bus).
+
+Ambos exponen la misma interfaz: request(service, data, timeout, meta),
+run_health_checks(), stats() y close().
+
+Con timings (un Histogram de common.metrics con etiquetas service y phase)
+registran cuánto tarda cada fase de una transacción:
+
+- pool:    espera por una conexión libre (o un cupo de transacciones en vuelo).
+- connect: apertura de una conexión TCP nueva (solo cuando hace falta una).
+- send:    escritura de la trama hasta vaciar el buffer.
+- wait:    desde el envío hasta que llega el encabezado de la respuesta
+           (cola del bus, trabajo del servicio y red).
+- parse:   lectura del resto de la respuesta, reensamblado y descompresión.
+"""
+
+import asyncio
+import time
+from itertools import count
+
+from common import protocol
+
+
+def _observe(timings, service: str, phase: str, started: float) -> float:
+    """Registra la fase que empezó en started (perf_counter) y retorna el instante actual."""
+    now = time.perf_counter()
+    if timings is not None:
+        timings.observe(now - started, service, phase)
+    return now
+
+
+class BusConnection:
+    """Una conexión TCP al bus, usada por un solo request a la vez."""
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.reader = reader
+        self.writer = writer
+        self.last_used = time.monotonic()
+
+    def is_healthy(self) -> bool:
+        """La conexión sigue abierta y el bus no envió EOF."""
+        return not (self.writer.is_closing() or self.reader.at_eof())
+
+    async def request(self, frame: bytes, service: str = "", timings=None) -> protocol.Message:
+        """Envía una transacción y retorna la respuesta completa."""
+        started = time.perf_counter()
+        await protocol.write_frame(self.writer, frame)
+        started = _observe(timings, service, "send", started)
+        header = await protocol.read_header(self.reader)
+        response = None
+        if header is not None:
+            started = _observe(timings, service, "wait", started)
+            response = await protocol.read_response(self.reader, header=header)
+            _observe(timings, service, "parse", started)
+        if response is None:
+            raise ConnectionResetError("El Bus SOA cerró la conexión inesperadamente.")
+        self.last_used = time.monotonic()
+        return response
+
+    def close(self):
+        self.writer.close()
+
+
+class BusPool:
+    def __init__(self, address, size: int = 10, connect_timeout: float = 3.0,
+                 idle_timeout: float = 60.0, timings=None):
+        """
+        address:         tupla (host, puerto) del bus.
+        size:            máximo de conexiones abiertas (y de requests en vuelo).
+        connect_timeout: segundos para establecer una conexión nueva.
+        idle_timeout:    segundos que una conexión puede quedar ociosa antes de cerrarse.
+        timings:         histograma de las fases de cada transacción (opcional).
+        """
+        self.address = address
+        self.size = size
+        self.connect_timeout = connect_timeout
+        self.idle_timeout = idle_timeout
+        self.timings = timings
+        self._idle = []
+        self._in_use = 0
+        self._slots = asyncio.Semaphore(size)
+
+    async def _connect(self) -> BusConnection:
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_connection(*self.address), timeout=self.connect_timeout
+        )
+        return BusConnection(reader, writer)
+
+    async def acquire(self, service: str = "") -> BusConnection:
+        """Toma una conexión sana del pool o abre una nueva."""
+        started = time.perf_counter()
+        await self._slots.acquire()
+        started = _observe(self.timings, service, "pool", started)
+        try:
+            now = time.monotonic()
+            while self._idle:
+                conn = self._idle.pop()
+                if conn.is_healthy() and now - conn.last_used < self.idle_timeout:
+                    self._in_use += 1
+                    return conn
+                conn.close()
+            conn = await self._connect()
+            _observe(self.timings, service, "connect", started)
+            self._in_use += 1
+            return conn
+        except BaseException:
+            self._slots.release()
+            raise
+
+    def release(self, conn: BusConnection, reusable: bool = True):
+        """Devuelve la conexión al pool, o la cierra si quedó en un estado dudoso."""
+        self._in_use -= 1
+        if reusable and conn.is_healthy():
+            self._idle.append(conn)
+        else:
+            conn.close()
+        self._slots.release()
+
+    async def request(self, service: str, data, timeout: float, meta: dict = None):
+        """
+        Envía una transacción y retorna la respuesta (Message). El timeout
+        incluye la espera por una conexión libre. Si se agota, la conexión
+        se descarta: su respuesta podría llegar después y confundirse con
+        la del siguiente request.
+        """
+        frame = protocol.format_request(service, data, meta)
+        return await asyncio.wait_for(self._request(service, frame), timeout=timeout)
+
+    async def _request(self, service: str, frame: bytes):
+        conn = await self.acquire(service)
+        reusable = False
+        try:
+            response = await conn.request(frame, service, self.timings)
+            reusable = True
+            return response
+        finally:
+            self.release(conn, reusable)
+
+    def prune(self):
+        """Chequeo de salud: cierra las conexiones ociosas que murieron o expiraron."""
+        now = time.monotonic()
+        alive = []
+        for conn in self._idle:
+            if conn.is_healthy() and now - conn.last_used < self.idle_timeout:
+                alive.append(conn)
+            else:
+                conn.close()
+        self._idle = alive
+
+    async def run_health_checks(self, interval: float = 10.0):
+        """Tarea de fondo que ejecuta prune() periódicamente."""
+        while True:
+            await asyncio.sleep(interval)
+            self.prune()
+
+    def stats(self) -> dict:
+        return {"size": self.size, "in_use": self._in_use, "idle": len(self._idle)}
+
+    async def close(self):
+        while self._idle:
+            self._idle.pop().close()
+
+
+class MultiplexedConnection:
+    """Una conexión TCP al bus con varias transacciones en vuelo, correlacionadas por cid."""
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, timings=None):
+        self.reader = reader
+        self.writer = writer
+        self.timings = timings
+        self.pending = {}   # cid -> future, en el orden en que se enviaron
+        self._sent = {}     # cid -> instante en que terminó el envío (para medir wait)
+        self._cids = count(1)
+        self._closed = False
+        self._reader_task = asyncio.create_task(self._read_responses())
+
+    @property
+    def in_flight(self) -> int:
+        return len(self.pending)
+
+    def is_healthy(self) -> bool:
+        return not (self._closed or self.writer.is_closing())
+
+    async def request(self, service: str, data, meta: dict = None) -> protocol.Message:
+        cid = str(next(self._cids))
+        future = asyncio.get_running_loop().create_future()
+        self.pending[cid] = future
+        try:
+            started = time.perf_counter()
+            self.writer.write(protocol.format_request(service, data, dict(meta or {}, cid=cid)))
+            await self.writer.drain()
+            self._sent[cid] = _observe(self.timings, service, "send", started)
+            return await future
+        finally:
+            # Si el request se cancela (timeout), una respuesta tardía se descarta
+            self.pending.pop(cid, None)
+            self._sent.pop(cid, None)
+
+    async def _read_responses(self):
+        try:
+            while True:
+                header = await protocol.read_header(self.reader)
+                if header is None:
+                    break
+                arrived = time.perf_counter()
+                response = await protocol.read_response(self.reader, header=header)
+                if response is None:
+                    break
+                cid = response.meta.pop("cid", None)
+                if cid is None and self.pending:
+                    # Bus que no reenvía el cid: responde en orden
+                    cid = next(iter(self.pending))
+                sent = self._sent.pop(cid, None)
+                if sent is not None and self.timings is not None:
+                    self.timings.observe(arrived - sent, response.service, "wait")
+                    _observe(self.timings, response.service, "parse", arrived)
+                future = self.pending.pop(cid, None)
+                if future is not None and not future.done():
+                    future.set_result(response)
+        except (ConnectionResetError, ValueError):
+            pass
+        finally:
+            self._closed = True
+            self.writer.close()
+            pending, self.pending = self.pending, {}
+            self._sent.clear()
+            for future in pending.values():
+                if not future.done():
+                    future.set_exception(ConnectionResetError("El Bus SOA cerró la conexión inesperadamente."))
+
+    def close(self):
+        self._closed = True
+        self._reader_task.cancel()
+        self.writer.close()
+
+
+class MultiplexedBusClient:
+    def __init__(self, address, connections: int = 2, max_in_flight: int = 256,
+                 connect_timeout: float = 3.0, timings=None):
+        """
+        address:         tupla (host, puerto) del bus.
+        connections:     máximo de conexiones abiertas.
+        max_in_flight:   máximo de transacciones en vuelo entre todas las conexiones.
+        connect_timeout: segundos para establecer una conexión nueva.
+        timings:         histograma de las fases de cada transacción (opcional).
+        """
+        self.address = address
+        self.connections = connections
+        self.max_in_flight = max_in_flight
+        self.connect_timeout = connect_timeout
+        self.timings = timings
+        self._conns = []
+        self._slots = asyncio.Semaphore(max_in_flight)
+        self._connect_lock = asyncio.Lock()
+
+    async def _connection(self, service: str = "") -> MultiplexedConnection:
+        """La conexión con menos transacciones en vuelo; abre otra si todas están ocupadas."""
+        self.prune()
+        best = min(self._conns, key=lambda conn: conn.in_flight, default=None)
+        if best is not None and (best.in_flight == 0 or len(self._conns) >= self.connections):
+            return best
+        async with self._connect_lock:
+            if len(self._conns) >= self.connections:
+                return min(self._conns, key=lambda conn: conn.in_flight)
+            started = time.perf_counter()
+            reader, writer = await asyncio.wait_for(
+                asyncio.open_connection(*self.address), timeout=self.connect_timeout
+            )
+            _observe(self.timings, service, "connect", started)
+            conn = MultiplexedConnection(reader, writer, self.timings)
+            self._conns.append(conn)
+            return conn
+
+    async def request(self, service: str, data, timeout: float, meta: dict = None):
+        """Envía una transacción y retorna la respuesta (Message). El timeout incluye la espera por un cupo."""
+        return await asyncio.wait_for(self._request(service, data, meta), timeout=timeout)
+
+    async def _request(self, service: str, data, meta: dict):
+        started = time.perf_counter()
+        async with self._slots:
+            _observe(self.timings, service, "pool", started)
+            conn = await self._connection(service)
+            return await conn.request(service, data, meta)
+
+    def prune(self):
+        """Descarta las conexiones que el bus cerró; sus transacciones ya fallaron."""
+        self._conns = [conn for conn in self._conns if conn.is_healthy()]
+
+    async def run_health_checks(self, interval: float = 10.0):
+        while True:
+            await asyncio.sleep(interval)
+            self.prune()
+
+    def stats(self) -> dict:
+        return {
+            "connections": len(self._conns),
+            "in_flight": sum(conn.in_flight for conn in self._conns),
+            "max_in_flight": self.max_in_flight,
+        }
+
+    async def close(self):
+        while self._conns:
+            self._conns.pop().close()
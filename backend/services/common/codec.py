@@ -0,0 +1,102 @@
+"""
+Codecs de DATOS negociados por trama.
+
+- json:    JSON en UTF-8, con orjson si está instalado (stdlib json si no).
+           Es el formato por defecto y el único que entiende un cliente
+           que no envía meta.
+- msgpack: binario; los bytes (PDF, CSV) viajan tal cual en vez de base64.
+- raw:     DATOS es el archivo mismo (un handler retorna Raw). El meta lleva
+           el tipo de contenido (mt), el nombre de archivo (fn) y, si el
+           archivo sigue en otra respuesta, el cursor para pedirla (next).
+
+El cliente anuncia en el meta de la transacción los codecs que acepta
+(accept=msgpack,json) y el servicio marca en la respuesta el que usó
+(ct=msgpack). Una respuesta sin ct es JSON.
+"""
+
+import base64
+import json
+from datetime import date, datetime
+from decimal import Decimal
+from typing import NamedTuple
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+JSON = "json"
+MSGPACK = "msgpack"
+RAW = "raw"
+AVAILABLE = (MSGPACK, JSON) if msgpack else (JSON,)
+MEDIA_TYPES = {JSON: "application/json", MSGPACK: "application/msgpack"}
+
+
+class Raw(NamedTuple):
+    """Respuesta de bytes sin codec (un archivo o un trozo de él)."""
+    data: bytes
+    media_type: str
+    filename: str = None
+    next_cursor: str = None
+
+    def meta(self) -> dict:
+        meta = {"ct": RAW, "mt": self.media_type}
+        if self.filename:
+            meta["fn"] = self.filename
+        if self.next_cursor:
+            meta["next"] = self.next_cursor
+        return meta
+
+
+def _json_default(value):
+    """Tipos que JSON no representa: bytes en base64 (como antes), Decimal como número."""
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return base64.b64encode(value).decode('ascii')
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    raise TypeError(f"Tipo no serializable: {type(value).__name__}")
+
+
+def _msgpack_default(value):
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    if isinstance(value, memoryview):
+        return bytes(value)
+    raise TypeError(f"Tipo no serializable: {type(value).__name__}")
+
+
+def dumps(obj, ct: str = JSON) -> bytes:
+    if ct == MSGPACK:
+        return msgpack.packb(obj, use_bin_type=True, default=_msgpack_default)
+    if orjson:
+        return orjson.dumps(obj, default=_json_default)
+    return json.dumps(obj, default=_json_default, ensure_ascii=False).encode('utf-8')
+
+
+def loads(data, ct: str = JSON):
+    if ct == MSGPACK:
+        return msgpack.unpackb(data, raw=False)
+    if orjson:
+        return orjson.loads(data)
+    return json.loads(bytes(data) if isinstance(data, memoryview) else data)
+
+
+def accept_header() -> str:
+    """Valor de accept que un cliente envía con los codecs que puede decodificar."""
+    return ",".join(AVAILABLE)
+
+
+def choose(accept: str, preferred: str) -> str:
+    """Codec de la respuesta: el preferido por la operación si el cliente lo acepta, si no JSON."""
+    if preferred != JSON and preferred in AVAILABLE and accept and preferred in accept.split(","):
+        return preferred
+    return JSON
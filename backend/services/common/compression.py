@@ -0,0 +1,78 @@
+"""
+Compresión opcional de DATOS en las tramas del bus.
+
+Un receptor anuncia en el meta los algoritmos que sabe descomprimir
+(az=zstd,zlib). Si el mensaje supera COMPRESS_MIN_BYTES, el emisor lo
+comprime con el primero que ambos soportan y lo marca con z=<algoritmo>.
+Los lectores de protocol.py descomprimen de forma transparente, así que
+el resto del código ve siempre los datos originales.
+
+zlib es de la biblioteca estándar; zstd requiere el paquete zstandard y
+solo se ofrece si está instalado.
+"""
+
+import os
+import zlib
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+ZLIB = "zlib"
+ZSTD = "zstd"
+AVAILABLE = (ZSTD, ZLIB) if zstandard else (ZLIB,)
+COMPRESS_MIN_BYTES = int(os.getenv("COMPRESS_MIN_BYTES", "4096"))
+ZLIB_LEVEL = int(os.getenv("COMPRESS_ZLIB_LEVEL", "6"))
+ZSTD_LEVEL = int(os.getenv("COMPRESS_ZSTD_LEVEL", "3"))
+
+
+def accept_header() -> str:
+    """Valor de az con los algoritmos que este proceso puede descomprimir."""
+    return ",".join(AVAILABLE)
+
+
+def choose(accept: str):
+    """Primer algoritmo propio (en orden de preferencia) que el receptor acepta, o None."""
+    if not accept:
+        return None
+    accepted = accept.split(",")
+    for algorithm in AVAILABLE:
+        if algorithm in accepted:
+            return algorithm
+    return None
+
+
+def compress(data, algorithm: str) -> bytes:
+    if algorithm == ZSTD:
+        # ZstdCompressor no es thread-safe: uno por llamada
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+    return zlib.compress(data, ZLIB_LEVEL)
+
+
+def decompress(data, algorithm: str) -> bytes:
+    if algorithm == ZSTD:
+        if zstandard is None:
+            raise ValueError("Mensaje comprimido con zstd, pero zstandard no está instalado")
+        return zstandard.ZstdDecompressor().decompress(data, max_output_size=1 << 30)
+    if algorithm == ZLIB:
+        return zlib.decompress(data)
+    raise ValueError(f"Compresión no soportada: {algorithm}")
+
+
+def maybe_compress(data: bytes, accept: str, meta: dict) -> bytes:
+    """
+    Comprime data si supera el umbral y el receptor acepta algún algoritmo.
+    Agrega z=<algoritmo> a meta cuando comprime. Si la compresión no reduce
+    el tamaño, envía los datos originales.
+    """
+    if len(data) < COMPRESS_MIN_BYTES:
+        return data
+    algorithm = choose(accept)
+    if algorithm is None:
+        return data
+    compressed = compress(data, algorithm)
+    if len(compressed) >= len(data):
+        return data
+    meta["z"] = algorithm
+    return compressed
@@ -0,0 +1,64 @@
+"""
+Plazo absoluto de una transacción (dl en el bloque meta).
+
+Quien origina la transacción (gateway, cliente_completo) agrega
+dl=<milisegundos desde epoch> con el momento en que dejará de esperar la
+respuesta. El bus y el runtime descartan la transacción si el plazo ya
+venció, y el registro usa el tiempo restante como timeout de las
+sentencias SQL. Se asume que los relojes están sincronizados (NTP).
+
+El módulo no importa sqlalchemy: lo usan también el bus y el gateway.
+"""
+
+import time
+
+DEADLINE_KEY = "dl"
+EXPIRED_ERROR = "deadline exceeded"
+
+
+def stamp(meta: dict, timeout: float) -> dict:
+    """Copia de meta con el plazo timeout segundos desde ahora."""
+    return dict(meta, **{DEADLINE_KEY: str(int((time.time() + timeout) * 1000))})
+
+
+def remaining_ms(meta: dict):
+    """Milisegundos que quedan hasta el plazo (negativo si venció), o None si no hay plazo."""
+    value = (meta or {}).get(DEADLINE_KEY)
+    if not value:
+        return None
+    try:
+        return int(value) - time.time() * 1000
+    except ValueError:
+        return None
+
+
+def expired(meta: dict) -> bool:
+    remaining = remaining_ms(meta)
+    return remaining is not None and remaining <= 0
+
+
+def set_statement_timeout(connection, milliseconds: float) -> bool:
+    """
+    Limita la duración de las sentencias en la conexión, que debe ser la
+    misma hasta reset_statement_timeout (la sesión se fija a ella). En
+    MySQL aplica a los SELECT (max_execution_time); en PostgreSQL, a toda
+    la transacción en curso (SET LOCAL). Retorna True si hay que
+    restablecerlo al terminar.
+    """
+    dialect = connection.dialect.name
+    ms = max(int(milliseconds), 1)
+    if dialect == "mysql":
+        connection.exec_driver_sql(f"SET SESSION max_execution_time = {ms}")
+        return True
+    if dialect == "postgresql":
+        connection.exec_driver_sql(f"SET LOCAL statement_timeout = {ms}")
+    return False
+
+
+def reset_statement_timeout(connection):
+    """Vuelve al valor por defecto antes de devolver la conexión al pool."""
+    try:
+        connection.exec_driver_sql("SET SESSION max_execution_time = 0")
+    except Exception:
+        # La conexión quedó inválida; el pool la descarta al cerrar la sesión
+        pass
@@ -0,0 +1,102 @@
+"""
+Eventos para los usuarios (notificaciones, posición en listas de espera,
+estado de solicitudes), enviados por el gateway con server-sent events.
+
+En los servicios, un handler llama a publish() después de confirmar el
+cambio. El registro junta los eventos de la transacción y, solo si la
+operación respondió OK, los agrega a la respuesta en el meta (ev=<JSON>);
+así un batch que se revierte no publica nada. No hace falta otra conexión
+al bus: los eventos viajan con la respuesta hasta el gateway.
+
+En el gateway, EventHub reparte cada evento a las conexiones abiertas de
+su usuario (GET /events). Solo se ven los eventos de las transacciones
+que pasan por ese gateway.
+
+El módulo no importa sqlalchemy: lo usa también el gateway.
+"""
+
+import asyncio
+import json
+import threading
+from collections import defaultdict
+
+EVENTS_KEY = "ev"
+NOTIFICATION = "notificacion"
+WAITLIST = "lista_espera"
+SOLICITUD = "solicitud"
+
+_pending = threading.local()
+
+
+def publish(usuario_id, event_type: str, data: dict):
+    """Registra un evento para el usuario; se envía si la operación en curso termina OK."""
+    events = getattr(_pending, "events", None)
+    if events is not None and usuario_id is not None:
+        events.append({"usuario_id": usuario_id, "tipo": event_type, "data": data})
+
+
+def begin():
+    """Empieza a juntar los eventos de una transacción (en el thread actual)."""
+    _pending.events = []
+
+
+def take() -> list:
+    """Eventos juntados desde begin(); deja de juntar."""
+    events = getattr(_pending, "events", None) or []
+    _pending.events = None
+    return events
+
+
+def encode(events: list) -> str:
+    return json.dumps(events, separators=(",", ":"), default=str)
+
+
+def decode(text: str) -> list:
+    try:
+        events = json.loads(text)
+    except ValueError:
+        return []
+    return events if isinstance(events, list) else []
+
+
+class EventHub:
+    def __init__(self, queue_size: int = 100):
+        """queue_size: eventos pendientes por conexión; si un cliente no los lee se descartan los más antiguos."""
+        self.queue_size = queue_size
+        self.subscribers = defaultdict(set)
+        self.published = 0
+        self.delivered = 0
+        self.dropped = 0
+
+    def subscribe(self, usuario_id) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        self.subscribers[str(usuario_id)].add(queue)
+        return queue
+
+    def unsubscribe(self, usuario_id, queue: asyncio.Queue):
+        queues = self.subscribers.get(str(usuario_id))
+        if queues is not None:
+            queues.discard(queue)
+            if not queues:
+                del self.subscribers[str(usuario_id)]
+
+    def publish(self, events: list):
+        for event in events:
+            if not isinstance(event, dict):
+                continue
+            self.published += 1
+            for queue in self.subscribers.get(str(event.get("usuario_id")), ()):
+                if queue.full():
+                    queue.get_nowait()
+                    self.dropped += 1
+                queue.put_nowait(event)
+                self.delivered += 1
+
+    def stats(self) -> dict:
+        return {
+            "users": len(self.subscribers),
+            "connections": sum(len(queues) for queues in self.subscribers.values()),
+            "published": self.published,
+            "delivered": self.delivered,
+            "dropped": self.dropped,
+        }
@@ -0,0 +1,165 @@
+"""
+Logger estructurado compartido por los servicios y el gateway.
+
+Reemplaza los print() que mostraban cada trama completa. Cada línea lleva
+un mensaje corto y campos clave=valor; los payloads solo se formatean si
+el debug está activo para ese servicio u operación.
+
+Variables de entorno:
+
+- LOG_LEVEL:        DEBUG, INFO (default), WARNING o ERROR.
+- LOG_DEBUG:        lista separada por comas de servicios u operaciones con
+                    debug activo aunque LOG_LEVEL sea mayor, por ejemplo
+                    "prart" o "prart.get_all_items,gateway.gerep".
+- LOG_SAMPLE_RATE:  fracción (0..1) de transacciones exitosas que se
+                    registran en INFO. Los errores se registran siempre.
+- LOG_PAYLOAD_MAX:  caracteres de payload que se muestran en DEBUG.
+- LOG_FORMAT:       "text" (default) o "json" (una línea JSON por evento).
+
+Uso:
+
+    log = get_logger("prart")
+    log.info("Servicio listo", workers=4)
+    if log.debug_enabled(operation):
+        log.debug("Transacción recibida", op=operation, data=truncate(data))
+"""
+
+import json
+import logging
+import os
+import random
+import sys
+import time
+
+LEVELS = {"DEBUG": logging.DEBUG, "INFO": logging.INFO, "WARNING": logging.WARNING, "ERROR": logging.ERROR}
+LOG_LEVEL = LEVELS.get(os.getenv("LOG_LEVEL", "INFO").upper(), logging.INFO)
+LOG_DEBUG = frozenset(t.strip().lower() for t in os.getenv("LOG_DEBUG", "").split(",") if t.strip())
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", "1"))
+LOG_PAYLOAD_MAX = int(os.getenv("LOG_PAYLOAD_MAX", "200"))
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text").lower()
+
+_loggers = {}
+
+
+def truncate(value, limit: int = LOG_PAYLOAD_MAX) -> str:
+    """repr() acotado: corta antes de formatear para no recorrer el payload completo."""
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        head = repr(bytes(value[:limit]))
+    else:
+        head = repr(str(value)[:limit])
+    if len(value) > limit:
+        return f"{head}... (+{len(value) - limit})"
+    return head
+
+
+def sampled() -> bool:
+    """Decide si un evento de alto volumen se registra según LOG_SAMPLE_RATE."""
+    return LOG_SAMPLE_RATE >= 1 or random.random() < LOG_SAMPLE_RATE
+
+
+class _TextFormatter(logging.Formatter):
+    def format(self, record):
+        tag = record.service.upper()
+        if record.worker:
+            tag = f"{tag}#{record.worker}"
+        level = "" if record.levelno == logging.INFO else f"{record.levelname} "
+        fields = "".join(f" {key}={value}" for key, value in record.fields.items())
+        line = f"[{tag}] {level}{record.getMessage()}{fields}"
+        if record.exc_info:
+            line = f"{line}\n{self.formatException(record.exc_info)}"
+        return line
+
+
+class _JsonFormatter(logging.Formatter):
+    def format(self, record):
+        event = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "service": record.service,
+            "msg": record.getMessage(),
+        }
+        if record.worker:
+            event["worker"] = record.worker
+        event.update(record.fields)
+        if record.exc_info:
+            event["exc"] = self.formatException(record.exc_info)
+        return json.dumps(event, default=str, ensure_ascii=False)
+
+
+def _configure() -> logging.Logger:
+    base = logging.getLogger("soa")
+    if not base.handlers:
+        handler = logging.StreamHandler(sys.stdout)
+        handler.setFormatter(_JsonFormatter() if LOG_FORMAT == "json" else _TextFormatter())
+        base.addHandler(handler)
+        # El filtrado por nivel lo hace ServiceLogger (depende del servicio/operación)
+        base.setLevel(logging.DEBUG)
+        base.propagate = False
+    return base
+
+
+class ServiceLogger:
+    def __init__(self, service: str, worker: int = 0):
+        self.service = service
+        self.worker = worker
+        self._logger = _configure().getChild(service)
+        self._debug_all = LOG_LEVEL <= logging.DEBUG or service.lower() in LOG_DEBUG
+        self._debug_ops = {}
+
+    def for_worker(self, worker: int) -> "ServiceLogger":
+        """Logger del mismo servicio que etiqueta sus líneas con el número de worker."""
+        return ServiceLogger(self.service, worker) if worker else self
+
+    def debug_enabled(self, op: str = None) -> bool:
+        """
+        True si hay que registrar el detalle de esta operación. op puede
+        tener varios niveles ("gerep.get_historial"); basta con que esté
+        activo cualquiera de sus prefijos.
+        """
+        if self._debug_all:
+            return True
+        if not LOG_DEBUG or not op:
+            return False
+        enabled = self._debug_ops.get(op)
+        if enabled is None:
+            key = f"{self.service}.{op}".lower()
+            enabled = any(key == target or key.startswith(target + ".") for target in LOG_DEBUG)
+            self._debug_ops[op] = enabled
+        return enabled
+
+    def _log(self, level: int, msg: str, fields: dict, exc_info=False):
+        self._logger.log(level, msg, exc_info=exc_info,
+                         extra={"service": self.service, "worker": self.worker, "fields": fields})
+
+    def debug(self, msg: str, op: str = None, **fields):
+        if self.debug_enabled(op):
+            if op:
+                fields = {"op": op, **fields}
+            self._log(logging.DEBUG, msg, fields)
+
+    def info(self, msg: str, **fields):
+        if LOG_LEVEL <= logging.INFO:
+            self._log(logging.INFO, msg, fields)
+
+    def warning(self, msg: str, **fields):
+        if LOG_LEVEL <= logging.WARNING:
+            self._log(logging.WARNING, msg, fields)
+
+    def error(self, msg: str, **fields):
+        self._log(logging.ERROR, msg, fields)
+
+    def exception(self, msg: str, **fields):
+        """Error con el traceback de la excepción en curso."""
+        self._log(logging.ERROR, msg, fields, exc_info=True)
+
+
+def get_logger(service: str) -> ServiceLogger:
+    logger = _loggers.get(service)
+    if logger is None:
+        logger = _loggers[service] = ServiceLogger(service)
+    return logger
+
+
+def elapsed_ms(start: float) -> float:
+    """Milisegundos desde start (time.perf_counter()), redondeados para los logs."""
+    return round((time.perf_counter() - start) * 1000, 2)
@@ -0,0 +1,116 @@
+"""
+Métricas en el formato de texto de Prometheus (GET /metrics del gateway).
+
+Counter e Histogram llevan sus valores por combinación de etiquetas. Lo
+que ya cuentan otros componentes (pool del bus, caché, breakers) no se
+duplica: se convierte en muestras con gauge() al armar la respuesta, a
+partir de sus stats().
+
+Las etiquetas service/operation vienen de los clientes HTTP: para que un
+cliente no pueda crear series sin fin, cada métrica acepta hasta
+max_series combinaciones y agrupa las siguientes bajo OTHER.
+"""
+
+from bisect import bisect_left
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+OTHER = "_other"
+
+# Límites superiores (segundos) de los buckets de latencia; el último cubre BUS_TIMEOUT
+LATENCY_BUCKETS_S = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 15)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + "}"
+
+
+def _number(value) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def _header(name: str, help_text: str, kind: str) -> list:
+    return [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+
+
+class _Family:
+    def __init__(self, name: str, help_text: str, labels=(), max_series: int = 1000):
+        self.name = name
+        self.help_text = help_text
+        self.labels = tuple(labels)
+        self.max_series = max_series
+        self.series = {}
+
+    def _key(self, label_values) -> tuple:
+        key = tuple(str(value) for value in label_values)
+        if key not in self.series and len(self.series) >= self.max_series:
+            return (OTHER,) * len(self.labels)
+        return key
+
+
+class Counter(_Family):
+    def inc(self, *label_values, amount: float = 1):
+        key = self._key(label_values)
+        self.series[key] = self.series.get(key, 0) + amount
+
+    def render(self) -> list:
+        lines = _header(self.name, self.help_text, "counter")
+        for key, value in sorted(self.series.items()):
+            lines.append(f"{self.name}{_labels(self.labels, key)} {_number(value)}")
+        return lines
+
+
+class Histogram(_Family):
+    def __init__(self, name: str, help_text: str, labels=(), buckets=LATENCY_BUCKETS_S, max_series: int = 1000):
+        super().__init__(name, help_text, labels, max_series)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, *label_values):
+        key = self._key(label_values)
+        series = self.series.get(key)
+        if series is None:
+            # [conteo por bucket (el último es +Inf), suma, cantidad]
+            series = self.series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    def render(self) -> list:
+        lines = _header(self.name, self.help_text, "histogram")
+        names = self.labels + ("le",)
+        for key, (counts, total, count) in sorted(self.series.items()):
+            cumulative = 0
+            for limit, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                lines.append(f"{self.name}_bucket{_labels(names, key + (_number(float(limit)),))} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labels, key)} {_number(round(total, 6))}")
+            lines.append(f"{self.name}_count{_labels(self.labels, key)} {count}")
+        return lines
+
+
+def gauge(name: str, help_text: str, samples, labels=(), kind: str = "gauge") -> list:
+    """
+    Líneas de una métrica calculada al momento (por ejemplo desde stats()).
+    samples: valor único, o iterable de (valores de etiquetas, valor).
+    kind:    "counter" para totales que lleva otro componente.
+    """
+    lines = _header(name, help_text, kind)
+    if not labels:
+        samples = [((), samples)]
+    for label_values, value in samples:
+        if value is None:
+            continue
+        lines.append(f"{name}{_labels(labels, label_values)} {_number(float(value))}")
+    return lines
+
+
+def render(*blocks) -> str:
+    """Respuesta completa: las líneas de cada métrica, en orden."""
+    return "\n".join(line for block in blocks for line in block) + "\n"
@@ -0,0 +1,123 @@
+"""
+Paginación por cursor para las operaciones de listado.
+
+Si el payload trae page_size o cursor, la operación responde una página y
+un cursor opaco en next_cursor (None en la última página). El resto se
+pide con la operación next_page {"cursor": "..."} del mismo servicio.
+Sin esos campos la operación responde el listado completo, como antes.
+
+El cursor no guarda estado en el servicio: contiene la operación, los
+filtros y la clave de la última fila entregada (paginación keyset). Así
+next_page funciona aunque la atienda otro worker u otro proveedor del bus.
+En ambos modos las filas se leen de la base en lotes con yield_per, de
+modo que el servicio nunca materializa la tabla completa de una vez.
+"""
+
+import base64
+import json
+import os
+from datetime import date, datetime
+
+DEFAULT_PAGE_SIZE = int(os.getenv("PAGE_SIZE", "200"))
+MAX_PAGE_SIZE = int(os.getenv("PAGE_MAX_SIZE", "1000"))
+FETCH_BATCH = int(os.getenv("PAGE_FETCH_BATCH", "100"))
+CONTROL_FIELDS = ("cursor", "page_size")
+
+
+class CursorError(ValueError):
+    pass
+
+
+def wants_page(payload: dict) -> bool:
+    return any(field in payload for field in CONTROL_FIELDS)
+
+
+def _dump_value(value):
+    if isinstance(value, datetime):
+        return {"dt": value.isoformat()}
+    if isinstance(value, date):
+        return {"d": value.isoformat()}
+    return value
+
+
+def _load_value(value):
+    if isinstance(value, dict):
+        if "dt" in value:
+            return datetime.fromisoformat(value["dt"])
+        if "d" in value:
+            return date.fromisoformat(value["d"])
+    return value
+
+
+def encode_cursor(operation: str, filters: dict, key_values, page_size: int) -> str:
+    state = {"op": operation, "f": filters, "k": [_dump_value(v) for v in key_values], "n": page_size}
+    raw = json.dumps(state, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+
+def decode_cursor(cursor) -> dict:
+    """Retorna {"op", "f", "k", "n"}; CursorError si el cursor no es válido."""
+    try:
+        state = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        state["k"] = [_load_value(v) for v in state["k"]]
+        if not isinstance(state["op"], str) or not isinstance(state["f"], dict):
+            raise ValueError
+        return state
+    except (AttributeError, KeyError, TypeError, ValueError):
+        raise CursorError("Cursor inválido")
+
+
+def _after(keys, values, descending: bool = False):
+    """Condición keyset: (k1, k2, ...) > (v1, v2, ...) sin depender de row values del motor."""
+    key, value = keys[0], values[0]
+    beyond = key < value if descending else key > value
+    if len(keys) == 1:
+        return beyond
+    # | y & de las columnas equivalen a or_/and_; así el módulo no importa sqlalchemy
+    return beyond | ((key == value) & _after(keys[1:], values[1:], descending))
+
+
+def _page_size(value) -> int:
+    try:
+        size = int(value) if value is not None else DEFAULT_PAGE_SIZE
+    except (TypeError, ValueError):
+        raise CursorError("page_size inválido")
+    return max(1, min(size, MAX_PAGE_SIZE))
+
+
+def paginate(query, keys, payload: dict, operation: str, serialize, descending: bool = False):
+    """
+    Ejecuta query ordenada por keys (columnas únicas en conjunto; la última
+    suele ser el id) y retorna (filas serializadas, next_cursor).
+
+    keys:       columnas del orden, por ejemplo (Item.nombre, Item.id).
+    operation:  nombre de la operación, queda guardado en el cursor.
+    serialize:  función fila -> dict.
+    descending: orden descendente en todas las columnas.
+    """
+    query = query.order_by(*(key.desc() for key in keys) if descending else keys)
+    if not wants_page(payload):
+        return [serialize(row) for row in query.yield_per(FETCH_BATCH)], None
+
+    filters = {field: value for field, value in payload.items() if field not in CONTROL_FIELDS}
+    page_size = _page_size(payload.get("page_size"))
+    if payload.get("cursor"):
+        state = decode_cursor(payload["cursor"])
+        if state["op"] != operation or len(state["k"]) != len(keys):
+            raise CursorError("Cursor inválido")
+        filters = state["f"]
+        page_size = _page_size(payload.get("page_size", state["n"]))
+        query = query.filter(_after(keys, state["k"], descending))
+
+    # Se pide una fila extra solo para saber si hay otra página
+    rows = []
+    last = None
+    next_cursor = None
+    for row in query.limit(page_size + 1).yield_per(FETCH_BATCH):
+        if len(rows) == page_size:
+            key_values = [getattr(last, key.key) for key in keys]
+            next_cursor = encode_cursor(operation, filters, key_values, page_size)
+            break
+        rows.append(serialize(row))
+        last = row
+    return rows, next_cursor
@@ -0,0 +1,393 @@
+"""
+Protocolo de tramas del Bus SOA.
+
+Transacción de entrada:  NNNNNSSSSSDATOS
+Transacción de salida:   NNNNNSSSSSSTDATOS
+
+- NNNNN: longitud (5 dígitos) de los bytes que siguen.
+- SSSSS: nombre del servicio (5 caracteres, rellenado con espacios).
+- ST:    estado OK / NK (solo en respuestas).
+
+Extensiones (opcionales, compatibles con el formato original):
+
+- Bloque meta: justo después de SSSSS (o SSSSSST) puede ir
+  "@clave=valor&clave=valor|". Ninguna operación ni JSON empieza con "@",
+  así que un receptor distingue el bloque sin ambigüedad. El soabus
+  externo antepone su propio status a la respuesta del servicio
+  (SSSSSOKOK@...|DATOS): un segundo status seguido de "@" se reconoce
+  como el del servicio y el bloque meta se lee después de él.
+- Tramas de continuación: un mensaje de más de 99.999 bytes se divide en
+  varias tramas NNNNN consecutivas con el mismo prefijo. Todas llevan
+  more=1 salvo la última (more=0); la primera informa además total=<bytes>
+  para que el receptor pueda reservar el buffer de una vez.
+- Compresión: un mensaje puede llevar z=zlib|zstd; DATOS (después del
+  bloque meta) va comprimido. Ver common/compression.py.
+- Correlación: una transacción puede llevar cid=<id> en el bloque meta.
+  El servicio lo devuelve en la respuesta y puede responderla apenas
+  termine, sin esperar a las anteriores; así una sola conexión mantiene
+  varias transacciones en vuelo. Sin cid se conserva el orden de llegada.
+
+Los lectores evitan concatenar bytes (data += chunk): FrameReader lee con
+recv_into sobre un buffer preasignado, y los mensajes multi-trama se
+copian una sola vez a un bytearray del tamaño anunciado en total.
+"""
+
+import asyncio
+import json
+import socket
+from typing import NamedTuple
+from urllib.parse import parse_qsl, urlencode
+
+from common import compression
+
+HEADER_LEN = 5
+SERVICE_LEN = 5
+STATUS_LEN = 2
+STATUSES = (b'OK', b'NK')
+MAX_FRAME_LEN = 10 ** HEADER_LEN - 1
+ENCODING = 'utf-8'
+META_START = b'@'
+META_END = b'|'
+
+
+class Message(NamedTuple):
+    """
+    Mensaje completo (ya reensamblado si venía en varias tramas).
+    data puede ser bytes o una memoryview sobre el buffer del lector.
+    """
+    service: str
+    status: str   # "" en transacciones de entrada
+    meta: dict
+    data: bytes
+
+    def text(self) -> str:
+        return str(self.data, ENCODING)
+
+    def json(self):
+        return json.loads(self.text())
+
+
+def pad_service(service: str) -> str:
+    """Normaliza el nombre del servicio a exactamente 5 caracteres."""
+    return service.ljust(SERVICE_LEN)[:SERVICE_LEN]
+
+
+def service_name(service: str) -> str:
+    """Nombre con el que el bus identifica al servicio ("regist" y "regis" son el mismo)."""
+    return pad_service(service).strip()
+
+
+def encode_frame(body: bytes) -> bytes:
+    """Antepone el largo NNNNN (en bytes) al cuerpo de la trama."""
+    if len(body) > MAX_FRAME_LEN:
+        raise ValueError(f"Trama de {len(body)} bytes excede el máximo de {MAX_FRAME_LEN}")
+    return f"{len(body):0{HEADER_LEN}d}".encode('ascii') + body
+
+
+def parse_length(header) -> int:
+    """Convierte los 5 dígitos ASCII del encabezado sin pasar por str."""
+    length = 0
+    for digit in header:
+        if not 48 <= digit <= 57:
+            raise ValueError(f"Encabezado de largo inválido: {bytes(header)!r}")
+        length = length * 10 + digit - 48
+    return length
+
+
+def encode_meta(meta: dict) -> bytes:
+    if not meta:
+        return b''
+    return META_START + urlencode(meta).encode('ascii') + META_END
+
+
+def parse_meta(data: bytes):
+    """Separa el bloque meta (si existe) del resto de los datos."""
+    if data[:1] != META_START:
+        return {}, data
+    # Buscar el cierre en ventanas crecientes: no copiar el cuerpo entero
+    window = 256
+    while True:
+        end = bytes(data[:window]).find(META_END)
+        if end >= 0 or window >= len(data):
+            break
+        window *= 16
+    if end < 0:
+        return {}, data
+    return dict(parse_qsl(str(data[1:end], 'ascii'))), data[end + 1:]
+
+
+def encode_message(prefix: bytes, data: bytes, meta: dict = None) -> bytes:
+    """
+    Arma las tramas de un mensaje. Si no cabe en una sola trama de 5 dígitos
+    lo divide en tramas de continuación. Las tramas se retornan concatenadas
+    para que se escriban juntas y no se intercalen con otros mensajes.
+    """
+    meta = dict(meta or {})
+    head = encode_meta(meta)
+    if not head and data[:1] == META_START:
+        # Datos que empiezan con "@" necesitan un bloque meta vacío explícito
+        head = META_START + META_END
+    # El soabus antepone su status a cada trama de respuesta: se deja espacio para él
+    limit = MAX_FRAME_LEN - STATUS_LEN
+    if len(prefix) + len(head) + len(data) <= limit:
+        return encode_frame(prefix + head + data)
+
+    frames = []
+    offset = 0
+    part_meta = dict(meta, total=len(data), more=1)
+    while offset < len(data):
+        head = encode_meta(part_meta)
+        room = limit - len(prefix) - len(head)
+        if offset + room >= len(data):
+            part_meta["more"] = 0
+            head = encode_meta(part_meta)
+        chunk = data[offset:offset + room]
+        offset += len(chunk)
+        frames.append(encode_frame(prefix + head + chunk))
+        part_meta = {"more": 1}
+    return b''.join(frames)
+
+
+def format_request(service: str, data, meta: dict = None) -> bytes:
+    """Arma una transacción de entrada: NNNNNSSSSSDATOS."""
+    if isinstance(data, str):
+        data = data.encode(ENCODING)
+    return encode_message(pad_service(service).encode(ENCODING), data, meta)
+
+
+def format_response(service: str, status: str, data, meta: dict = None) -> bytes:
+    """Arma una transacción de salida: NNNNNSSSSSSTDATOS."""
+    if isinstance(data, str):
+        data = data.encode(ENCODING)
+    return encode_message(f"{pad_service(service)}{status}".encode(ENCODING), data, meta)
+
+
+def format_sinit(service: str) -> bytes:
+    """Arma el mensaje de registro de un servicio: 00010sinitSSSSS."""
+    return format_request("sinit", pad_service(service))
+
+
+def _service_status(body, prefix_len: int):
+    """
+    Status que puso el servicio cuando el bus antepuso otro (OKOK@...|), o
+    None. Solo se reconoce seguido de un bloque meta: sin meta, DATOS podría
+    empezar legítimamente con esas letras.
+    """
+    if prefix_len != SERVICE_LEN + STATUS_LEN:
+        return None
+    inner = bytes(body[prefix_len:prefix_len + STATUS_LEN + 1])
+    if inner[:STATUS_LEN] in STATUSES and inner[STATUS_LEN:] == META_START:
+        return str(inner[:STATUS_LEN], ENCODING)
+    return None
+
+
+def _split_body(body, prefix_len: int):
+    """Meta y DATOS de una trama, después del prefijo (y del status duplicado, si lo hay)."""
+    if _service_status(body, prefix_len) is not None:
+        prefix_len += STATUS_LEN
+    return parse_meta(body[prefix_len:])
+
+
+def _to_message(body, prefix_len: int):
+    prefix = str(body[:prefix_len], ENCODING)
+    status = _service_status(body, prefix_len) or prefix[SERVICE_LEN:]
+    meta, data = _split_body(body, prefix_len)
+    return prefix[:SERVICE_LEN].strip(), status, meta, data
+
+
+def _is_continued(meta: dict) -> bool:
+    return meta.get("more") == "1"
+
+
+class _Assembler:
+    """Buffer de un mensaje multi-trama, reservado según el total anunciado."""
+
+    def __init__(self, total: int):
+        self.buffer = bytearray(total)
+        self.size = 0
+
+    def add(self, chunk):
+        end = self.size + len(chunk)
+        if end > len(self.buffer):
+            # El emisor no informó total (o informó uno menor): crecer una vez
+            self.buffer.extend(bytes(end - len(self.buffer)))
+        self.buffer[self.size:end] = chunk
+        self.size = end
+
+    def result(self) -> memoryview:
+        return memoryview(self.buffer)[:self.size]
+
+
+def _finish(service: str, status: str, meta: dict, data, decompress: bool) -> Message:
+    if decompress and "z" in meta:
+        data = compression.decompress(data, meta.pop("z"))
+    return Message(service, status, meta, data)
+
+
+def _start_assembly(meta: dict, first_chunk) -> _Assembler:
+    assembler = _Assembler(int(meta.pop("total", 0) or 0))
+    meta.pop("more", None)
+    assembler.add(first_chunk)
+    return assembler
+
+
+async def read_header(reader: asyncio.StreamReader):
+    """
+    Espera el encabezado NNNNN de la próxima trama; None si la conexión se
+    cerró. Permite medir por separado la espera de la respuesta y su lectura
+    (read_message con header=...).
+    """
+    try:
+        return await reader.readexactly(HEADER_LEN)
+    except asyncio.IncompleteReadError:
+        return None
+
+
+async def read_frame(reader: asyncio.StreamReader, header: bytes = None):
+    """
+    Lee una trama completa desde un stream asyncio.
+    header: el NNNNN, si ya se leyó con read_header.
+    Retorna el cuerpo (sin NNNNN) o None si la conexión se cerró.
+    """
+    try:
+        if header is None:
+            header = await reader.readexactly(HEADER_LEN)
+        return await reader.readexactly(parse_length(header))
+    except asyncio.IncompleteReadError:
+        return None
+
+
+async def read_message(reader: asyncio.StreamReader, prefix_len: int, decompress: bool = True,
+                       header: bytes = None):
+    """
+    Lee un mensaje completo, reensamblando tramas de continuación.
+    prefix_len: 5 para transacciones de entrada, 7 para respuestas.
+    decompress: False para conservar DATOS comprimido (y z en meta), como
+                hace el bus al reenviar.
+    header:     el NNNNN de la primera trama, si ya se leyó con read_header.
+    Retorna None si la conexión se cerró antes de empezar el mensaje.
+    """
+    body = await read_frame(reader, header)
+    if body is None:
+        return None
+    service, status, meta, data = _to_message(memoryview(body), prefix_len)
+    if not _is_continued(meta):
+        return _finish(service, status, meta, data, decompress)
+    assembler = _start_assembly(meta, data)
+    while True:
+        body = await read_frame(reader)
+        if body is None:
+            raise ConnectionResetError("Conexión cerrada en medio de un mensaje multi-trama")
+        part_meta, chunk = _split_body(memoryview(body), prefix_len)
+        assembler.add(chunk)
+        if not _is_continued(part_meta):
+            break
+    return _finish(service, status, meta, assembler.result(), decompress)
+
+
+async def read_request(reader: asyncio.StreamReader, decompress: bool = True):
+    return await read_message(reader, SERVICE_LEN, decompress)
+
+
+async def read_response(reader: asyncio.StreamReader, decompress: bool = True, header: bytes = None):
+    return await read_message(reader, SERVICE_LEN + STATUS_LEN, decompress, header)
+
+
+async def write_frame(writer: asyncio.StreamWriter, frame: bytes):
+    """Escribe una trama ya formateada y espera a que se vacíe el buffer."""
+    writer.write(frame)
+    await writer.drain()
+
+
+class ResponseWriter:
+    """
+    Escribe las respuestas de una conexión con varias transacciones en vuelo.
+
+    Las transacciones que traen cid se responden apenas terminan, en
+    cualquier orden. Las que no lo traen se responden en el orden en que
+    llegaron, que es lo único que un cliente sin cid puede correlacionar.
+    """
+
+    def __init__(self, writer: asyncio.StreamWriter):
+        self.writer = writer
+        self._lock = asyncio.Lock()
+        self._last_ordered = None
+
+    def submit(self, response, ordered: bool) -> asyncio.Task:
+        """response: corrutina o future que entrega las tramas ya formateadas."""
+        previous = self._last_ordered if ordered else None
+        task = asyncio.ensure_future(self._respond(response, previous))
+        if ordered:
+            self._last_ordered = task
+        return task
+
+    async def _respond(self, response, previous):
+        frame = await response
+        if previous is not None and not previous.done():
+            await asyncio.wait([previous])
+        async with self._lock:
+            await write_frame(self.writer, frame)
+
+
+# --- Versión con sockets bloqueantes (clientes de consola) ---
+
+class FrameReader:
+    """
+    Lector de tramas para sockets bloqueantes sin copias intermedias.
+
+    Cada trama se recibe con recv_into directamente en un buffer reservado
+    una sola vez por lector. Los mensajes de una trama se retornan como
+    memoryview sobre ese buffer, por lo que solo son válidos hasta la
+    siguiente lectura; los multi-trama se copian a un buffer propio.
+    """
+
+    def __init__(self, sock: socket.socket):
+        self.sock = sock
+        self._buffer = bytearray(HEADER_LEN + MAX_FRAME_LEN)
+        self._view = memoryview(self._buffer)
+
+    def _fill(self, view: memoryview) -> bool:
+        """Llena la vista completa; retorna False si el socket se cerró antes."""
+        while view:
+            received = self.sock.recv_into(view)
+            if not received:
+                return False
+            view = view[received:]
+        return True
+
+    def read_frame(self):
+        """Retorna el cuerpo de la siguiente trama (memoryview) o None si se cerró el socket."""
+        header = self._view[:HEADER_LEN]
+        if not self._fill(header):
+            return None
+        body = self._view[HEADER_LEN:HEADER_LEN + parse_length(header)]
+        if not self._fill(body):
+            raise ConnectionResetError("Conexión cerrada en medio de una trama")
+        return body
+
+    def read_message(self, prefix_len: int):
+        """Equivalente bloqueante de read_message()."""
+        body = self.read_frame()
+        if body is None:
+            return None
+        service, status, meta, data = _to_message(body, prefix_len)
+        if not _is_continued(meta):
+            return _finish(service, status, meta, data, True)
+        assembler = _start_assembly(meta, data)
+        while True:
+            body = self.read_frame()
+            if body is None:
+                raise ConnectionResetError("Conexión cerrada en medio de un mensaje multi-trama")
+            part_meta, chunk = _split_body(body, prefix_len)
+            assembler.add(chunk)
+            if not _is_continued(part_meta):
+                break
+        return _finish(service, status, meta, assembler.result(), True)
+
+    def read_response(self):
+        return self.read_message(SERVICE_LEN + STATUS_LEN)
+
+
+def recv_response(sock: socket.socket):
+    """Lee una respuesta completa de un socket bloqueante."""
+    return FrameReader(sock).read_response()
@@ -0,0 +1,152 @@
+"""
+Límites de tasa del gateway (token bucket).
+
+Cada cliente (el token de sesión, o la IP si no envía uno) tiene un bucket
+general y uno por cada regla de operación que use. Un bucket de N/S
+acumula hasta N fichas y recupera N cada S segundos; cada transacción
+gasta una. Sin fichas el gateway responde 429 con Retry-After antes de
+enviar nada al bus.
+
+Las reglas se configuran con texto, separadas por comas:
+
+    regist.login:10/60,gerep.get_historial?formato=pdf:5/60
+
+servicio.operación, opcionalmente con una condición campo=valor sobre el
+payload, y la cuota N/S. El servicio se compara con el nombre que usa el
+bus (protocol.service_name). Si varias reglas aplican se usa la primera con
+condición que coincida, o si no la regla sin condición.
+
+Los buckets viven en un store con un solo método asíncrono take(). El
+gateway usa MemoryBucketStore (en el proceso); con varias instancias del
+gateway se puede reemplazar por uno compartido (por ejemplo Redis con un
+script Lua) que implemente el mismo método.
+"""
+
+import time
+from collections import OrderedDict, defaultdict
+from typing import NamedTuple
+
+from common.protocol import service_name
+
+
+class Quota(NamedTuple):
+    capacity: float
+    rate: float  # fichas por segundo
+
+    @classmethod
+    def parse(cls, text: str):
+        """"N/S" -> N fichas cada S segundos (ráfaga de N)."""
+        count, _, seconds = text.strip().partition("/")
+        capacity, period = float(count), float(seconds or 1)
+        if capacity <= 0 or period <= 0:
+            raise ValueError(f"Cuota inválida: {text}")
+        return cls(capacity, capacity / period)
+
+
+class Rule(NamedTuple):
+    name: str
+    service: str
+    operation: str
+    field: str
+    value: str
+    quota: Quota
+
+    def matches(self, service: str, operation: str, payload: dict) -> bool:
+        if service != self.service or operation != self.operation:
+            return False
+        return self.field is None or str(payload.get(self.field)) == self.value
+
+
+def parse_rules(text: str) -> list:
+    """Reglas de "servicio.operación[?campo=valor]:N/S, ..."; ValueError si alguna está mal escrita."""
+    rules = []
+    for entry in filter(None, (part.strip() for part in text.split(","))):
+        scope, _, quota = entry.rpartition(":")
+        name, _, condition = scope.partition("?")
+        service, _, operation = name.partition(".")
+        field, _, value = condition.partition("=")
+        if not service or not operation or (condition and not field):
+            raise ValueError(f"Regla de límite inválida: {entry}")
+        # Como lo identifica el bus: regist.login también aplica a "regis"
+        rules.append(Rule(scope, service_name(service), operation, field or None, value, Quota.parse(quota)))
+    return rules
+
+
+class MemoryBucketStore:
+    def __init__(self, max_keys: int = 100000):
+        """max_keys: buckets como máximo; se descartan los menos usados (equivale a darles la ráfaga completa)."""
+        self.max_keys = max_keys
+        self.buckets = OrderedDict()
+
+    async def take(self, key: str, quota: Quota, cost: float = 1) -> float:
+        """Gasta cost fichas del bucket; retorna 0 si alcanzaron o los segundos hasta que alcancen."""
+        now = time.monotonic()
+        cost = min(cost, quota.capacity)
+        tokens, updated = self.buckets.get(key, (quota.capacity, now))
+        tokens = min(quota.capacity, tokens + (now - updated) * quota.rate)
+        wait = 0.0
+        if tokens >= cost:
+            tokens -= cost
+        else:
+            wait = (cost - tokens) / quota.rate
+        self.buckets[key] = (tokens, now)
+        self.buckets.move_to_end(key)
+        while len(self.buckets) > self.max_keys:
+            self.buckets.popitem(last=False)
+        return wait
+
+    def stats(self) -> dict:
+        return {"buckets": len(self.buckets), "max_buckets": self.max_keys}
+
+
+class RateLimiter:
+    def __init__(self, store, client_quota: Quota = None, rules: list = ()):
+        """
+        store:        implementación de take() (MemoryBucketStore u otra compartida).
+        client_quota: cuota general de cada cliente (None: sin límite general).
+        rules:        reglas por operación (parse_rules).
+        """
+        self.store = store
+        self.client_quota = client_quota
+        self.rules = list(rules)
+        self.allowed = 0
+        self.limited = defaultdict(int)
+
+    def rule_for(self, service: str, operation: str, payload: dict):
+        matching = [rule for rule in self.rules if rule.matches(service, operation, payload)]
+        conditional = [rule for rule in matching if rule.field is not None]
+        return (conditional or matching or [None])[0]
+
+    async def check_client(self, client: str, cost: int = 1) -> float:
+        """Cuota general: 0 si el cliente puede enviar cost transacciones, si no los segundos de espera."""
+        if self.client_quota is None:
+            return 0.0
+        wait = await self.store.take(f"client|{client}", self.client_quota, cost)
+        if wait:
+            self.limited["client"] += 1
+        return wait
+
+    async def check_operation(self, client: str, service: str, operation: str, payload: dict) -> float:
+        """Cuota de la regla que aplica a la operación (0 si no hay regla o alcanzó)."""
+        rule = self.rule_for(service, operation, payload)
+        if rule is None:
+            self.allowed += 1
+            return 0.0
+        wait = await self.store.take(f"{rule.name}|{client}", rule.quota)
+        if wait:
+            self.limited[rule.name] += 1
+        else:
+            self.allowed += 1
+        return wait
+
+    def stats(self) -> dict:
+        stats = {
+            "client_quota": f"{self.client_quota.capacity:g}/{self.client_quota.capacity / self.client_quota.rate:g}"
+                            if self.client_quota else None,
+            "rules": [rule.name for rule in self.rules],
+            "allowed": self.allowed,
+            "limited": dict(self.limited),
+        }
+        if hasattr(self.store, "stats"):
+            stats["store"] = self.store.stats()
+        return stats
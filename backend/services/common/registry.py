@@ -0,0 +1,309 @@
+"""
+Registro de operaciones de un servicio.
+
+Reemplaza la cadena if/elif de handle_request. Cada handler declara con un
+decorador su nombre de operación, el esquema de su payload y si es de solo
+lectura:
+
+    registry = OperationRegistry(SERVICE_NAME, SessionLocal, ReadSessionLocal)
+
+    @registry.operation("get_all_items", read_only=True)
+    def obtener_todos_los_items(payload: dict, db: Session):
+        ...
+
+El despacho es una búsqueda en un dict: una operación desconocida se
+rechaza antes de parsear el JSON o abrir una sesión de base de datos. Las
+operaciones de solo lectura reciben una sesión del engine de lectura.
+El registro lleva además, por operación, cantidad de llamadas, errores
+e histograma de latencias, disponibles con la operación interna _stats.
+
+Un handler puede retornar el JSON ya armado (str) o el objeto de respuesta
+(dict/list). En el segundo caso el registro lo serializa con el codec que
+prefiera la operación (codec=MSGPACK) si el cliente lo acepta, o con JSON.
+Un handler que exporta un archivo retorna codec.Raw y los bytes viajan sin
+codec (ver common.codec).
+Las respuestas de operaciones read_only llevan ro=1 en el meta, lo que
+permite al gateway cachearlas (ver common.cache). Las declaradas con
+cacheable=False (login: el payload lleva la contraseña y la respuesta un
+token) llevan además nc=1 y el gateway no las guarda ni las comparte.
+
+Las operaciones de listado declaradas con paginated=True aceptan cursor y
+page_size (ver common.pagination); el registro agrega entonces la operación
+next_page, que continúa el listado indicado en el cursor.
+
+La operación interna batch {"operations": [{"operation": ..., "payload": ...}]}
+ejecuta varias operaciones del servicio en una sola transacción de base de
+datos: si alguna responde NK, se deshace todo.
+
+Si la transacción trae plazo (dl en el meta), el tiempo restante se aplica
+como timeout de las sentencias SQL de la sesión (ver common.deadline).
+
+Los eventos que publique un handler (common.events.publish) se agregan a
+la respuesta en el meta (ev) si la operación responde OK.
+"""
+
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from typing import NamedTuple
+
+from common import codec, deadline, events, pagination
+from common.log import get_logger
+
+# Tipos aceptados en los esquemas (los ids pueden llegar como número o texto)
+ID = (int, str)
+NUMBER = (int, float, str)
+TEXT = str
+FLAG = (bool, int)
+
+# Campos de control de las operaciones paginadas
+PAGING_SCHEMA = {"cursor": TEXT, "page_size": NUMBER}
+
+# Límites superiores (ms) de los buckets del histograma de latencia
+LATENCY_BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+BATCH_MAX_OPERATIONS = int(os.getenv("BATCH_MAX_OPERATIONS", "100"))
+
+
+class Operation(NamedTuple):
+    name: str
+    handler: object
+    schema: dict
+    read_only: bool
+    uses_db: bool
+    codec: str
+    paginated: bool
+    cacheable: bool
+
+
+class OperationStats:
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.total_ms = 0.0
+        self.buckets = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+
+    def record(self, elapsed_ms: float, ok: bool):
+        self.calls += 1
+        if not ok:
+            self.errors += 1
+        self.total_ms += elapsed_ms
+        self.buckets[bisect_left(LATENCY_BUCKETS_MS, elapsed_ms)] += 1
+
+    def snapshot(self) -> dict:
+        histogram = {str(limit): count for limit, count in zip(LATENCY_BUCKETS_MS, self.buckets)}
+        histogram["+Inf"] = self.buckets[-1]
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "avg_ms": round(self.total_ms / self.calls, 3) if self.calls else 0.0,
+            "latency_ms": histogram,
+        }
+
+
+def validate_schema(payload, schema: dict):
+    """Retorna un mensaje de error si algún campo presente no tiene el tipo declarado."""
+    if not isinstance(payload, dict):
+        return "El payload debe ser un objeto JSON"
+    for field, expected in schema.items():
+        value = payload.get(field)
+        if value is not None and not isinstance(value, expected):
+            return f"Campo '{field}' con tipo inválido"
+    return None
+
+
+class OperationRegistry:
+    def __init__(self, service_name: str, session_factory, read_session_factory=None):
+        """
+        session_factory:      crea sesiones para operaciones de escritura.
+        read_session_factory: crea sesiones para operaciones de solo lectura
+                              (por defecto, la misma fábrica).
+        """
+        self.service_name = service_name
+        self.log = get_logger(service_name)
+        self.session_factory = session_factory
+        self.read_session_factory = read_session_factory or session_factory
+        self.operations = {}
+        self._stats = {}
+        self._lock = threading.Lock()
+        # Tiempo restante de la transacción que atiende cada hilo
+        self._budget = threading.local()
+        self.operation("_stats", read_only=True, uses_db=False)(self._stats_operation)
+        self.operation("batch", schema={"operations": list}, uses_db=False)(self._batch_operation)
+
+    def operation(self, name: str, schema: dict = None, read_only: bool = False, uses_db: bool = True,
+                  codec: str = codec.JSON, paginated: bool = False, cacheable: bool = True):
+        """
+        Decorador que registra un handler handler(payload, db) -> (status, data).
+        codec:     formato preferido para las respuestas OK con objeto (ver common.codec).
+        paginated: la operación puede continuarse con next_page.
+        cacheable: False para lecturas que el gateway no debe guardar ni compartir.
+        """
+        full_schema = dict(schema or {})
+        if paginated:
+            full_schema.update(PAGING_SCHEMA)
+
+        def register(handler):
+            self.operations[name] = Operation(name, handler, full_schema, read_only, uses_db, codec, paginated, cacheable)
+            self._stats[name] = OperationStats()
+            if paginated and "next_page" not in self.operations:
+                self.operation("next_page", schema=PAGING_SCHEMA, read_only=True, uses_db=False)(self._next_page_operation)
+            return handler
+        return register
+
+    def is_read_only(self, name: str) -> bool:
+        operation = self.operations.get(name)
+        return bool(operation and operation.read_only)
+
+    def handle_request(self, data: str, meta: dict = None):
+        """
+        Procesa el request y llama a la función de negocio correspondiente.
+        Formato esperado: OPERACION {json_payload}
+        Retorna (status, datos, meta de la respuesta).
+        """
+        parts = data.split(' ', 1)
+        name = parts[0]
+        operation = self.operations.get(name)
+        if operation is None:
+            return "NK", json.dumps({"error": f"Operación desconocida: {name}"}), {}
+        if (meta or {}).get("ro") == "1" and not operation.read_only:
+            # El cliente pidió solo lectura (GET en el gateway): una escritura no se ejecuta
+            return "NK", json.dumps({"error": f"La operación {name} no es de solo lectura"}), {}
+
+        start = time.perf_counter()
+        status = "NK"
+        self._budget.ms = deadline.remaining_ms(meta)
+        try:
+            payload = codec.loads(parts[1]) if len(parts) > 1 and parts[1].strip() else {}
+            error = validate_schema(payload, operation.schema)
+            if error:
+                return "NK", json.dumps({"error": error}), {}
+
+            events.begin()
+            status, response = self._call(operation, payload)
+            # ro=1: respuesta de una operación de solo lectura (el gateway puede cachearla)
+            response_meta = {"ro": "1"} if operation.read_only and not name.startswith("_") else {}
+            if response_meta and not operation.cacheable:
+                response_meta["nc"] = "1"
+            published = events.take()
+            if published and status == "OK":
+                response_meta[events.EVENTS_KEY] = events.encode(published)
+            if isinstance(response, str):
+                return status, response, response_meta
+            if isinstance(response, codec.Raw):
+                return status, response.data, dict(response_meta, **response.meta())
+            ct = codec.choose((meta or {}).get("accept"), operation.codec)
+            if ct != codec.JSON:
+                response_meta["ct"] = ct
+            return status, codec.dumps(response, ct), response_meta
+        except json.JSONDecodeError:
+            return "NK", json.dumps({"error": "Payload no es un JSON válido"}), {}
+        except pagination.CursorError as e:
+            return "NK", json.dumps({"error": str(e)}), {}
+        except Exception as e:
+            self.log.exception("Error inesperado", op=name, error=e)
+            return "NK", json.dumps({"error": f"Error interno: {str(e)}"}), {}
+        finally:
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            with self._lock:
+                self._stats[name].record(elapsed_ms, status == "OK")
+
+    def _call(self, operation: Operation, payload: dict):
+        if not operation.uses_db:
+            return operation.handler(payload, None)
+        factory = self.read_session_factory if operation.read_only else self.session_factory
+        # La sesión queda fija en una conexión: tras un commit una sesión normal puede tomar
+        # otra del pool, y el timeout se restablecería en una conexión distinta de la que lo tiene
+        with factory.kw["bind"].connect() as connection:
+            db = factory(bind=connection)
+            timeout_set = False
+            try:
+                budget_ms = getattr(self._budget, "ms", None)
+                if budget_ms is not None:
+                    timeout_set = deadline.set_statement_timeout(db.connection(), budget_ms)
+                return operation.handler(payload, db)
+            finally:
+                # Lo no confirmado se descarta al cerrar la sesión
+                db.close()
+                if timeout_set:
+                    deadline.reset_statement_timeout(connection)
+
+    def metrics(self) -> dict:
+        with self._lock:
+            return {name: stats.snapshot() for name, stats in self._stats.items()}
+
+    def _next_page_operation(self, payload: dict, db):
+        """Operación interna: siguiente página del listado que generó el cursor."""
+        cursor = payload.get("cursor")
+        if not cursor:
+            return "NK", json.dumps({"error": "Falta el cursor"})
+        state = pagination.decode_cursor(cursor)
+        operation = self.operations.get(state["op"])
+        if operation is None or not operation.paginated:
+            raise pagination.CursorError("Cursor inválido")
+        next_payload = dict(state["f"], cursor=cursor)
+        if "page_size" in payload:
+            next_payload["page_size"] = payload["page_size"]
+        return self._call(operation, next_payload)
+
+    def _batch_calls(self, entries):
+        """Valida las entradas del batch. Retorna (llamadas, None) o (None, error)."""
+        if not entries:
+            return None, {"error": "Falta campo requerido: operations"}
+        if len(entries) > BATCH_MAX_OPERATIONS:
+            return None, {"error": f"Máximo {BATCH_MAX_OPERATIONS} operaciones por batch"}
+        calls = []
+        for index, entry in enumerate(entries):
+            name = entry.get("operation") if isinstance(entry, dict) else None
+            operation = self.operations.get(name)
+            # Solo operaciones de negocio: las internas no participan de la transacción
+            if operation is None or not operation.uses_db:
+                return None, {"error": f"Operación no permitida en batch: {name}", "failed": index}
+            entry_payload = entry.get("payload") or {}
+            error = validate_schema(entry_payload, operation.schema)
+            if error:
+                return None, {"error": error, "failed": index}
+            calls.append((operation, entry_payload))
+        return calls, None
+
+    def _batch_operation(self, payload: dict, db):
+        """Operación interna: varias operaciones en una transacción, todo o nada."""
+        calls, error = self._batch_calls(payload.get("operations"))
+        if error:
+            return "NK", json.dumps(error)
+
+        results = []
+        with self.session_factory.kw["bind"].connect() as connection:
+            transaction = connection.begin()
+            # Los commit/rollback de cada handler solo cierran un savepoint;
+            # la transacción exterior se confirma al final si todo resultó OK
+            db = self.session_factory(bind=connection, join_transaction_mode="create_savepoint")
+            timeout_set = False
+            try:
+                budget_ms = getattr(self._budget, "ms", None)
+                if budget_ms is not None:
+                    timeout_set = deadline.set_statement_timeout(connection, budget_ms)
+                for index, (operation, entry_payload) in enumerate(calls):
+                    status, response = operation.handler(entry_payload, db)
+                    if isinstance(response, str):
+                        response = json.loads(response)
+                    results.append({"operation": operation.name, "status": status, "data": response})
+                    if status != "OK":
+                        transaction.rollback()
+                        return "NK", {"error": f"Falló la operación {index} ({operation.name}); no se aplicó ningún cambio",
+                                      "failed": index, "results": results}
+                db.commit()
+                transaction.commit()
+            finally:
+                db.close()
+                if transaction.is_active:
+                    transaction.rollback()
+                if timeout_set:
+                    deadline.reset_statement_timeout(connection)
+        return "OK", {"results": results}
+
+    def _stats_operation(self, payload: dict, db):
+        """Operación interna: métricas por operación del proceso que responde."""
+        return "OK", json.dumps({"service": self.service_name, "operations": self.metrics()})
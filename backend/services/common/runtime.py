@@ -0,0 +1,330 @@
+"""
+Runtime asíncrono compartido por todos los servicios.
+
+Reemplaza el main() bloqueante que cada app.py tenía copiado:
+1. Conecta al bus con streams asyncio.
+2. Se registra con sinit.
+3. Lee transacciones sin esperar a que termine la anterior y ejecuta
+   handle_request en un pool de hilos, de modo que varias transacciones
+   pueden estar en proceso a la vez.
+4. Responde en el mismo orden en que llegaron las transacciones, que es
+   lo que el bus espera en una conexión sin identificadores. Si la
+   transacción trae cid en el bloque meta, la respuesta lo repite y se
+   envía apenas termina, sin esperar a las anteriores.
+
+Control de admisión: cada worker acepta a lo sumo SERVICE_QUEUE_READ
+transacciones de lectura y SERVICE_QUEUE_WRITE de escritura entre las que
+esperan un hilo y las que se están ejecutando. Si la clase está llena, la
+transacción se responde al instante con NK {"error": "busy"} en vez de
+encolarse: así el backlog no crece mientras el cliente ya dejó de esperar.
+La pseudo-operación _runtime retorna la profundidad de la cola del worker
+que responde (para autoescalar servicios como prart y gerep).
+
+Plazos: si la transacción trae dl en el meta y el plazo vence antes de que
+empiece a ejecutarse (al llegar o mientras espera un hilo), se responde
+NK {"error": "deadline exceeded"} sin llamar a handle_request.
+
+Con SERVICE_WORKERS > 1 se pre-forkean N procesos; cada worker tiene su
+propia conexión al bus, su propio registro sinit y su propio pool de
+conexiones a la base de datos. El proceso padre solo supervisa: si un
+worker muere, lo vuelve a levantar.
+"""
+
+import asyncio
+import json
+import multiprocessing
+import os
+import signal
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from common import compression, deadline, protocol
+from common.log import elapsed_ms, get_logger, sampled, truncate
+
+DEFAULT_THREADS = int(os.getenv("SERVICE_THREADS", "8"))
+DEFAULT_WORKERS = int(os.getenv("SERVICE_WORKERS", "1"))
+RECONNECT_MIN_DELAY = float(os.getenv("RECONNECT_MIN_DELAY", "1"))
+RECONNECT_MAX_DELAY = float(os.getenv("RECONNECT_MAX_DELAY", "30"))
+# 0 = automático según la cantidad de hilos
+QUEUE_READ_LIMIT = int(os.getenv("SERVICE_QUEUE_READ", "0"))
+QUEUE_WRITE_LIMIT = int(os.getenv("SERVICE_QUEUE_WRITE", "0"))
+
+READ = "read"
+WRITE = "write"
+BUSY_ERROR = "busy"
+RUNTIME_OPERATION = "_runtime"
+
+
+def operation_name(data) -> str:
+    """Nombre de la operación (primer token de DATOS) sin decodificar el payload."""
+    head = bytes(data[:64]).split(b' ', 1)[0]
+    return str(head, protocol.ENCODING, 'replace')
+
+
+class ServiceRuntime:
+    def __init__(self, service_name: str, handler, bus_address, threads: int = DEFAULT_THREADS,
+                 worker_id: int = 0, read_only=None):
+        """
+        service_name: nombre con que el servicio se registra en el bus.
+        handler:      función handle_request(data: str, meta: dict) -> (status, data, meta).
+        bus_address:  tupla (host, puerto) del bus.
+        threads:      máximo de transacciones ejecutándose a la vez.
+        worker_id:    índice del worker (solo para los logs).
+        read_only:    función operación -> bool para separar lecturas de escrituras
+                      (registry.is_read_only); sin ella todo cuenta como escritura.
+        """
+        self.service_name = service_name
+        self.handler = handler
+        self.bus_address = bus_address
+        self.threads = threads
+        self.worker_id = worker_id
+        self.read_only = read_only
+        self.log = get_logger(service_name).for_worker(worker_id)
+        self.registered = False
+        self.executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix=service_name)
+        self.limits = {READ: QUEUE_READ_LIMIT or threads * 8, WRITE: QUEUE_WRITE_LIMIT or threads * 4}
+        # admitted se modifica solo en el event loop; running, desde los hilos del pool
+        self.admitted = {READ: 0, WRITE: 0}
+        self.running = {READ: 0, WRITE: 0}
+        self.rejected = {READ: 0, WRITE: 0}
+        self.expired = {READ: 0, WRITE: 0}
+        self._running_lock = threading.Lock()
+
+    def _kind(self, operation: str) -> str:
+        return READ if self.read_only and self.read_only(operation) else WRITE
+
+    def queue_stats(self) -> dict:
+        """Transacciones admitidas, ejecutándose, en espera y rechazadas, por clase."""
+        with self._running_lock:
+            running = dict(self.running)
+            expired = dict(self.expired)
+        classes = {
+            kind: {
+                "limit": self.limits[kind],
+                "admitted": self.admitted[kind],
+                "running": running[kind],
+                "queued": max(self.admitted[kind] - running[kind], 0),
+                "rejected": self.rejected[kind],
+                "expired": expired[kind],
+            }
+            for kind in (READ, WRITE)
+        }
+        return {
+            "service": self.service_name,
+            "worker": self.worker_id,
+            "threads": self.threads,
+            "queue_depth": sum(c["queued"] for c in classes.values()),
+            **classes,
+        }
+
+    def _process(self, message: protocol.Message, kind: str):
+        """Ejecuta handle_request en un hilo del pool. Retorna (operación, status, datos, meta)."""
+        if deadline.expired(message.meta):
+            # Venció mientras esperaba un hilo: nadie espera ya la respuesta
+            return operation_name(message.data), "NK", self._expired(message, kind), {}
+        with self._running_lock:
+            self.running[kind] += 1
+        try:
+            return self._execute(message)
+        finally:
+            with self._running_lock:
+                self.running[kind] -= 1
+
+    def _expired(self, message: protocol.Message, kind: str) -> str:
+        """Registra una transacción descartada por plazo vencido y retorna el error."""
+        with self._running_lock:
+            self.expired[kind] += 1
+        self.log.warning("Transacción vencida, se descarta", op=operation_name(message.data),
+                         late_ms=f"{-deadline.remaining_ms(message.meta):.0f}")
+        return json.dumps({"error": deadline.EXPIRED_ERROR})
+
+    def _execute(self, message: protocol.Message):
+        operation = operation_name(message.data)
+        start = time.perf_counter()
+        try:
+            message_data = message.text()
+            if self.log.debug_enabled(operation):
+                self.log.debug("Transacción recibida", op=operation, data=truncate(message_data))
+            status, response_data, response_meta = self.handler(message_data, message.meta)
+        except Exception as e:
+            self.log.exception("Error inesperado", op=operation, error=e)
+            status, response_data, response_meta = "NK", json.dumps({"error": f"Error interno: {str(e)}"}), {}
+        if "az" in message.meta:
+            # El cliente sabe descomprimir: comprimir aquí, fuera del event loop
+            if isinstance(response_data, str):
+                response_data = response_data.encode(protocol.ENCODING)
+            response_meta = dict(response_meta)
+            response_data = compression.maybe_compress(response_data, message.meta["az"], response_meta)
+        if status != "OK":
+            self.log.warning("Transacción rechazada", op=operation, ms=elapsed_ms(start))
+        elif sampled():
+            self.log.info("Transacción procesada", op=operation, ms=elapsed_ms(start),
+                          size_in=len(message.data), size_out=len(response_data))
+        return operation, status, response_data, response_meta
+
+    async def _register(self, reader, writer):
+        """Envía sinit y espera la confirmación del bus."""
+        init_frame = protocol.format_sinit(self.service_name)
+        self.log.debug("Registrando servicio", frame=init_frame)
+        await protocol.write_frame(writer, init_frame)
+        confirmation = await protocol.read_frame(reader)
+        if confirmation is None:
+            raise ConnectionResetError("El bus cerró la conexión durante el registro")
+        self.log.debug("Confirmación recibida", frame=confirmation)
+        self.registered = True
+
+    def _frame(self, message: protocol.Message, status: str, response_data, meta: dict):
+        # El cid de la transacción vuelve en la respuesta para que el cliente la correlacione
+        if "cid" in message.meta:
+            meta = dict(meta, cid=message.meta["cid"])
+        return protocol.format_response(self.service_name, status, response_data, meta)
+
+    async def _respond(self, message: protocol.Message, kind: str):
+        """Ejecuta la transacción en el pool de hilos y arma su respuesta."""
+        loop = asyncio.get_running_loop()
+        try:
+            operation, status, response_data, meta = await loop.run_in_executor(
+                self.executor, self._process, message, kind)
+        finally:
+            self.admitted[kind] -= 1
+        frame = self._frame(message, status, response_data, meta)
+        if self.log.debug_enabled(operation):
+            self.log.debug("Enviando respuesta", op=operation, status=status, frame=truncate(frame))
+        return frame
+
+    async def _reply_now(self, message: protocol.Message, status: str, body: str):
+        """Respuesta armada en el event loop, sin pasar por el pool de hilos."""
+        return self._frame(message, status, body, {})
+
+    def _admit(self, message: protocol.Message):
+        """Coroutine que responde la transacción: ejecutarla, rechazarla por carga o _runtime."""
+        operation = operation_name(message.data)
+        if operation == RUNTIME_OPERATION:
+            return self._reply_now(message, "OK", json.dumps(self.queue_stats()))
+        kind = self._kind(operation)
+        if deadline.expired(message.meta):
+            return self._reply_now(message, "NK", self._expired(message, kind))
+        if self.admitted[kind] >= self.limits[kind]:
+            self.rejected[kind] += 1
+            if self.log.debug_enabled(operation):
+                self.log.debug("Transacción rechazada por carga", op=operation, kind=kind)
+            return self._reply_now(message, "NK", json.dumps({"error": BUSY_ERROR}))
+        self.admitted[kind] += 1
+        return self._respond(message, kind)
+
+    async def serve(self):
+        """Conecta, registra y atiende transacciones hasta que el bus cierre la conexión."""
+        self.log.info("Conectando al bus", address=f"{self.bus_address[0]}:{self.bus_address[1]}")
+        reader, writer = await asyncio.open_connection(*self.bus_address)
+        responses = protocol.ResponseWriter(writer)
+        in_flight = set()
+        try:
+            await self._register(reader, writer)
+            self.log.info("Servicio listo. Esperando transacciones...", queue_read=self.limits[READ],
+                          queue_write=self.limits[WRITE])
+
+            while True:
+                # Se lee sin esperar hilos libres: el límite lo pone _admit, que rechaza al instante
+                message = await protocol.read_request(reader)
+                if message is None:
+                    self.log.info("Conexión cerrada por el bus")
+                    break
+                # Con cid se responde apenas termina; sin cid, en orden de llegada
+                task = responses.submit(self._admit(message), ordered="cid" not in message.meta)
+                in_flight.add(task)
+                task.add_done_callback(in_flight.discard)
+
+            if in_flight:
+                await asyncio.gather(*in_flight)
+        finally:
+            for task in in_flight:
+                task.cancel()
+            writer.close()
+
+
+def _run_worker(service_name: str, handler, bus_address, threads: int, worker_id: int, on_worker_start,
+                read_only=None):
+    """
+    Bucle de un worker: mantiene la conexión con el bus y se reconecta con
+    backoff exponencial cuando el bus no está disponible o cierra la conexión.
+    """
+    if on_worker_start:
+        on_worker_start()
+    runtime = ServiceRuntime(service_name, handler, bus_address, threads, worker_id, read_only)
+    log = runtime.log
+    delay = RECONNECT_MIN_DELAY
+    try:
+        while True:
+            runtime.registered = False
+            try:
+                asyncio.run(runtime.serve())
+            except (ConnectionRefusedError, OSError) as e:
+                log.error("No se pudo conectar al bus. Verifique que esté corriendo.", error=e)
+            except Exception as e:
+                log.exception("Error en el worker", error=e)
+            if runtime.registered:
+                delay = RECONNECT_MIN_DELAY
+            log.info("Reintentando conexión", delay_s=f"{delay:.0f}")
+            time.sleep(delay)
+            delay = min(delay * 2, RECONNECT_MAX_DELAY)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        runtime.executor.shutdown(wait=False)
+
+
+def run_service(service_name: str, handler, bus_address, threads: int = DEFAULT_THREADS,
+                workers: int = DEFAULT_WORKERS, on_worker_start=None, read_only=None):
+    """
+    Punto de entrada de cada app.py.
+
+    on_worker_start se ejecuta dentro de cada proceso worker recién creado
+    (los servicios lo usan para descartar el pool de conexiones heredado).
+    read_only clasifica operaciones para los límites de admisión (registry.is_read_only).
+    """
+    if workers <= 1:
+        _run_worker(service_name, handler, bus_address, threads, 0, None, read_only)
+        return
+
+    log = get_logger(service_name)
+    context = multiprocessing.get_context("fork")
+    processes = {}
+    next_start = {}
+
+    def spawn(worker_id: int):
+        process = context.Process(
+            target=_run_worker,
+            args=(service_name, handler, bus_address, threads, worker_id, on_worker_start, read_only),
+            name=f"{service_name}-{worker_id}",
+        )
+        process.start()
+        processes[worker_id] = process
+
+    def stop(signum, frame):
+        raise KeyboardInterrupt
+
+    signal.signal(signal.SIGTERM, stop)
+    log.info("Iniciando workers", workers=workers, threads=threads)
+    for worker_id in range(1, workers + 1):
+        spawn(worker_id)
+        next_start[worker_id] = 0.0
+
+    try:
+        while True:
+            time.sleep(1)
+            now = time.monotonic()
+            for worker_id, process in list(processes.items()):
+                if process.is_alive() or now < next_start[worker_id]:
+                    continue
+                log.warning("Worker terminó. Reiniciando...", worker=worker_id, exitcode=process.exitcode)
+                # Evita un bucle de reinicios si el worker falla apenas parte
+                next_start[worker_id] = now + RECONNECT_MIN_DELAY
+                spawn(worker_id)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for process in processes.values():
+            process.terminate()
+        for process in processes.values():
+            process.join(timeout=5)
@@ -0,0 +1,52 @@
+"""
+Tokens de sesión firmados.
+
+regist emite el token en login y el gateway lo verifica (límites de tasa
+por usuario, canal /events). El token es
+
+    session-<usuario_id>.<vence>.<firma>
+
+con vence en segundos desde epoch y firma = HMAC-SHA256 de
+"<usuario_id>.<vence>" con SESSION_SECRET. Sin el secreto no se puede
+armar un token para otro usuario ni extender uno vencido.
+
+regist y el gateway deben compartir SESSION_SECRET. Si no está definido,
+cada proceso usa uno aleatorio: los tokens solo valen en el proceso que
+los emitió, así que el gateway los rechaza todos en vez de aceptar tokens
+falsificables.
+
+El módulo no importa sqlalchemy: lo usa también el gateway.
+"""
+
+import hashlib
+import hmac
+import os
+import secrets
+import time
+
+PREFIX = "session-"
+SECRET = (os.getenv("SESSION_SECRET") or secrets.token_hex(32)).encode()
+TOKEN_TTL = int(os.getenv("SESSION_TTL", str(12 * 3600)))
+
+
+def _signature(body: str) -> str:
+    return hmac.new(SECRET, body.encode(), hashlib.sha256).hexdigest()
+
+
+def issue(usuario_id, ttl: int = TOKEN_TTL) -> str:
+    """Token de sesión de usuario_id, válido por ttl segundos."""
+    body = f"{usuario_id}.{int(time.time()) + ttl}"
+    return f"{PREFIX}{body}.{_signature(body)}"
+
+
+def verify(token: str):
+    """Usuario del token (str) si la firma es válida y no venció, o None."""
+    if not token or not token.startswith(PREFIX):
+        return None
+    body, _, signature = token[len(PREFIX):].rpartition(".")
+    usuario_id, _, expires = body.partition(".")
+    if not (usuario_id.isdigit() and expires.isdigit()):
+        return None
+    if not hmac.compare_digest(signature, _signature(body)):
+        return None
+    return usuario_id if int(expires) > time.time() else None
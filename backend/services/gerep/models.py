@@ -5,6 +5,13 @@ import os
 DATABASE_URL = os.getenv("DATABASE_URL")
 engine = create_engine(DATABASE_URL, echo=True, future=True)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+# Engine de lectura para operaciones read_only: usa la réplica si
+# DATABASE_READ_URL está definida y no abre transacciones explícitas
+DATABASE_READ_URL = os.getenv("DATABASE_READ_URL", DATABASE_URL)
+read_engine = create_engine(DATABASE_READ_URL, echo=True, future=True, isolation_level="AUTOCOMMIT")
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
+
 Base = declarative_base()
 
 class Item(Base):
@@ -61,3 +68,8 @@ def get_db():
         yield db
     finally:
         db.close()
+
+def reset_engine():
+    """Descarta el pool heredado del proceso padre: cada worker abre sus propias conexiones."""
+    engine.dispose(close=False)
+    read_engine.dispose(close=False)
@@ -1,65 +1,50 @@
-import socket
+import os
 import json
 from datetime import datetime
 from sqlalchemy.orm import Session
 from sqlalchemy.exc import SQLAlchemyError
-from models import ListaEspera, get_db, Item, Solicitud
+from models import ListaEspera, SessionLocal, ReadSessionLocal, reset_engine, Item, Solicitud
+from common import events
+from common.pagination import paginate
+from common.registry import OperationRegistry, ID, TEXT
+from common.runtime import run_service
 
 SERVICE_NAME = "lista"
-BUS_ADDRESS = ('bus', 5000)
+BUS_ADDRESS = (os.getenv("BUS_HOST", "bus"), int(os.getenv("BUS_PORT", "5000")))
 
-def send_response(sock, status, data):
-    """
-    Envía una respuesta al bus siguiendo el protocolo:
-    NNNNNSSSSSSTDATOS
-    donde:
-    - NNNNN: longitud de lo que sigue (5 dígitos)
-    - SSSSS: nombre del servicio (5 caracteres, padded)
-    - ST: status OK o NK (2 caracteres)
-    - DATOS: datos de respuesta
-    """
-    service_padded = SERVICE_NAME.ljust(5)[:5]
-    message = f"{service_padded}{status}{data}"
-    message_len = len(message)
-    formatted_message = f"{message_len:05d}{message}".encode('utf-8')
-    print(f"[LISTA] Enviando respuesta: {formatted_message!r}")
-    sock.sendall(formatted_message)
+registry = OperationRegistry(SERVICE_NAME, SessionLocal, ReadSessionLocal)
 
-def handle_request(data: str):
+
+def publicar_posiciones(db: Session, item_id, solicitud_id=None):
     """
-    Procesa el request y llama a la función de negocio correspondiente.
-    Formato esperado: OPERACION {json_payload}
+    Avisa a cada usuario en espera por el ítem su posición actual (la cola
+    cambió) y, si se indica solicitud_id, a su usuario (el que salió o fue
+    atendido) que ya no está en la cola.
     """
     try:
-        parts = data.split(' ', 1)
-        operation = parts[0]
-        payload_str = parts[1] if len(parts) > 1 else '{}'
-        payload = json.loads(payload_str)
-
-        print(f"[LISTA] Operación: {operation}")
-        print(f"[LISTA] Payload: {payload}")
-
-        db_session = next(get_db())
-
-        if operation == "create_lista_espera":
-            return agregar_lista_espera(payload, db_session)
-        elif operation == "update_lista_espera":
-            return actualizar_estado_lista_espera(payload, db_session)
-        elif operation == "get_lista_espera":
-            return obtener_lista_por_item(payload, db_session)
-        else:
-            return "NK", json.dumps({"error": f"Operación desconocida: {operation}"})
-
-    except json.JSONDecodeError:
-        return "NK", json.dumps({"error": "Payload no es un JSON válido"})
-    except IndexError:
-        return "NK", json.dumps({"error": "Formato inválido. Use: OPERACION {json_payload}"})
-    except Exception as e:
-        print(f"[LISTA] Error inesperado: {e}")
-        return "NK", json.dumps({"error": f"Error interno: {str(e)}"})
+        cola = (
+            db.query(ListaEspera.id, Solicitud.usuario_id)
+            .join(Solicitud, ListaEspera.solicitud_id == Solicitud.id)
+            .filter(ListaEspera.item_id == item_id, ListaEspera.estado == "EN ESPERA")
+            .order_by(ListaEspera.fecha_ingreso, ListaEspera.id)
+            .all()
+        )
+        solicitud = db.get(Solicitud, solicitud_id) if solicitud_id is not None else None
+    except SQLAlchemyError:
+        # El cambio ya está confirmado: sin eventos, los clientes lo ven al recargar
+        return
+    avisados = set()
+    for posicion, (registro_id, usuario_id) in enumerate(cola, start=1):
+        events.publish(usuario_id, events.WAITLIST, {
+            "item_id": item_id, "id": registro_id, "posicion": posicion, "total": len(cola)
+        })
+        avisados.add(usuario_id)
+    if solicitud is not None and solicitud.usuario_id not in avisados:
+        events.publish(solicitud.usuario_id, events.WAITLIST, {"item_id": item_id, "posicion": None, "total": len(cola)})
 
 # --- Lógica de Negocio ---
 
+@registry.operation("create_lista_espera", schema={"solicitud_id": ID, "item_id": ID, "estado": TEXT})
 def agregar_lista_espera(payload: dict, db: Session):
     """Agrega un usuario a la lista de espera de un artículo"""
     try:
@@ -83,6 +68,7 @@ def agregar_lista_espera(payload: dict, db: Session):
         db.add(nuevo_registro)
         db.commit()
         db.refresh(nuevo_registro)
+        publicar_posiciones(db, item_id)
         
         response_data = {
             "message": "Registro agregado exitosamente",
@@ -112,6 +98,7 @@ def agregar_lista_espera(payload: dict, db: Session):
         
         return "NK", json.dumps({"error": f"Error al interactuar con la base de datos: {error_msg}"})
 
+@registry.operation("update_lista_espera", schema={"id": ID, "estado": TEXT})
 def actualizar_estado_lista_espera(payload: dict, db: Session):
     """Actualiza el estado de un registro en la lista de espera"""
     try:
@@ -132,8 +119,10 @@ def actualizar_estado_lista_espera(payload: dict, db: Session):
             
         registro.estado = nuevo_estado_upper
         registro.registro_instante = datetime.now()
+        item_id, solicitud_id = registro.item_id, registro.solicitud_id
         
         db.commit()
+        publicar_posiciones(db, item_id, solicitud_id)
         
         response_data = {
             "message": f"Registro {id_registro} actualizado correctamente a {nuevo_estado_upper}",
@@ -147,36 +136,35 @@ def actualizar_estado_lista_espera(payload: dict, db: Session):
         db.rollback()
         return "NK", json.dumps({"error": f"Error al actualizar el registro: {str(e)}"})
 
+@registry.operation("get_lista_espera", schema={"item_id": ID}, read_only=True, paginated=True)
 def obtener_lista_por_item(payload: dict, db: Session):
-    """Obtiene la lista de espera de un artículo específico"""
+    """Obtiene la lista de espera de un artículo específico (paginable con cursor)"""
     try:
         item_id = payload.get("item_id")
         
         if not item_id:
             return "NK", json.dumps({"error": "Falta campo requerido: item_id"})
         
-        registros = db.query(ListaEspera).filter(
-            ListaEspera.item_id == item_id
-        ).order_by(ListaEspera.fecha_ingreso.asc()).all()
-        
-        if not registros:
-            return "NK", json.dumps({"error": "No se encontraron registros para este ítem"})
-            
-        resultado = [
-            {
+        query = db.query(ListaEspera).filter(ListaEspera.item_id == item_id)
+        resultado, next_cursor = paginate(
+            query, (ListaEspera.fecha_ingreso, ListaEspera.id), payload, "get_lista_espera",
+            lambda r: {
                 "id": r.id,
                 "solicitud_id": r.solicitud_id,
                 "item_id": r.item_id,
                 "fecha_ingreso": r.fecha_ingreso.isoformat(),
                 "estado": r.estado,
                 "registro_instante": r.registro_instante.isoformat()
-            } for r in registros
-        ]
+            })
+        
+        if not resultado:
+            return "NK", json.dumps({"error": "No se encontraron registros para este ítem"})
         
         response_data = {
             "item_id": item_id,
             "total": len(resultado),
-            "registros": resultado
+            "registros": resultado,
+            "next_cursor": next_cursor
         }
         
         return "OK", json.dumps(response_data)
@@ -184,84 +172,6 @@ def obtener_lista_por_item(payload: dict, db: Session):
     except SQLAlchemyError as e:
         return "NK", json.dumps({"error": f"Error al consultar la base de datos: {str(e)}"})
 
-# --- Main Loop ---
-
-def main():
-    """
-    Función principal del servicio.
-    1. Conecta al bus
-    2. Se registra como servicio usando sinit
-    3. Escucha transacciones en un bucle infinito
-    4. Procesa cada transacción y responde
-    """
-    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    try:
-        print(f"[LISTA] Conectando al bus en {BUS_ADDRESS}...")
-        sock.connect(BUS_ADDRESS)
-
-        # Registrar el servicio usando sinit
-        init_message = f"sinit{SERVICE_NAME}"
-        init_message_len = len(init_message)
-        formatted_init_message = f"{init_message_len:05d}{init_message}".encode('utf-8')
-        print(f"[LISTA] Registrando servicio: {formatted_init_message!r}")
-        sock.sendall(formatted_init_message)
-
-        # Esperar confirmación de registro
-        length_bytes = sock.recv(5)
-        if length_bytes:
-            amount_expected = int(length_bytes.decode('utf-8'))
-            confirmation = sock.recv(amount_expected).decode('utf-8')
-            print(f"[LISTA] Confirmación recibida: {confirmation!r}")
-
-        # Bucle principal: escuchar transacciones
-        print(f"[LISTA] Servicio '{SERVICE_NAME}' listo. Esperando transacciones...\n")
-        
-        while True:
-            # Leer longitud del mensaje (5 dígitos)
-            length_bytes = sock.recv(5)
-            if not length_bytes:
-                print("[LISTA] Conexión cerrada por el bus.")
-                break
-            
-            amount_expected = int(length_bytes.decode('utf-8'))
-            
-            # Leer el mensaje completo
-            data_received = b''
-            while len(data_received) < amount_expected:
-                chunk = sock.recv(amount_expected - len(data_received))
-                if not chunk:
-                    break
-                data_received += chunk
-            
-            message_str = data_received.decode('utf-8')
-            print(f"\n[LISTA] ===== Nueva transacción =====")
-            print(f"[LISTA] Datos recibidos: {message_str!r}")
-            
-            # El bus envía: SSSSS + DATOS, necesitamos solo DATOS
-            # Quitar los primeros 5 caracteres (nombre del servicio)
-            if len(message_str) > 5:
-                message_data = message_str[5:]
-            else:
-                message_data = message_str
-            
-            print(f"[LISTA] Datos sin prefijo: {message_data!r}")
-            
-            # Procesar la solicitud
-            status, response_data = handle_request(message_data)
-            
-            # Enviar respuesta al bus
-            send_response(sock, status, response_data)
-            print(f"[LISTA] Respuesta enviada con status: {status}")
-
-    except ConnectionRefusedError:
-        print("[LISTA] ERROR: No se pudo conectar al bus. Verifique que esté corriendo.")
-    except Exception as e:
-        print(f"[LISTA] ERROR: {e}")
-        import traceback
-        traceback.print_exc()
-    finally:
-        print("[LISTA] Cerrando socket.")
-        sock.close()
-
 if __name__ == "__main__":
-    main()
+    run_service(SERVICE_NAME, registry.handle_request, BUS_ADDRESS, on_worker_start=reset_engine,
+                read_only=registry.is_read_only)
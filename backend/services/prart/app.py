@@ -1,105 +1,48 @@
-import socket
+import os
 import json
 from datetime import datetime, timedelta
 from sqlalchemy.orm import Session, joinedload
 from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy import func
 from models import (
-    get_db, Item, Usuario, Solicitud, ItemSolicitud, Prestamo, Ventana, ItemExistencia
+    SessionLocal, ReadSessionLocal, reset_engine, Item, Usuario, Solicitud, ItemSolicitud, Prestamo, Ventana, ItemExistencia
 )
+from common.pagination import paginate
+from common.registry import OperationRegistry, ID, TEXT
+from common.runtime import run_service
 
 SERVICE_NAME = "prart"
-BUS_ADDRESS = ('bus', 5000)
+BUS_ADDRESS = (os.getenv("BUS_HOST", "bus"), int(os.getenv("BUS_PORT", "5000")))
 
-def send_response(sock, status, data):
-    """
-    Envía una respuesta al bus siguiendo el protocolo:
-    NNNNNSSSSSSTDATOS
-    donde:
-    - NNNNN: longitud de lo que sigue (5 dígitos)
-    - SSSSS: nombre del servicio (5 caracteres, padded)
-    - ST: status OK o NK (2 caracteres)
-    - DATOS: datos de respuesta
-    """
-    service_padded = SERVICE_NAME.ljust(5)[:5]
-    message = f"{service_padded}{status}{data}"
-    message_len = len(message)
-    formatted_message = f"{message_len:05d}{message}".encode('utf-8')
-    print(f"[PRART] Enviando respuesta: {formatted_message!r}")
-    sock.sendall(formatted_message)
-
-def handle_request(data: str):
-    """
-    Procesa el request y llama a la función de negocio correspondiente.
-    Formato esperado: OPERACION {json_payload}
-    """
-    try:
-        parts = data.split(' ', 1)
-        operation = parts[0]
-        payload_str = parts[1] if len(parts) > 1 else '{}'
-        payload = json.loads(payload_str)
-
-        print(f"[PRART] Operación: {operation}")
-        print(f"[PRART] Payload: {payload}")
-
-        db_session = next(get_db())
-
-        if operation == "get_all_items":
-            return obtener_todos_los_items(db_session)
-        elif operation == "search_items":
-            return buscar_items(payload, db_session)
-        elif operation == "get_solicitudes":
-            return obtener_solicitudes_usuario(payload, db_session)
-        elif operation == "create_solicitud":
-            return crear_solicitud(payload, db_session)
-        elif operation == "create_reserva":
-            return crear_reserva(payload, db_session)
-        elif operation == "cancel_reserva":
-            return cancelar_reserva(payload, db_session)
-        elif operation == "create_prestamo":
-            return registrar_prestamo(payload, db_session)
-        elif operation == "create_devolucion":
-            return registrar_devolucion(payload, db_session)
-        elif operation == "renovar_prestamo":
-            return renovar_prestamo(payload, db_session)
-        elif operation == "update_item_estado":
-            return actualizar_estado(payload, db_session)
-        else:
-            return "NK", json.dumps({"error": f"Operación desconocida: {operation}"})
-
-    except json.JSONDecodeError:
-        return "NK", json.dumps({"error": "Payload no es un JSON válido"})
-    except IndexError:
-        return "NK", json.dumps({"error": "Formato inválido. Use: OPERACION {json_payload}"})
-    except Exception as e:
-        print(f"[PRART] Error inesperado: {e}")
-        return "NK", json.dumps({"error": f"Error interno: {str(e)}"})
+registry = OperationRegistry(SERVICE_NAME, SessionLocal, ReadSessionLocal)
 
 # --- Lógica de Negocio ---
 
-def obtener_todos_los_items(db: Session):
-    """Obtiene todos los artículos del catálogo sin filtros"""
+def item_to_dict(item: Item) -> dict:
+    return {
+        "id": item.id,
+        "nombre": item.nombre,
+        "tipo": item.tipo,
+        "descripcion": item.descripcion,
+        "cantidad": item.cantidad,
+        "cantidad_max": item.cantidad_max,
+        "valor": float(item.valor),
+        "tarifa_atraso": float(item.tarifa_atraso)
+    }
+
+@registry.operation("get_all_items", read_only=True, paginated=True)
+def obtener_todos_los_items(payload: dict, db: Session):
+    """Obtiene todos los artículos del catálogo sin filtros (paginable con cursor)"""
     try:
-        items = db.query(Item).order_by(Item.nombre).all()
-        items_data = [
-            {
-                "id": item.id,
-                "nombre": item.nombre,
-                "tipo": item.tipo,
-                "descripcion": item.descripcion,
-                "cantidad": item.cantidad,
-                "cantidad_max": item.cantidad_max,
-                "valor": float(item.valor),
-                "tarifa_atraso": float(item.tarifa_atraso)
-            }
-            for item in items
-        ]
-        return "OK", json.dumps({"total": len(items_data), "items": items_data})
+        items_data, next_cursor = paginate(
+            db.query(Item), (Item.nombre, Item.id), payload, "get_all_items", item_to_dict)
+        return "OK", {"total": len(items_data), "items": items_data, "next_cursor": next_cursor}
     except SQLAlchemyError as e:
         return "NK", json.dumps({"error": f"Error al obtener items: {str(e)}"})
 
+@registry.operation("search_items", schema={"nombre": TEXT, "tipo": TEXT}, read_only=True, paginated=True)
 def buscar_items(payload: dict, db: Session):
-    """Busca artículos con filtros opcionales"""
+    """Busca artículos con filtros opcionales (paginable con cursor)"""
     try:
         nombre = payload.get("nombre")
         tipo = payload.get("tipo")
@@ -110,24 +53,12 @@ def buscar_items(payload: dict, db: Session):
         if tipo:
             query = query.filter(Item.tipo == tipo)
         
-        items = query.all()
-        items_data = [
-            {
-                "id": item.id,
-                "nombre": item.nombre,
-                "tipo": item.tipo,
-                "descripcion": item.descripcion,
-                "cantidad": item.cantidad,
-                "cantidad_max": item.cantidad_max,
-                "valor": float(item.valor),
-                "tarifa_atraso": float(item.tarifa_atraso)
-            }
-            for item in items
-        ]
-        return "OK", json.dumps({"total": len(items_data), "items": items_data})
+        items_data, next_cursor = paginate(query, (Item.id,), payload, "search_items", item_to_dict)
+        return "OK", {"total": len(items_data), "items": items_data, "next_cursor": next_cursor}
     except SQLAlchemyError as e:
         return "NK", json.dumps({"error": f"Error al buscar items: {str(e)}"})
 
+@registry.operation("create_reserva", schema={"solicitud_id": ID, "item_existencia_id": ID, "inicio": TEXT, "fin": TEXT})
 def crear_reserva(payload: dict, db: Session):
     """Crea una reserva (ventana de tiempo para un préstamo)"""
     try:
@@ -163,6 +94,7 @@ def crear_reserva(payload: dict, db: Session):
         db.rollback()
         return "NK", json.dumps({"error": f"Error al crear la reserva: {str(e)}"})
 
+@registry.operation("cancel_reserva", schema={"reserva_id": ID})
 def cancelar_reserva(payload: dict, db: Session):
     """Cancela una reserva"""
     try:
@@ -182,6 +114,7 @@ def cancelar_reserva(payload: dict, db: Session):
         db.rollback()
         return "NK", json.dumps({"error": f"Error al cancelar la reserva: {str(e)}"})
 
+@registry.operation("get_solicitudes", schema={"usuario_id": ID, "correo": TEXT}, read_only=True)
 def obtener_solicitudes_usuario(payload: dict, db: Session):
     """Obtiene las solicitudes de un usuario"""
     try:
@@ -241,6 +174,7 @@ def obtener_solicitudes_usuario(payload: dict, db: Session):
     except SQLAlchemyError as e:
         return "NK", json.dumps({"error": f"Error al obtener solicitudes: {str(e)}"})
 
+@registry.operation("create_solicitud", schema={"usuario_id": ID, "correo": TEXT, "tipo": TEXT})
 def crear_solicitud(payload: dict, db: Session):
     """Crea una solicitud de préstamo"""
     try:
@@ -288,6 +222,7 @@ def crear_solicitud(payload: dict, db: Session):
         db.rollback()
         return "NK", json.dumps({"error": f"Error al crear la solicitud: {str(e)}"})
 
+@registry.operation("create_prestamo", schema={"solicitud_id": ID, "item_existencia_id": ID, "comentario": TEXT})
 def registrar_prestamo(payload: dict, db: Session):
     """Registra un nuevo préstamo"""
     try:
@@ -321,6 +256,7 @@ def registrar_prestamo(payload: dict, db: Session):
         db.rollback()
         return "NK", json.dumps({"error": f"Error al registrar el préstamo: {str(e)}"})
 
+@registry.operation("create_devolucion", schema={"prestamo_id": ID, "comentario": TEXT})
 def registrar_devolucion(payload: dict, db: Session):
     """Registra la devolución de un préstamo"""
     try:
@@ -344,6 +280,7 @@ def registrar_devolucion(payload: dict, db: Session):
         db.rollback()
         return "NK", json.dumps({"error": f"Error al registrar la devolución: {str(e)}"})
 
+@registry.operation("renovar_prestamo", schema={"prestamo_id": ID})
 def renovar_prestamo(payload: dict, db: Session):
     """Renueva un préstamo existente"""
     try:
@@ -371,6 +308,7 @@ def renovar_prestamo(payload: dict, db: Session):
         db.rollback()
         return "NK", json.dumps({"error": f"Error al renovar el préstamo: {str(e)}"})
 
+@registry.operation("update_item_estado", schema={"existencia_id": ID, "estado": TEXT})
 def actualizar_estado(payload: dict, db: Session):
     """Actualiza el estado de un item de existencia"""
     try:
@@ -392,84 +330,6 @@ def actualizar_estado(payload: dict, db: Session):
         db.rollback()
         return "NK", json.dumps({"error": f"Error al actualizar el estado: {str(e)}"})
 
-# --- Main Loop ---
-
-def main():
-    """
-    Función principal del servicio.
-    1. Conecta al bus
-    2. Se registra como servicio usando sinit
-    3. Escucha transacciones en un bucle infinito
-    4. Procesa cada transacción y responde
-    """
-    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    try:
-        print(f"[PRART] Conectando al bus en {BUS_ADDRESS}...")
-        sock.connect(BUS_ADDRESS)
-
-        # Registrar el servicio usando sinit
-        init_message = f"sinit{SERVICE_NAME}"
-        init_message_len = len(init_message)
-        formatted_init_message = f"{init_message_len:05d}{init_message}".encode('utf-8')
-        print(f"[PRART] Registrando servicio: {formatted_init_message!r}")
-        sock.sendall(formatted_init_message)
-
-        # Esperar confirmación de registro
-        length_bytes = sock.recv(5)
-        if length_bytes:
-            amount_expected = int(length_bytes.decode('utf-8'))
-            confirmation = sock.recv(amount_expected).decode('utf-8')
-            print(f"[PRART] Confirmación recibida: {confirmation!r}")
-
-        # Bucle principal: escuchar transacciones
-        print(f"[PRART] Servicio '{SERVICE_NAME}' listo. Esperando transacciones...\n")
-        
-        while True:
-            # Leer longitud del mensaje (5 dígitos)
-            length_bytes = sock.recv(5)
-            if not length_bytes:
-                print("[PRART] Conexión cerrada por el bus.")
-                break
-            
-            amount_expected = int(length_bytes.decode('utf-8'))
-            
-            # Leer el mensaje completo
-            data_received = b''
-            while len(data_received) < amount_expected:
-                chunk = sock.recv(amount_expected - len(data_received))
-                if not chunk:
-                    break
-                data_received += chunk
-            
-            message_str = data_received.decode('utf-8')
-            print(f"\n[PRART] ===== Nueva transacción =====")
-            print(f"[PRART] Datos recibidos: {message_str!r}")
-            
-            # El bus envía: SSSSS + DATOS, necesitamos solo DATOS
-            # Quitar los primeros 5 caracteres (nombre del servicio)
-            if len(message_str) > 5:
-                message_data = message_str[5:]
-            else:
-                message_data = message_str
-            
-            print(f"[PRART] Datos sin prefijo: {message_data!r}")
-            
-            # Procesar la solicitud
-            status, response_data = handle_request(message_data)
-            
-            # Enviar respuesta al bus
-            send_response(sock, status, response_data)
-            print(f"[PRART] Respuesta enviada con status: {status}")
-
-    except ConnectionRefusedError:
-        print("[PRART] ERROR: No se pudo conectar al bus. Verifique que esté corriendo.")
-    except Exception as e:
-        print(f"[PRART] ERROR: {e}")
-        import traceback
-        traceback.print_exc()
-    finally:
-        print("[PRART] Cerrando socket.")
-        sock.close()
-
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    run_service(SERVICE_NAME, registry.handle_request, BUS_ADDRESS, on_worker_start=reset_engine,
+                read_only=registry.is_read_only)
@@ -1,73 +1,22 @@
-import socket
 import os
 import json
 from datetime import datetime
 from sqlalchemy.orm import Session
 from sqlalchemy.exc import SQLAlchemyError, IntegrityError
-from models import Usuario, Solicitud, get_db
+from models import Usuario, Solicitud, SessionLocal, ReadSessionLocal, reset_engine
+from common import events, session
+from common.pagination import paginate
+from common.registry import OperationRegistry, ID, TEXT
+from common.runtime import run_service
 
 SERVICE_NAME = "regis"
-BUS_ADDRESS = ('bus', 5000)
+BUS_ADDRESS = (os.getenv("BUS_HOST", "bus"), int(os.getenv("BUS_PORT", "5000")))
 
-def send_response(sock, status, data):
-    """
-    Envía una respuesta al bus siguiendo el protocolo:
-    NNNNNSSSSSSTDATOS
-    donde:
-    - NNNNN: longitud de lo que sigue (5 dígitos)
-    - SSSSS: nombre del servicio (5 caracteres, padded)
-    - ST: status OK o NK (2 caracteres)
-    - DATOS: datos de respuesta
-    """
-    service_padded = SERVICE_NAME.ljust(5)[:5]
-    message = f"{service_padded}{status}{data}"
-    message_len = len(message)
-    formatted_message = f"{message_len:05d}{message}".encode('utf-8')
-    print(f"[REGIS] Enviando respuesta: {formatted_message!r}")
-    sock.sendall(formatted_message)
-
-def handle_request(data: str):
-    """
-    Procesa el request y llama a la función de negocio correspondiente.
-    Formato esperado: OPERACION {json_payload}
-    Ejemplo: register {"nombre":"Juan","correo":"juan@mail.com","password":"123","tipo":"ESTUDIANTE"}
-    """
-    try:
-        parts = data.split(' ', 1)
-        operation = parts[0]
-        payload_str = parts[1] if len(parts) > 1 else '{}'
-        payload = json.loads(payload_str)
-
-        print(f"[REGIS] Operación: {operation}")
-        print(f"[REGIS] Payload: {payload}")
-
-        db_session = next(get_db())
-
-        if operation == "register":
-            return registrar_usuario(payload, db_session)
-        elif operation == "login":
-            return login(payload, db_session)
-        elif operation == "get_user":
-            return consultar_usuario(payload, db_session)
-        elif operation == "update_user":
-            return actualizar_usuario(payload, db_session)
-        elif operation == "update_solicitud":
-            return actualizar_solicitud_registro(payload, db_session)
-        elif operation == "get_all_emails":
-            return obtener_todos_correos(payload, db_session)
-        else:
-            return "NK", json.dumps({"error": f"Operación desconocida: {operation}"})
-
-    except json.JSONDecodeError:
-        return "NK", json.dumps({"error": "Payload no es un JSON válido"})
-    except IndexError:
-        return "NK", json.dumps({"error": "Formato inválido. Use: OPERACION {json_payload}"})
-    except Exception as e:
-        print(f"[REGIS] Error inesperado: {e}")
-        return "NK", json.dumps({"error": f"Error interno: {str(e)}"})
+registry = OperationRegistry(SERVICE_NAME, SessionLocal, ReadSessionLocal)
 
 # --- Lógica de Negocio ---
 
+@registry.operation("register", schema={"nombre": TEXT, "correo": TEXT, "password": TEXT, "tipo": TEXT, "telefono": TEXT, "estado": TEXT})
 def registrar_usuario(data: dict, db: Session):
     try:
         nuevo_usuario = Usuario(
@@ -97,6 +46,7 @@ def registrar_usuario(data: dict, db: Session):
         db.rollback()
         return "NK", json.dumps({"error": f"Error en la base de datos o datos incompletos: {str(e)}"})
 
+@registry.operation("login", schema={"correo": TEXT, "password": TEXT}, read_only=True, cacheable=False)
 def login(auth: dict, db: Session):
     correo = auth["correo"].lower()
     user = db.query(Usuario).filter(Usuario.correo == correo).first()
@@ -105,10 +55,11 @@ def login(auth: dict, db: Session):
         return "NK", json.dumps({"error": "Credenciales inválidas"})
 
     user_data = user.to_dict()
-    token = f"session-{user_data['id']}"
+    token = session.issue(user_data["id"])
     response_data = {"message": f"Usuario {correo} autenticado", "token": token, "user": user_data}
     return "OK", json.dumps(response_data)
 
+@registry.operation("get_user", schema={"id": ID}, read_only=True)
 def consultar_usuario(payload: dict, db: Session):
     user_id = payload.get("id")
     if not user_id:
@@ -120,6 +71,7 @@ def consultar_usuario(payload: dict, db: Session):
         
     return "OK", json.dumps(user.to_dict())
 
+@registry.operation("update_user", schema={"id": ID, "datos": dict})
 def actualizar_usuario(payload: dict, db: Session):
     user_id = payload.get("id")
     datos = payload.get("datos")
@@ -144,6 +96,7 @@ def actualizar_usuario(payload: dict, db: Session):
         db.rollback()
         return "NK", json.dumps({"error": f"Error al actualizar: {str(e)}"})
 
+@registry.operation("update_solicitud", schema={"solicitud_id": ID, "estado": TEXT})
 def actualizar_solicitud_registro(payload: dict, db: Session):
     solicitud_id = payload.get("solicitud_id")
     nuevo_estado = payload.get("estado")
@@ -162,12 +115,14 @@ def actualizar_solicitud_registro(payload: dict, db: Session):
         solicitud.estado = nuevo_estado
         db.commit()
         db.refresh(solicitud)
+        events.publish(solicitud.usuario_id, events.SOLICITUD, {"solicitud_id": solicitud.id, "estado": nuevo_estado})
         response = {"message": f"Solicitud {solicitud_id} actualizada a {nuevo_estado}"}
         return "OK", json.dumps(response)
     except SQLAlchemyError as e:
         db.rollback()
         return "NK", json.dumps({"error": f"Error al actualizar solicitud: {str(e)}"})
 
+@registry.operation("get_all_emails", schema={"tipo": TEXT, "estado": TEXT}, read_only=True, paginated=True)
 def obtener_todos_correos(payload: dict, db: Session):
     """
     Obtiene una lista de todos los correos electrónicos de usuarios registrados.
@@ -176,6 +131,7 @@ def obtener_todos_correos(payload: dict, db: Session):
     Payload opcional:
     - tipo: Filtrar por tipo de usuario (ESTUDIANTE, PROFESOR, ADMIN)
     - estado: Filtrar por estado (ACTIVO, INACTIVO, BLOQUEADO)
+    - page_size / cursor: paginación (ver common.pagination)
     """
     try:
         # Consulta base
@@ -188,25 +144,22 @@ def obtener_todos_correos(payload: dict, db: Session):
         if payload.get("estado"):
             query = query.filter(Usuario.estado == payload["estado"].upper())
         
-        # Obtener usuarios
-        usuarios = query.all()
-        
-        # Crear lista de correos con información adicional
-        correos_list = [
-            {
+        # Obtener usuarios en lotes y crear lista de correos con información adicional
+        correos_list, next_cursor = paginate(
+            query, (Usuario.id,), payload, "get_all_emails",
+            lambda user: {
                 "id": user.id,
                 "correo": user.correo,
                 "nombre": user.nombre,
                 "tipo": user.tipo,
                 "estado": user.estado
-            }
-            for user in usuarios
-        ]
+            })
         
         response_data = {
             "message": f"Se encontraron {len(correos_list)} usuarios",
             "total": len(correos_list),
-            "correos": correos_list
+            "correos": correos_list,
+            "next_cursor": next_cursor
         }
         
         return "OK", json.dumps(response_data)
@@ -215,84 +168,6 @@ def obtener_todos_correos(payload: dict, db: Session):
         db.rollback()
         return "NK", json.dumps({"error": f"Error al consultar correos: {str(e)}"})
 
-# --- Main Loop ---
-
-def main():
-    """
-    Función principal del servicio.
-    1. Conecta al bus
-    2. Se registra como servicio usando sinit
-    3. Escucha transacciones en un bucle infinito
-    4. Procesa cada transacción y responde
-    """
-    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    try:
-        print(f"[REGIS] Conectando al bus en {BUS_ADDRESS}...")
-        sock.connect(BUS_ADDRESS)
-
-        # Registrar el servicio usando sinit
-        init_message = f"sinit{SERVICE_NAME}"
-        init_message_len = len(init_message)
-        formatted_init_message = f"{init_message_len:05d}{init_message}".encode('utf-8')
-        print(f"[REGIS] Registrando servicio: {formatted_init_message!r}")
-        sock.sendall(formatted_init_message)
-
-        # Esperar confirmación de registro (NNNNNNOK o similar)
-        length_bytes = sock.recv(5)
-        if length_bytes:
-            amount_expected = int(length_bytes.decode('utf-8'))
-            confirmation = sock.recv(amount_expected).decode('utf-8')
-            print(f"[REGIS] Confirmación recibida: {confirmation!r}")
-
-        # Bucle principal: escuchar transacciones
-        print(f"[REGIS] Servicio '{SERVICE_NAME}' listo. Esperando transacciones...\n")
-        
-        while True:
-            # Leer longitud del mensaje (5 dígitos)
-            length_bytes = sock.recv(5)
-            if not length_bytes:
-                print("[REGIS] Conexión cerrada por el bus.")
-                break
-            
-            amount_expected = int(length_bytes.decode('utf-8'))
-            
-            # Leer el mensaje completo
-            data_received = b''
-            while len(data_received) < amount_expected:
-                chunk = sock.recv(amount_expected - len(data_received))
-                if not chunk:
-                    break
-                data_received += chunk
-            
-            message_str = data_received.decode('utf-8')
-            print(f"\n[REGIS] ===== Nueva transacción =====")
-            print(f"[REGIS] Datos recibidos: {message_str!r}")
-            
-            # El bus envía: SSSSS + DATOS, necesitamos solo DATOS
-            # Quitar los primeros 5 caracteres (nombre del servicio)
-            if len(message_str) > 5:
-                message_data = message_str[5:]
-            else:
-                message_data = message_str
-            
-            print(f"[REGIS] Datos sin prefijo: {message_data!r}")
-            
-            # Procesar la solicitud
-            status, response_data = handle_request(message_data)
-            
-            # Enviar respuesta al bus
-            send_response(sock, status, response_data)
-            print(f"[REGIS] Respuesta enviada con status: {status}")
-
-    except ConnectionRefusedError:
-        print("[REGIS] ERROR: No se pudo conectar al bus. Verifique que esté corriendo.")
-    except Exception as e:
-        print(f"[REGIS] ERROR: {e}")
-        import traceback
-        traceback.print_exc()
-    finally:
-        print("Cerrando socket.")
-        sock.close()
-
 if __name__ == "__main__":
-    main()
+    run_service(SERVICE_NAME, registry.handle_request, BUS_ADDRESS, on_worker_start=reset_engine,
+                read_only=registry.is_read_only)
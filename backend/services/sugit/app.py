@@ -1,66 +1,22 @@
-import socket
+import os
 import json
 from sqlalchemy.orm import Session
 from sqlalchemy.exc import SQLAlchemyError
-from models import Sugerencia, Usuario, get_db
+from models import Sugerencia, Usuario, SessionLocal, ReadSessionLocal, reset_engine
+from common.log import get_logger
+from common.pagination import paginate
+from common.registry import OperationRegistry, ID, TEXT
+from common.runtime import run_service
 
 SERVICE_NAME = "sugit"
-BUS_ADDRESS = ('bus', 5000)
+BUS_ADDRESS = (os.getenv("BUS_HOST", "bus"), int(os.getenv("BUS_PORT", "5000")))
 
-def send_response(sock, status, data):
-    """
-    Envía una respuesta al bus siguiendo el protocolo:
-    NNNNNSSSSSSTDATOS
-    donde:
-    - NNNNN: longitud de lo que sigue (5 dígitos)
-    - SSSSS: nombre del servicio (5 caracteres, padded)
-    - ST: status OK o NK (2 caracteres)
-    - DATOS: datos de respuesta
-    """
-    service_padded = SERVICE_NAME.ljust(5)[:5]
-    message = f"{service_padded}{status}{data}"
-    message_len = len(message)
-    formatted_message = f"{message_len:05d}{message}".encode('utf-8')
-    print(f"[SUGIT] Enviando respuesta: {formatted_message!r}")
-    sock.sendall(formatted_message)
-
-def handle_request(data: str):
-    """
-    Procesa el request y llama a la función de negocio correspondiente.
-    Formato esperado: OPERACION {json_payload}
-    """
-    try:
-        parts = data.split(' ', 1)
-        operation = parts[0]
-        payload_str = parts[1] if len(parts) > 1 else '{}'
-        payload = json.loads(payload_str)
-
-        print(f"[SUGIT] Operación: {operation}")
-        print(f"[SUGIT] Payload: {payload}")
-
-        db_session = next(get_db())
-
-        if operation == "registrar_sugerencia":
-            return registrar_sugerencia(payload, db_session)
-        elif operation == "listar_sugerencias":
-            return listar_sugerencias(payload, db_session)
-        elif operation == "aprobar_sugerencia":
-            return aprobar_sugerencia(payload, db_session)
-        elif operation == "rechazar_sugerencia":
-            return rechazar_sugerencia(payload, db_session)
-        else:
-            return "NK", json.dumps({"error": f"Operación desconocida: {operation}"})
-
-    except json.JSONDecodeError:
-        return "NK", json.dumps({"error": "Payload no es un JSON válido"})
-    except IndexError:
-        return "NK", json.dumps({"error": "Formato inválido. Use: OPERACION {json_payload}"})
-    except Exception as e:
-        print(f"[SUGIT] Error inesperado: {e}")
-        return "NK", json.dumps({"error": f"Error interno: {str(e)}"})
+registry = OperationRegistry(SERVICE_NAME, SessionLocal, ReadSessionLocal)
+log = get_logger(SERVICE_NAME)
 
 # --- Lógica de Negocio ---
 
+@registry.operation("registrar_sugerencia", schema={"usuario_id": ID, "sugerencia": TEXT})
 def registrar_sugerencia(payload: dict, db: Session):
     """Registra una nueva sugerencia"""
     try:
@@ -93,40 +49,42 @@ def registrar_sugerencia(payload: dict, db: Session):
         
     except SQLAlchemyError as e:
         db.rollback()
-        print(f"[SUGIT] SQLAlchemyError al registrar sugerencia: {e}")
+        log.error("SQLAlchemyError al registrar sugerencia", error=e)
         return "NK", json.dumps({"error": f"Error al registrar sugerencia: {str(e)}"})
     except Exception as e:
-        print(f"[SUGIT] Exception al registrar sugerencia: {e}")
+        log.error("Exception al registrar sugerencia", error=e)
         return "NK", json.dumps({"error": f"Error al registrar sugerencia: {str(e)}"})
 
+def sugerencia_to_dict(s: Sugerencia) -> dict:
+    return {
+        "id": s.id,
+        "usuario_id": s.usuario_id,
+        "sugerencia": s.sugerencia,
+        "estado": s.estado,
+        "registro_instante": s.registro_instante.isoformat() if s.registro_instante else None
+    }
+
+@registry.operation("listar_sugerencias", read_only=True, paginated=True)
 def listar_sugerencias(payload: dict, db: Session):
-    """Lista todas las sugerencias"""
+    """Lista todas las sugerencias (paginable con cursor)"""
     try:
-        sugerencias = db.query(Sugerencia).all()
-        
-        data = [
-            {
-                "id": s.id,
-                "usuario_id": s.usuario_id,
-                "sugerencia": s.sugerencia,
-                "estado": s.estado,
-                "registro_instante": s.registro_instante.isoformat() if s.registro_instante else None
-            }
-            for s in sugerencias
-        ]
+        data, next_cursor = paginate(
+            db.query(Sugerencia), (Sugerencia.id,), payload, "listar_sugerencias", sugerencia_to_dict)
         
         return "OK", json.dumps({
             "total": len(data),
-            "sugerencias": data
+            "sugerencias": data,
+            "next_cursor": next_cursor
         })
         
     except SQLAlchemyError as e:
-        print(f"[SUGIT] SQLAlchemyError al listar sugerencias: {e}")
+        log.error("SQLAlchemyError al listar sugerencias", error=e)
         return "NK", json.dumps({"error": f"Error al listar sugerencias: {str(e)}"})
     except Exception as e:
-        print(f"[SUGIT] Exception al listar sugerencias: {e}")
+        log.error("Exception al listar sugerencias", error=e)
         return "NK", json.dumps({"error": f"Error al listar sugerencias: {str(e)}"})
 
+@registry.operation("aprobar_sugerencia", schema={"id": ID})
 def aprobar_sugerencia(payload: dict, db: Session):
     """Aprueba una sugerencia"""
     try:
@@ -151,12 +109,13 @@ def aprobar_sugerencia(payload: dict, db: Session):
         
     except SQLAlchemyError as e:
         db.rollback()
-        print(f"[SUGIT] SQLAlchemyError al aprobar sugerencia: {e}")
+        log.error("SQLAlchemyError al aprobar sugerencia", error=e)
         return "NK", json.dumps({"error": f"Error al aprobar sugerencia: {str(e)}"})
     except Exception as e:
-        print(f"[SUGIT] Exception al aprobar sugerencia: {e}")
+        log.error("Exception al aprobar sugerencia", error=e)
         return "NK", json.dumps({"error": f"Error al aprobar sugerencia: {str(e)}"})
 
+@registry.operation("rechazar_sugerencia", schema={"id": ID})
 def rechazar_sugerencia(payload: dict, db: Session):
     """Rechaza una sugerencia"""
     try:
@@ -181,90 +140,12 @@ def rechazar_sugerencia(payload: dict, db: Session):
         
     except SQLAlchemyError as e:
         db.rollback()
-        print(f"[SUGIT] SQLAlchemyError al rechazar sugerencia: {e}")
+        log.error("SQLAlchemyError al rechazar sugerencia", error=e)
         return "NK", json.dumps({"error": f"Error al rechazar sugerencia: {str(e)}"})
     except Exception as e:
-        print(f"[SUGIT] Exception al rechazar sugerencia: {e}")
+        log.error("Exception al rechazar sugerencia", error=e)
         return "NK", json.dumps({"error": f"Error al rechazar sugerencia: {str(e)}"})
 
-# --- Main Loop ---
-
-def main():
-    """
-    Función principal del servicio.
-    1. Conecta al bus
-    2. Se registra como servicio usando sinit
-    3. Escucha transacciones en un bucle infinito
-    4. Procesa cada transacción y responde
-    """
-    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    try:
-        print(f"[SUGIT] Conectando al bus en {BUS_ADDRESS}...")
-        sock.connect(BUS_ADDRESS)
-
-        # Registrar el servicio usando sinit
-        init_message = f"sinit{SERVICE_NAME}"
-        init_message_len = len(init_message)
-        formatted_init_message = f"{init_message_len:05d}{init_message}".encode('utf-8')
-        print(f"[SUGIT] Registrando servicio: {formatted_init_message!r}")
-        sock.sendall(formatted_init_message)
-
-        # Esperar confirmación de registro
-        length_bytes = sock.recv(5)
-        if length_bytes:
-            amount_expected = int(length_bytes.decode('utf-8'))
-            confirmation = sock.recv(amount_expected).decode('utf-8')
-            print(f"[SUGIT] Confirmación recibida: {confirmation!r}")
-
-        # Bucle principal: escuchar transacciones
-        print(f"[SUGIT] Servicio '{SERVICE_NAME}' listo. Esperando transacciones...\n")
-        
-        while True:
-            # Leer longitud del mensaje (5 dígitos)
-            length_bytes = sock.recv(5)
-            if not length_bytes:
-                print("[SUGIT] Conexión cerrada por el bus.")
-                break
-            
-            amount_expected = int(length_bytes.decode('utf-8'))
-            
-            # Leer el mensaje completo
-            data_received = b''
-            while len(data_received) < amount_expected:
-                chunk = sock.recv(amount_expected - len(data_received))
-                if not chunk:
-                    break
-                data_received += chunk
-            
-            message_str = data_received.decode('utf-8')
-            print(f"\n[SUGIT] ===== Nueva transacción =====")
-            print(f"[SUGIT] Datos recibidos: {message_str!r}")
-            
-            # El bus envía: SSSSS + DATOS, necesitamos solo DATOS
-            # Quitar los primeros 5 caracteres (nombre del servicio)
-            if len(message_str) > 5:
-                message_data = message_str[5:]
-            else:
-                message_data = message_str
-            
-            print(f"[SUGIT] Datos sin prefijo: {message_data!r}")
-            
-            # Procesar la solicitud
-            status, response_data = handle_request(message_data)
-            
-            # Enviar respuesta al bus
-            send_response(sock, status, response_data)
-            print(f"[SUGIT] Respuesta enviada con status: {status}")
-
-    except ConnectionRefusedError:
-        print("[SUGIT] ERROR: No se pudo conectar al bus. Verifique que esté corriendo.")
-    except Exception as e:
-        print(f"[SUGIT] ERROR: {e}")
-        import traceback
-        traceback.print_exc()
-    finally:
-        print("[SUGIT] Cerrando socket.")
-        sock.close()
-
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    run_service(SERVICE_NAME, registry.handle_request, BUS_ADDRESS, on_worker_start=reset_engine,
+                read_only=registry.is_read_only)
@@ -4,43 +4,34 @@ Cliente interactivo para el servicio GEREP (Generación de Reportes)
 Sistema PrestaLab SOA
 """
 
+import os
+import sys
 import socket
 import json
 import base64
 
+# Protocolo compartido con los servicios
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "services"))
+from common import protocol
+
 BUS_ADDRESS = ('localhost', 5000)
 SERVICE_NAME = "gerep"
 
 def send_request(operation, payload):
     """Envía una solicitud al bus y retorna la respuesta"""
-    service_padded = SERVICE_NAME.ljust(5)[:5]
     data = f"{operation} {json.dumps(payload)}"
-    message = f"{service_padded}{data}"
-    message_len = len(message)
-    formatted_message = f"{message_len:05d}{message}".encode('utf-8')
+    formatted_message = protocol.format_request(SERVICE_NAME, data)
     
     sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
     try:
         sock.connect(BUS_ADDRESS)
         sock.sendall(formatted_message)
         
-        length_bytes = sock.recv(5)
-        if not length_bytes:
+        response = protocol.recv_response(sock)
+        if response is None:
             return None, None
         
-        amount_expected = int(length_bytes.decode('utf-8'))
-        data_received = b''
-        while len(data_received) < amount_expected:
-            chunk = sock.recv(amount_expected - len(data_received))
-            if not chunk:
-                break
-            data_received += chunk
-        
-        response_str = data_received.decode('utf-8')
-        status = response_str[5:7]
-        response_data = response_str[7:]
-        
-        return status, json.loads(response_data)
+        return response.status, response.json()
     except Exception as e:
         return None, None
     finally:
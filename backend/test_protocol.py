@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Pruebas del protocolo de tramas (common/protocol.py)
+Sistema PrestaLab SOA
+
+Cubren las respuestas tal como las entrega el soabus externo, que antepone
+su propio status al del servicio (NNNNNSSSSSOKOK@meta|DATOS).
+
+Uso:
+    python -m pytest test_protocol.py      (o: python test_protocol.py)
+"""
+
+import asyncio
+import json
+import os
+import socket
+import sys
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "services"))
+from common import compression, protocol
+
+
+def soabus_frames(frames: bytes) -> bytes:
+    """Tramas de respuesta de un servicio como las reenvía el soabus: con OK antes del status del servicio."""
+    out = []
+    offset = 0
+    prefix_len = protocol.SERVICE_LEN
+    while offset < len(frames):
+        length = protocol.parse_length(frames[offset:offset + protocol.HEADER_LEN])
+        body = frames[offset + protocol.HEADER_LEN:offset + protocol.HEADER_LEN + length]
+        out.append(protocol.encode_frame(body[:prefix_len] + b"OK" + body[prefix_len:]))
+        offset += protocol.HEADER_LEN + length
+    return b"".join(out)
+
+
+def read_blocking(frames: bytes):
+    left, right = socket.socketpair()
+    # Las tramas pueden no caber en el buffer del socket: se envían desde otro hilo
+    sender = threading.Thread(target=left.sendall, args=(frames,))
+    sender.start()
+    try:
+        return protocol.recv_response(right)
+    finally:
+        sender.join()
+        left.close()
+        right.close()
+
+
+def read_async(frames: bytes):
+    async def read():
+        reader = asyncio.StreamReader()
+        reader.feed_data(frames)
+        reader.feed_eof()
+        return await protocol.read_response(reader)
+    return asyncio.run(read())
+
+
+def test_soabus_compressed_response():
+    data = json.dumps({"items": list(range(2000))}).encode()
+    frame = protocol.format_response("prart", "OK", compression.compress(data, compression.ZLIB),
+                                     {"z": compression.ZLIB, "ro": "1"})
+    for read in (read_blocking, read_async):
+        response = read(soabus_frames(frame))
+        assert response.status == "OK"
+        assert response.meta == {"ro": "1"}
+        assert bytes(response.data) == data
+
+
+def test_soabus_keeps_service_status():
+    frame = protocol.format_response("regis", "NK", b'{"error":"Credenciales inv\\u00e1lidas"}', {"nc": "1"})
+    response = read_blocking(soabus_frames(frame))
+    assert response.status == "NK"
+    assert response.meta == {"nc": "1"}
+    assert response.json() == {"error": "Credenciales inválidas"}
+
+
+def test_soabus_multi_frame_response():
+    data = os.urandom(250_000)
+    frames = protocol.format_response("gerep", "OK", data, {"ct": "raw"})
+    for read in (read_blocking, read_async):
+        response = read(soabus_frames(frames))
+        assert response.status == "OK"
+        assert response.meta == {"ct": "raw"}
+        assert bytes(response.data) == data
+
+
+def test_status_without_meta_is_data():
+    # Sin bloque meta no se puede distinguir un status duplicado de DATOS: queda para el gateway
+    response = read_blocking(protocol.encode_frame(b"prartOKOK{}"))
+    assert response.status == "OK"
+    assert response.meta == {}
+    assert bytes(response.data) == b"OK{}"
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_") and callable(test):
+            test()
+            print(f"✅ {name}")
@@ -28,22 +28,139 @@
       payload: payload
     };
 
+    return postToGateway(GATEWAY_URL, requestBody);
+  }
+
+  /**
+   * Varias solicitudes en un solo request HTTP (POST /route/batch).
+   * El gateway las envía en paralelo al bus y responde un arreglo en el
+   * mismo orden: { status: 200, data } o { status: 4xx/5xx, error }.
+   * @param {Array<{service: string, operation: string, payload?: object}>} requests
+   */
+  async function sendBatchToGateway(requests) {
+    const requestBody = requests.map(({ service, operation, payload = {} }) => ({ service, operation, payload }));
+    // Si son lecturas, el gateway responde con ETag: la próxima vez se revalida con la
+    // respuesta anterior (guardada en sessionStorage) y un 304 no llega al bus
+    const cacheKey = `prestalab:batch:${JSON.stringify(requestBody)}`;
+    const stored = readStored(cacheKey);
+    const res = await fetchPost(`${GATEWAY_URL}/batch`, requestBody, stored ? { "If-None-Match": stored.etag } : {});
+    if (res.status === 304 && stored) {
+      return stored.data;
+    }
+    const responseData = await readGatewayResponse(res);
+    const etag = res.headers.get("ETag");
+    if (etag) {
+      writeStored(cacheKey, { etag, data: responseData });
+    }
+    return responseData;
+  }
+
+  function readStored(key) {
+    try { return JSON.parse(sessionStorage.getItem(key)); } catch { return null; }
+  }
+
+  function writeStored(key, value) {
+    // Sin espacio en sessionStorage simplemente no se revalida
+    try { sessionStorage.setItem(key, JSON.stringify(value)); } catch {}
+  }
+
+  /**
+   * Lectura por GET (/route/{service}/{operation}?payload=...). El navegador
+   * guarda la respuesta y la revalida con su ETag: si el servicio no cambió,
+   * el gateway responde 304 sin llamar al bus. Solo operaciones de lectura.
+   */
+  async function getFromGateway(service, operation, payload = {}) {
+    const query = new URLSearchParams({ payload: JSON.stringify(payload) }).toString();
+    const url = `${GATEWAY_URL}/${encodeURIComponent(service)}/${encodeURIComponent(operation)}?${query}`;
+    if (CFG.DEBUG_BUS) {
+      console.debug(`[Gateway→] ${url}`);
+    }
+    return readGatewayResponse(await fetch(url, { method: "GET", headers: authHeaders(), mode: "cors" }));
+  }
+
+  /**
+   * Descarga un archivo que genera un servicio (GET /download/{service}/{operation}).
+   * El gateway transmite los bytes tal cual (sin JSON ni base64) a medida que
+   * el servicio los produce. Retorna { blob, filename }.
+   * @param {object} params - Payload; viaja como parámetros de la URL
+   */
+  async function downloadFromGateway(service, operation, params = {}) {
+    const base = GATEWAY_URL.replace(/\/route\/?$/, "");
+    const query = new URLSearchParams(params).toString();
+    const url = `${base}/download/${encodeURIComponent(service)}/${encodeURIComponent(operation)}?${query}`;
+    if (CFG.DEBUG_BUS) {
+      console.debug(`[Gateway→] ${url}`);
+    }
+
+    const res = await fetch(url, { method: "GET", headers: authHeaders(), mode: "cors" });
+    if (!res.ok) {
+      const responseData = await res.json().catch(() => ({}));
+      const err = new Error(responseData.detail || res.statusText || "Error desconocido");
+      err.status = res.status;
+      err.payload = responseData;
+      throw err;
+    }
+
+    const disposition = res.headers.get("Content-Disposition") || "";
+    const match = disposition.match(/filename="?([^"]+)"?/);
+    return { blob: await res.blob(), filename: match ? match[1] : operation };
+  }
+
+  /**
+   * Eventos del usuario en tiempo real (GET /events, server-sent events).
+   * handlers: { notificacion, lista_espera, solicitud } -> función(data).
+   * EventSource reconecta solo si se corta la conexión. Retorna la conexión
+   * (close() la cierra) o null si no hay sesión.
+   */
+  function subscribeEvents(handlers = {}) {
+    const token = window.Auth?.getToken?.();
+    if (!token || typeof EventSource === "undefined") return null;
+    const base = GATEWAY_URL.replace(/\/route\/?$/, "");
+    // EventSource no permite headers: el token viaja en la URL
+    const source = new EventSource(`${base}/events?token=${encodeURIComponent(token)}`);
+    Object.entries(handlers).forEach(([type, handler]) => {
+      source.addEventListener(type, (ev) => {
+        let data = null;
+        try { data = JSON.parse(ev.data); } catch (e) { return; }
+        if (CFG.DEBUG_BUS) {
+          console.debug(`[Gateway←] evento ${type}`, data);
+        }
+        handler(data);
+      });
+    });
+    window.addEventListener("beforeunload", () => source.close());
+    return source;
+  }
+
+  // El gateway aplica los límites de tasa por token de sesión (sin token, por IP)
+  function authHeaders() {
+    const token = window.Auth?.getToken?.();
+    return token ? { "Authorization": `Bearer ${token}` } : {};
+  }
+
+  async function postToGateway(url, requestBody) {
+    return readGatewayResponse(await fetchPost(url, requestBody));
+  }
+
+  async function fetchPost(url, requestBody, headers = {}) {
     if (CFG.DEBUG_BUS) {
-      console.debug(`[Gateway→] ${GATEWAY_URL}`, requestBody);
+      console.debug(`[Gateway→] ${url}`, requestBody);
     }
 
-    const res = await fetch(GATEWAY_URL, {
+    return fetch(url, {
       method: "POST",
       headers: {
         "Content-Type": "application/json",
         "Accept": "application/json",
-        // Aquí se podría añadir un Token de autenticación si se implementara
-        // "Authorization": `Bearer ${window.Auth?.getToken?.()}`
+        ...authHeaders(),
+        ...headers,
       },
       body: JSON.stringify(requestBody),
       mode: "cors",
     });
+  }
 
+  async function readGatewayResponse(res) {
     const responseData = await res.json().catch(() => ({}));
 
     if (CFG.DEBUG_BUS) {
@@ -79,8 +196,8 @@
     updateSolicitud: (payload) => sendToGateway(S.AUTH, "update_solicitud", payload),
 
     // Servicio: prart (S.CATALOG)
-    getAllItems: (payload = {}) => sendToGateway(S.CATALOG, "get_all_items", payload),
-    searchItems: (payload) => sendToGateway(S.CATALOG, "search_items", payload),
+    getAllItems: (payload = {}) => getFromGateway(S.CATALOG, "get_all_items", payload),
+    searchItems: (payload) => getFromGateway(S.CATALOG, "search_items", payload),
     getSolicitudes: (payload) => sendToGateway(S.CATALOG, "get_solicitudes", payload),
     createSolicitud: (payload) => sendToGateway(S.CATALOG, "create_solicitud", payload),
     createReserva: (payload) => sendToGateway(S.CATALOG, "create_reserva", payload),
@@ -93,7 +210,7 @@
     // Servicio: lista (S.WAITLIST)
     createListaEspera: (payload) => sendToGateway(S.WAITLIST, "create_lista_espera", payload),
     updateListaEspera: (payload) => sendToGateway(S.WAITLIST, "update_lista_espera", payload),
-    getListaEspera: (payload) => sendToGateway(S.WAITLIST, "get_lista_espera", payload),
+    getListaEspera: (payload) => getFromGateway(S.WAITLIST, "get_lista_espera", payload),
 
     // Servicio: multa (S.FINES)
     getMultasUsuario: (payload) => sendToGateway(S.FINES, "get_multas_usuario", payload),
@@ -107,13 +224,27 @@
 
     // Servicio: gerep (S.REPORTS)
     getHistorial: (payload) => sendToGateway(S.REPORTS, "get_historial", payload),
+    // payload: { usuario_id, formato: "csv" | "pdf" } -> { blob, filename }
+    exportHistorial: (payload) => downloadFromGateway(S.REPORTS, "export_historial", payload),
     getReporteCirculacion: (payload) => sendToGateway(S.REPORTS, "get_reporte_circulacion", payload),
 
     // Servicio: sugit (S.SUGGESTIONS)
     registrarSugerencia: (payload) => sendToGateway(S.SUGGESTIONS, "registrar_sugerencia", payload),
     listarSugerencias: (payload = {}) => sendToGateway(S.SUGGESTIONS, "listar_sugerencias", payload),
     aprobarSugerencia: (payload) => sendToGateway(S.SUGGESTIONS, "aprobar_sugerencia", payload),
-    rechazarSugerencia: (payload) => sendToGateway(S.SUGGESTIONS, "rechazar_sugerencia", payload)
+    rechazarSugerencia: (payload) => sendToGateway(S.SUGGESTIONS, "rechazar_sugerencia", payload),
+
+    // Varias operaciones de un mismo servicio en una transacción (todo o nada)
+    // operations: [{ operation: "create_prestamo", payload: {...} }, ...]
+    batch: (service, operations) => sendToGateway(service, "batch", { operations }),
+
+    // Varias solicitudes (de cualquier servicio) en un solo request HTTP, sin transacción común
+    // requests: [{ service: S.AUTH, operation: "get_user", payload: {...} }, ...]
+    routeBatch: (requests) => sendBatchToGateway(requests),
+
+    // Eventos del usuario (notificaciones, posición en listas de espera, solicitudes)
+    // handlers: { notificacion: (data) => ..., lista_espera: ..., solicitud: ... }
+    events: (handlers) => subscribeEvents(handlers)
   };
   
   console.log("[API] Adaptador Gateway-TCP listo.", { GATEWAY: GATEWAY_URL, SERVICES: S });
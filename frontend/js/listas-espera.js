@@ -142,15 +142,21 @@
   }
 
   async function getQueueInfo(item_id) {
+    try {
+      const payload = { item_id: Number(item_id) };
+      return queueInfoFrom(item_id, await API.getListaEspera(payload));
+    } catch (e) {
+      return queueInfoFrom(item_id, null);
+    }
+  }
+
+  // det: respuesta de get_lista_espera para el ítem, o null si falló
+  function queueInfoFrom(item_id, det) {
     const map = getWaitMap();
     const remembered = map[String(item_id)] || null;
 
     try {
-      // ANTES: const det = await API.get(LIST, `/lista-espera/${item_id}`, { auth: true });
-      // AHORA:
-      const payload = { item_id: Number(item_id) };
-      const det = await API.getListaEspera(payload); // Llama a la nueva API
-      
+      if (!det) throw new Error('Sin lista de espera');
       const registros = arrayFirst(det); // Esto buscará det.registros
       const count = registros.length;
 
@@ -319,30 +325,35 @@
     hydrateVisibleQueues();
   }
 
-  // Concurrencia limitada (Sin cambios)
-  async function hydrateVisibleQueues(concurrency = 6) {
+  // Las colas de todas las tarjetas visibles en un solo request HTTP (POST /route/batch)
+  async function hydrateVisibleQueues() {
     const cards = Array.from(elList.querySelectorAll('.sol-card'));
-    let i = 0;
-    async function worker() {
-      while (i < cards.length) {
-        const card = cards[i++];
-        const itemId = card.getAttribute('data-item');
-        await enrichCardQueue(card, itemId);
-      }
+    if (!cards.length) return;
+    const itemIds = cards.map(card => card.getAttribute('data-item'));
+    let results = [];
+    try {
+      results = await API.routeBatch(itemIds.map(item_id => ({
+        service: LIST, operation: 'get_lista_espera', payload: { item_id: Number(item_id) }
+      })));
+    } catch (e) {
+      // Sin respuesta del gateway: las tarjetas quedan con la cola vacía
     }
-    const workers = Array.from({ length: Math.min(concurrency, cards.length) }, worker);
-    await Promise.all(workers);
+    cards.forEach((card, i) => {
+      const res = results[i];
+      renderCardQueue(card, itemIds[i], queueInfoFrom(itemIds[i], res && res.status === 200 ? res.data : null));
+    });
   }
 
-  // enrichCardQueue (Sin cambios)
   async function enrichCardQueue(cardEl, item_id) {
+    renderCardQueue(cardEl, item_id, await getQueueInfo(item_id));
+  }
+
+  function renderCardQueue(cardEl, item_id, { count, myPos, myRegId }) {
     const qCountEl = cardEl.querySelector('[data-qcount]');
     const qYouEl   = cardEl.querySelector('[data-qyou]');
     const joinBtn  = cardEl.querySelector('[data-join]');
     const leaveBtn = cardEl.querySelector('[data-leave]');
 
-    const { count, myPos, myRegId } = await getQueueInfo(item_id);
-
     qCountEl.textContent = `En cola: ${count === null ? '—' : count}`;
 
     if (myRegId) {
@@ -408,6 +419,17 @@
   // go!
   boot();
 
+  // La cola de un ítem cambió (alguien entró o salió): el evento trae la posición
+  // del usuario y el total, así que la tarjeta se actualiza sin volver a consultar
+  API.events({
+    lista_espera: (data) => {
+      const card = elList.querySelector(`.sol-card[data-item="${data.item_id}"]`);
+      if (!card) return;
+      if (!data.posicion) forgetJoin(String(data.item_id));
+      renderCardQueue(card, data.item_id, { count: data.total, myPos: data.posicion, myRegId: data.id || null });
+    }
+  });
+
   
   // ---------- init (LIMPIO Y CORRECTO) ----------
   // Este bloque estaba duplicado y con errores.
@@ -39,22 +39,27 @@
     }
 
     try {
-      // --- CAMBIO 1 ---
-      // ANTES: const userData = await API.get(AUTH_SERVICE, `/usuarios/${userId}`, { auth: true });
-      // AHORA:
-      const userData = await API.getUser({ id: userId });
-      
+      // Usuario y preferencias en un solo request HTTP (el gateway los pide en paralelo)
+      const [userRes, prefsRes] = await API.routeBatch([
+        { service: AUTH_SERVICE, operation: 'get_user', payload: { id: userId } },
+        { service: NOTIS_SERVICE, operation: 'get_preferencias', payload: { usuario_id: userId } },
+      ]);
+      if (userRes.status !== 200) {
+        return show(userRes.error || 'No se pudieron cargar los datos del perfil.', false);
+      }
+
+      const userData = userRes.data;
       if (userData) {
         elCorreo.value = userData.correo || '';
         elNombre.value = userData.nombre || '';
         elTelefono.value = userData.telefono || '';
       }
 
-      // --- CAMBIO 2 ---
-      // ANTES: const prefsData = await API.get(NOTIS_SERVICE, `/preferencias/${userId}`, { auth: true });
-      // AHORA:
-      const prefsData = await API.getPreferencias({ usuario_id: userId });
+      if (prefsRes.status !== 200) {
+        return show(prefsRes.error || 'No se pudieron cargar los datos del perfil.', false);
+      }
 
+      const prefsData = prefsRes.data;
       if (prefsData?.preferencias_notificacion) {
         const prefValue = prefsData.preferencias_notificacion;
         const radio = form.querySelector(`input[name="notifPref"][value="${prefValue}"]`);
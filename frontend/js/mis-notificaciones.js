@@ -15,6 +15,24 @@
     stateEl.style.background = ok ? 'rgba(34,197,94,0.08)' : 'rgba(239,68,68,0.08)';
   };
   
+  function notificationItem(notif) {
+    const item = document.createElement('li');
+    item.className = 'notification-item';
+    // Datos que vienen del servidor: se insertan como texto, no como HTML
+    const meta = document.createElement('small');
+    meta.textContent = `${notif.tipo} - ${new Date(notif.registro_instante).toLocaleString()}`;
+    const mensaje = document.createElement('p');
+    mensaje.style.margin = '0.25rem 0 0';
+    mensaje.textContent = notif.mensaje;
+    item.append(meta, mensaje);
+    return item;
+  }
+
+  function prependNotification(notif) {
+    if (!listEl.querySelector('.notification-item')) listEl.innerHTML = '';
+    listEl.prepend(notificationItem(notif));
+  }
+
   async function loadNotifications() {
     const userId = window.Auth?.getUserId?.();
     if (!userId) {
@@ -41,15 +59,7 @@
 
       if (Array.isArray(notifications) && notifications.length > 0) {
         listEl.innerHTML = '';
-        notifications.forEach(notif => {
-          const item = document.createElement('li');
-          item.className = 'notification-item';
-          item.innerHTML = `
-            <small>${notif.tipo} - ${new Date(notif.registro_instante).toLocaleString()}</small>
-            <p style="margin: 0.25rem 0 0;">${notif.mensaje}</p>
-          `;
-          listEl.appendChild(item);
-        });
+        notifications.forEach(notif => listEl.appendChild(notificationItem(notif)));
       } else {
         listEl.innerHTML = '<li>No tienes notificaciones.</li>';
       }
@@ -66,5 +76,7 @@
     document.getElementById('btnLogout')?.addEventListener('click', () => window.Auth.logout());
     
     loadNotifications();
+    // Notificaciones nuevas llegan por el canal de eventos del gateway
+    API.events({ notificacion: prependNotification });
   })();
 })();
\ No newline at end of file
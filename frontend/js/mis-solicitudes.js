@@ -183,5 +183,7 @@
     document.getElementById("userBadge").textContent = user?.correo || "Usuario";
     document.getElementById("btnLogout").addEventListener("click", () => window.Auth.logout());
     buscarSolicitudes();
+    // Una solicitud cambió de estado: se recarga el listado
+    API.events({ solicitud: () => buscarSolicitudes() });
   })();
 })();
\ No newline at end of file
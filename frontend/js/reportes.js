@@ -149,24 +149,18 @@
         usuario_id: Number(userId),
         formato: format
       };
-      // Llamar a la API
-      const data = await API.getHistorial(payload);
+      // El gateway transmite el archivo tal cual (GET /download), sin base64
+      const { blob, filename } = await API.exportHistorial(payload);
 
-      // El servicio 'gerep' devuelve JSON con 'filename' y 'content' (base64)
-      //
-      if (data && data.content && data.filename) {
-        // Crear un link de descarga desde el base64
-        const link = document.createElement('a');
-        const mimeType = format === 'pdf' ? 'application/pdf' : 'text/csv';
-        link.href = `data:${mimeType};base64,${data.content}`;
-        link.download = data.filename;
-        document.body.appendChild(link);
-        link.click();
-        document.body.removeChild(link);
-        clearMsg();
-      } else {
-        throw new Error("La respuesta del servicio no tiene el formato de archivo esperado.");
-      }
+      const href = URL.createObjectURL(blob);
+      const link = document.createElement('a');
+      link.href = href;
+      link.download = filename;
+      document.body.appendChild(link);
+      link.click();
+      document.body.removeChild(link);
+      setTimeout(() => URL.revokeObjectURL(href), 1000);
+      clearMsg();
     } catch (e) {
       show(e?.payload?.detail || e?.message || 'No se pudo descargar el archivo.', false);
     }
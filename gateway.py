@@ -1,13 +1,82 @@
 # gateway.py (VERSIÓN ROBUSTA FINAL)
-import socket
+import asyncio
+import gzip
 import json
+import math
+import os
+import sys
+import time
+from contextlib import asynccontextmanager
+from typing import List, NamedTuple
 import uvicorn
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
+from fastapi import FastAPI, HTTPException, Request, Response
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, field_validator
 from fastapi.middleware.cors import CORSMiddleware
 
+# El protocolo y el cliente del bus se comparten con los servicios
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend", "services"))
+from common import codec, compression, deadline, events, metrics, protocol, session
+from common.breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreakers, CircuitOpenError
+from common.cache import ResponseCache, SingleFlight, parse_dependencies
+from common.ratelimit import MemoryBucketStore, Quota, RateLimiter, parse_rules
+from common.client import BusPool, MultiplexedBusClient
+from common.log import get_logger, truncate
+from common.runtime import BUSY_ERROR
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
 # --- Configuración ---
-BUS_ADDRESS = ('localhost', 5000)
+BUS_ADDRESS = (os.getenv("BUS_HOST", "localhost"), int(os.getenv("BUS_PORT", "5000")))
+BUS_TIMEOUT = float(os.getenv("BUS_TIMEOUT", "15"))
+BUS_POOL_SIZE = int(os.getenv("BUS_POOL_SIZE", "32"))
+# BUS_MULTIPLEX=1: pocas conexiones con muchas transacciones en vuelo (requiere el bus local)
+BUS_MULTIPLEX = os.getenv("BUS_MULTIPLEX", "0") == "1"
+BUS_CONNECTIONS = int(os.getenv("BUS_CONNECTIONS", "2"))
+BUS_MAX_IN_FLIGHT = int(os.getenv("BUS_MAX_IN_FLIGHT", "256"))
+# Codecs y compresión que el gateway acepta en las respuestas del bus
+BUS_REQUEST_META = {"accept": codec.accept_header(), "az": compression.accept_header()}
+# Caché de lecturas (GATEWAY_CACHE_TTL=0 la desactiva)
+CACHE_TTL = float(os.getenv("GATEWAY_CACHE_TTL", "10"))
+CACHE_MAX_ENTRIES = int(os.getenv("GATEWAY_CACHE_SIZE", "1000"))
+# Servicios cuyas lecturas invalida una escritura en otro (escritor:lector+lector, ...)
+CACHE_DEPENDS = os.getenv(
+    "GATEWAY_CACHE_DEPENDS",
+    "regist:prart+gerep+lista+multa+notis+sugit,prart:gerep+lista+multa,"
+    "multa:regist+prart+gerep+notis+sugit,notis:regist+prart+gerep+multa+sugit",
+)
+# Lecturas idénticas concurrentes comparten una transacción al bus (0 lo desactiva)
+SINGLE_FLIGHT = os.getenv("GATEWAY_SINGLE_FLIGHT", "1") == "1"
+# Operaciones que se pueden leer con GET /route/{servicio}/{operación}: listados sin datos privados
+GET_OPERATIONS = os.getenv("GATEWAY_GET_OPERATIONS", "prart.get_all_items,prart.search_items,lista.get_lista_espera")
+# Solicitudes como máximo en POST /route/batch
+BATCH_MAX_REQUESTS = int(os.getenv("GATEWAY_BATCH_MAX", "50"))
+# Circuit breaker por servicio: fallos consecutivos que lo abren (0 lo desactiva) y segundos abierto
+BREAKER_FAILURES = int(os.getenv("GATEWAY_BREAKER_FAILURES", "5"))
+BREAKER_RESET = float(os.getenv("GATEWAY_BREAKER_RESET", "10"))
+# Límites de tasa (token bucket): cuota general por cliente ("" la desactiva) y reglas por operación
+RATE_LIMIT_CLIENT = os.getenv("GATEWAY_RATE_CLIENT", "100/1")
+RATE_LIMIT_RULES = os.getenv(
+    "GATEWAY_RATE_RULES",
+    "regist.login:10/60,regist.get_all_emails:5/60,"
+    "gerep.get_historial?formato=pdf:5/60,gerep.export_historial?formato=pdf:5/60",
+)
+# Server-sent events (GET /events): segundos entre pings y eventos pendientes por conexión
+EVENTS_PING = float(os.getenv("GATEWAY_EVENTS_PING", "15"))
+EVENTS_QUEUE_SIZE = int(os.getenv("GATEWAY_EVENTS_QUEUE", "100"))
+# ETag de lecturas: segundos de vigencia de la versión de un servicio (0 los desactiva)
+ETAG_TTL = float(os.getenv("GATEWAY_ETAG_TTL", "60"))
+# Compresión HTTP (brotli si está instalado y el cliente lo acepta, si no gzip)
+HTTP_COMPRESS_MIN_BYTES = int(os.getenv("GATEWAY_COMPRESS_MIN", "1024"))
+GZIP_LEVEL = int(os.getenv("GATEWAY_GZIP_LEVEL", "5"))
+BROTLI_QUALITY = int(os.getenv("GATEWAY_BROTLI_QUALITY", "4"))
+# Operaciones que se pueden pedir con GET /download/{servicio}/{operación}: exportaciones de archivos
+DOWNLOAD_OPERATIONS = os.getenv("GATEWAY_DOWNLOAD_OPERATIONS", "gerep.export_historial")
+# Tamaño de los bloques que GET /download escribe en la respuesta HTTP
+DOWNLOAD_BLOCK_SIZE = int(os.getenv("GATEWAY_DOWNLOAD_BLOCK", str(64 * 1024)))
 
 # --- Modelo de datos ---
 class BusRequest(BaseModel):
@@ -15,99 +84,710 @@ class BusRequest(BaseModel):
     operation: str
     payload: dict
 
+    @field_validator("service")
+    @classmethod
+    def bus_service_name(cls, service: str) -> str:
+        # El bus usa los 5 primeros caracteres: caché, single-flight, breakers y límites usan el mismo nombre
+        return protocol.service_name(service)
+
+def parse_operations(text: str) -> set:
+    """"servicio.operación, ..." -> {(servicio como lo ve el bus, operación)}."""
+    return {(protocol.service_name(name.partition(".")[0]), name.partition(".")[2])
+            for name in filter(None, (part.strip() for part in text.split(",")))}
+
+# --- Métricas (GET /metrics) ---
+http_requests = metrics.Counter("gateway_http_requests_total", "Requests HTTP por ruta, método y status",
+                                ("route", "method", "status"))
+http_latency = metrics.Histogram("gateway_http_request_duration_seconds",
+                                 "Latencia de los requests HTTP hasta los headers de la respuesta", ("route", "method"))
+operation_requests = metrics.Counter("gateway_operation_requests_total",
+                                     "Transacciones por servicio, operación y status HTTP", ("service", "operation", "status"))
+operation_latency = metrics.Histogram("gateway_operation_duration_seconds",
+                                      "Latencia por servicio y operación, incluidas caché, single-flight y 304",
+                                      ("service", "operation"))
+bus_timings = metrics.Histogram("gateway_bus_phase_seconds",
+                                "Duración de cada fase de las transacciones al bus (pool, connect, send, wait, parse)",
+                                ("service", "phase"))
+
 # --- App ---
-app = FastAPI()
+if BUS_MULTIPLEX:
+    bus_pool = MultiplexedBusClient(BUS_ADDRESS, connections=BUS_CONNECTIONS, max_in_flight=BUS_MAX_IN_FLIGHT,
+                                    timings=bus_timings)
+else:
+    bus_pool = BusPool(BUS_ADDRESS, size=BUS_POOL_SIZE, timings=bus_timings)
+# La caché, el single-flight, los breakers, los límites de tasa, los eventos y las métricas
+# solo se usan desde el event loop del gateway (un solo hilo), así que no llevan locks
+get_operations = parse_operations(GET_OPERATIONS)
+download_operations = parse_operations(DOWNLOAD_OPERATIONS)
+response_cache = ResponseCache(CACHE_MAX_ENTRIES, CACHE_TTL, ETAG_TTL, parse_dependencies(CACHE_DEPENDS))
+single_flight = SingleFlight()
+breakers = CircuitBreakers(BREAKER_FAILURES, BREAKER_RESET)
+event_hub = events.EventHub(EVENTS_QUEUE_SIZE)
+# MemoryBucketStore vive en este proceso; con varias instancias del gateway se reemplaza por un store compartido
+rate_limiter = RateLimiter(MemoryBucketStore(), Quota.parse(RATE_LIMIT_CLIENT) if RATE_LIMIT_CLIENT else None,
+                           parse_rules(RATE_LIMIT_RULES))
+log = get_logger("gateway")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    health_checks = asyncio.create_task(bus_pool.run_health_checks())
+    yield
+    health_checks.cancel()
+    await bus_pool.close()
+
+app = FastAPI(lifespan=lifespan)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"], 
     allow_credentials=True,
     allow_methods=["*"], 
     allow_headers=["*"], 
+    # El frontend lee el nombre de archivo de las descargas (GET /download) y el ETag de /route/batch
+    expose_headers=["Content-Disposition", "ETag"],
 )
 
+class MetricsMiddleware:
+    """
+    Cuenta cada request HTTP por ruta (la plantilla, no la URL), método y
+    status, y mide su latencia hasta que salen los headers (en descargas y
+    eventos, el tiempo hasta el primer byte). Si el endpoint anotó la
+    operación (request.state.operation), la registra también por servicio
+    y operación.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        started = time.perf_counter()
+        recorded = False
+
+        def record(status: int):
+            nonlocal recorded
+            recorded = True
+            elapsed = time.perf_counter() - started
+            route = getattr(scope.get("route"), "path", "-")
+            http_requests.inc(route, scope["method"], status)
+            http_latency.observe(elapsed, route, scope["method"])
+            operation = scope.get("state", {}).get("operation")
+            if operation is not None:
+                record_operation(operation[0], operation[1], status, elapsed)
+
+        async def send_with_metrics(message):
+            if message["type"] == "http.response.start" and not recorded:
+                record(message["status"])
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_metrics)
+        except Exception:
+            if not recorded:
+                record(500)
+            raise
+
+app.add_middleware(MetricsMiddleware)
+
 # --- Helpers ---
-def format_tcp_request(service: str, operation: str, payload: dict) -> bytes:
-    service_padded = service.ljust(5)[:5]
-    data_str = f"{operation} {json.dumps(payload)}"
-    message = f"{service_padded}{data_str}"
-    message_len = len(message)
-    formatted_message = f"{message_len:05d}{message}"
-    print(f"[Gateway] Solicitud TCP ->: {formatted_message!r}")
-    return formatted_message.encode('utf-8')
-
-def parse_tcp_response(response: bytes) -> dict:
+def format_tcp_request(service: str, operation: str, payload: dict) -> str:
+    """Arma DATOS (operación + JSON); el cliente del bus agrega el encabezado."""
+    message_data = f"{operation} {json.dumps(payload)}"
+    if log.debug_enabled(f"{service}.{operation}"):
+        log.debug("Solicitud TCP ->", op=f"{service}.{operation}", data=truncate(message_data))
+    return message_data
+
+def service_unavailable(error_msg) -> bool:
+    """NK del bus en que el servicio no atendió la transacción: sin proveedor registrado o conexión cerrada."""
+    return isinstance(error_msg, str) and (error_msg.startswith("Servicio no disponible") or "cerró la conexión" in error_msg)
+
+def service_error(error_msg) -> HTTPException:
+    """
+    Error HTTP para un NK del servicio. "busy" (cola del servicio llena) es
+    503 para que el cliente reintente; un servicio caído también es 503,
+    con el Retry-After del circuit breaker, como cuando el circuito se abre.
+    """
+    if error_msg == BUSY_ERROR:
+        return HTTPException(status_code=503, detail=error_msg, headers={"Retry-After": "1"})
+    if error_msg == deadline.EXPIRED_ERROR:
+        return HTTPException(status_code=504, detail=error_msg)
+    if service_unavailable(error_msg):
+        return HTTPException(status_code=503, detail=error_msg, headers=retry_after(BREAKER_RESET))
+    return HTTPException(status_code=400, detail=error_msg)
+
+
+def parse_tcp_response(response: protocol.Message, operation: str = "") -> dict:
+    """Interpreta una respuesta del bus ya reensamblada (puede venir en varias tramas)."""
+    content_type = response.meta.get("ct", codec.JSON)
+    if content_type != codec.JSON:
+        # Codec binario: sin "double OK" ni texto que corregir
+        parsed_data = codec.loads(response.data, content_type)
+        if response.status == "NK":
+            error_msg = parsed_data.get("error") if isinstance(parsed_data, dict) else str(parsed_data)
+            log.info("Error del servicio", service=response.service, op=operation, error=error_msg)
+            raise service_error(error_msg)
+        return parsed_data
+
     try:
-        response_str = response.decode('utf-8')
+        data_raw = response.text()
     except UnicodeDecodeError:
         # Fallback para datos binarios (como PDFs) si los hubiera
-        response_str = response.decode('latin-1')
+        data_raw = str(response.data, 'latin-1')
 
-    print(f"[Gateway] Respuesta TCP <-: {response_str!r}")
-    
     # Protocolo: NNNNNSSSSSSTDATOS
-    # NNNNN (0-5), SSSSS (5-10), ST (10-12), DATOS (12-end)
-    service_name = response_str[5:10].strip()
-    status = response_str[10:12]     # ej: "OK" o "NK"
-    data_raw = response_str[12:]     # ej: 'OK{"message":...}' o '{"message":...}'
+    service_name = response.service
+    status = response.status         # ej: "OK" o "NK"
+    if log.debug_enabled(f"{service_name}.{operation}"):
+        log.debug("Respuesta TCP <-", op=f"{service_name}.{operation}", status=status, data=truncate(data_raw))
+    # data_raw ej: 'OK{"message":...}' o '{"message":...}'
     
     # --- CORRECCIÓN CRÍTICA PARA EL "DOUBLE OK" ---
     # Si los datos empiezan con el mismo status (ej. OKOK...), lo quitamos.
     if data_raw.startswith(status):
-        print(f"[Gateway] ¡AVISO! Status duplicado detectado ('{status}'). Corrigiendo...")
+        log.warning("Status duplicado detectado. Corrigiendo...", service=service_name, status=status)
         data_raw = data_raw[len(status):]
     # -----------------------------------------------
 
     try:
         parsed_data = json.loads(data_raw)
     except json.JSONDecodeError as e:
-        print(f"[Gateway] Error al parsear JSON: {e}")
+        log.warning("Error al parsear JSON", service=service_name, error=e)
         # Si falla, devolvemos el texto crudo para depuración
         parsed_data = {"error": "Respuesta no es JSON válido", "raw_response": data_raw}
 
     if status == "NK":
         # Extraer mensaje de error si existe
         error_msg = parsed_data.get("error", data_raw) if isinstance(parsed_data, dict) else data_raw
-        print(f"[Gateway] Error del servicio {service_name}: {error_msg}")
-        raise HTTPException(status_code=400, detail=error_msg)
+        log.info("Error del servicio", service=service_name, op=operation, error=error_msg)
+        raise service_error(error_msg)
 
     return parsed_data
 
-# --- Endpoint ---
+def raw_json_body(response: protocol.Message, operation: str = ""):
+    """
+    Camino rápido: DATOS de una respuesta OK en JSON, listos para ir tal cual
+    como cuerpo HTTP, sin decodificar ni volver a serializar. Solo revisa el
+    status, el codec y el primer byte; retorna None si la respuesta necesita
+    parse_tcp_response (NK, msgpack o datos que no parecen JSON).
+    """
+    if response.status != "OK" or response.meta.get("ct", codec.JSON) != codec.JSON:
+        return None
+    data = response.data
+    if data[:2] == b"OK":
+        log.warning("Status duplicado detectado. Corrigiendo...", service=response.service, status=response.status)
+        data = data[2:]
+    if data[:1] not in (b"{", b"["):
+        return None
+    if log.debug_enabled(f"{response.service}.{operation}"):
+        log.debug("Respuesta TCP <-", op=f"{response.service}.{operation}", status=response.status,
+                  data=truncate(str(data[:200], protocol.ENCODING, "replace")))
+    return bytes(data)
+
+def accepts_msgpack(http_request: Request) -> bool:
+    return codec.MEDIA_TYPES[codec.MSGPACK] in http_request.headers.get("accept", "")
+
+def record_operation(service: str, operation: str, status: int, elapsed: float):
+    operation_requests.inc(service, operation, status)
+    operation_latency.observe(elapsed, service, operation)
+
+def unavailable_error(response: protocol.Message):
+    """
+    Error de un NK que indica que el servicio no atendió la transacción
+    (sin proveedor en el bus, conexión cerrada o plazo vencido), o None si
+    el servicio respondió, aunque sea con un error de negocio o "busy".
+    """
+    if response.status != "NK" or response.meta.get("ct", codec.JSON) != codec.JSON:
+        return None
+    try:
+        error = response.json().get("error", "")
+    except (ValueError, AttributeError):
+        return None
+    if error == deadline.EXPIRED_ERROR or service_unavailable(error):
+        return error
+    return None
+
+async def call_bus(request: BusRequest, read_only: bool = False) -> protocol.Message:
+    """
+    Una transacción al bus, sin caché. Con read_only el servicio rechaza las
+    escrituras. Pasa por el circuit breaker del servicio: si está abierto
+    lanza CircuitOpenError sin enviar nada.
+    """
+    breaker = breakers.get(request.service)
+    breaker.before_call()
+    message_data = format_tcp_request(request.service, request.operation, request.payload)
+    # Los servicios eligen codec y compresión de cada respuesta entre los que el gateway acepta
+    meta = dict(BUS_REQUEST_META, ro="1") if read_only else BUS_REQUEST_META
+    try:
+        response = await bus_pool.request(request.service, message_data, timeout=BUS_TIMEOUT,
+                                          meta=deadline.stamp(meta, BUS_TIMEOUT))
+    except asyncio.CancelledError:
+        breaker.abandon()
+        raise
+    except Exception as e:
+        # Timeout, conexión rechazada o cortada, trama inválida
+        breaker.record(False, type(e).__name__)
+        raise
+    error = unavailable_error(response)
+    breaker.record(error is None, error)
+    if events.EVENTS_KEY in response.meta:
+        event_hub.publish(events.decode(response.meta[events.EVENTS_KEY]))
+    return response
+
+async def send_to_bus(request: BusRequest, generation: int, read_only: bool = False) -> protocol.Message:
+    """Envía la transacción y actualiza la caché según si la respuesta es de solo lectura (ro=1)."""
+    service, operation = request.service, request.operation
+    response = await call_bus(request, read_only)
+    if response.meta.get("ro") == "1" and response.meta.get("nc") == "1":
+        # Lectura que no se guarda (login): tampoco invalida
+        response_cache.learn(service, operation, cacheable=False)
+    elif response.meta.get("ro") == "1":
+        response_cache.learn(service, operation)
+        # Los archivos (ct=raw) no se guardan: pueden ser grandes y se piden por partes
+        if response.status == "OK" and response.meta.get("ct") != codec.RAW:
+            response_cache.put(response_cache.key(service, operation, request.payload), response, generation)
+    elif not operation.startswith("_"):
+        response_cache.invalidate(service)
+    return response
+
+async def request_bus(request: BusRequest) -> protocol.Message:
+    """
+    Envía la transacción al bus pasando por la caché de lecturas.
+    Una respuesta sin ro=1 (escritura) invalida la caché del servicio y la
+    de los que dependen de él; la invalidación aumenta la generación, así
+    que una lectura en curso no guarda un resultado anterior a la escritura.
+    No se invalida antes de enviar: una lectura que el gateway aún no vio
+    (por ejemplo, tras reiniciarse) no debe vaciar la caché. Las internas
+    (_stats, _runtime) y las lecturas marcadas nc=1 no pasan por la caché.
+    Las lecturas ya conocidas e idénticas concurrentes comparten una sola
+    transacción (single-flight).
+    """
+    service, operation = request.service, request.operation
+    if operation.startswith("_") or response_cache.is_uncacheable(service, operation):
+        return await send_to_bus(request, response_cache.generation(service))
+    if not response_cache.is_read_only(service, operation):
+        return await send_to_bus(request, response_cache.generation(service))
+
+    key = response_cache.key(service, operation, request.payload)
+    if response_cache.enabled:
+        cached = response_cache.get(key)
+        if cached is not None:
+            return cached
+    generation = response_cache.generation(service)
+    if not SINGLE_FLIGHT:
+        return await send_to_bus(request, generation)
+    # Con la generación en la clave, una lectura posterior a una escritura no se une a una anterior
+    return await single_flight.run((generation,) + key, lambda: send_to_bus(request, generation))
+
+def retry_after(seconds: float) -> dict:
+    return {"Retry-After": str(max(math.ceil(seconds), 1))}
+
+# Operaciones sin sesión: sus límites se cuentan siempre por IP, aunque llegue un token
+PUBLIC_OPERATIONS = {("regis", "login"), ("regis", "register")}
+
+class RateClient(NamedTuple):
+    """Claves de un cliente para los límites de tasa."""
+    key: str   # usuario del token de sesión (ya verificado), o la IP si no hay uno válido
+    ip: str
+
+    def for_operation(self, request: BusRequest) -> str:
+        return self.ip if (request.service, request.operation) in PUBLIC_OPERATIONS else self.key
+
+def client_id(http_request: Request) -> RateClient:
+    """
+    Cliente para los límites de tasa. Un token se usa como clave solo si
+    session_user() lo acepta: con tokens inventados en cada request el
+    cliente sigue contando en el bucket de su IP.
+    """
+    ip = f"ip:{http_request.client.host if http_request.client else '-'}"
+    authorization = http_request.headers.get("authorization", "")
+    scheme, _, token = authorization.partition(" ")
+    usuario_id = session_user(token.strip()) if scheme.lower() == "bearer" else None
+    return RateClient(f"user:{usuario_id}" if usuario_id is not None else ip, ip)
+
+def too_many_requests(wait: float) -> HTTPException:
+    return HTTPException(status_code=429, detail="Demasiadas solicitudes, intenta más tarde", headers=retry_after(wait))
+
+async def check_rate(request: BusRequest, client: RateClient):
+    """429 (antes de cualquier trabajo en el bus) si el cliente agotó su cuota general o la de la operación."""
+    wait = (await rate_limiter.check_client(client.key)
+            or await rate_limiter.check_operation(client.for_operation(request), request.service, request.operation,
+                                                  request.payload))
+    if wait:
+        raise too_many_requests(wait)
+
+def http_error(request: BusRequest, error: Exception) -> HTTPException:
+    """Traduce un error al hablar con el bus (o un NK ya traducido) a su respuesta HTTP."""
+    if isinstance(error, HTTPException):
+        return error
+    if isinstance(error, CircuitOpenError):
+        return HTTPException(status_code=503, detail=str(error), headers=retry_after(error.retry_after))
+    if isinstance(error, ConnectionRefusedError):
+        return HTTPException(status_code=503, detail="No se pudo conectar al Bus SOA (localhost:5000). ¿Está encendido?")
+    if isinstance(error, asyncio.TimeoutError):
+        return HTTPException(status_code=504, detail="Timeout esperando respuesta del Bus SOA.")
+    if isinstance(error, ConnectionResetError):
+        return HTTPException(status_code=502, detail="El Bus SOA cerró la conexión inesperadamente.")
+    log.exception("Error interno", service=request.service, op=request.operation, error=error)
+    return HTTPException(status_code=500, detail=str(error))
+
+def accepted_encodings(http_request: Request) -> set:
+    """Codificaciones de Accept-Encoding, sin las marcadas con q=0."""
+    encodings = set()
+    for part in http_request.headers.get("accept-encoding", "").split(","):
+        name, _, params = part.partition(";")
+        params = params.replace(" ", "")
+        if params.startswith("q="):
+            try:
+                if float(params[2:]) <= 0:
+                    continue
+            except ValueError:
+                continue
+        if name.strip():
+            encodings.add(name.strip().lower())
+    return encodings
+
+def compress_body(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, GZIP_LEVEL)
+
+async def http_response(body: bytes, http_request: Request, media_type: str, headers: dict = None) -> Response:
+    """
+    Respuesta HTTP con el cuerpo comprimido (brotli o gzip) si supera
+    GATEWAY_COMPRESS_MIN bytes y el cliente lo acepta. Los cuerpos grandes
+    se comprimen en un thread (zlib y brotli liberan el GIL) para no
+    detener el event loop.
+    """
+    headers = dict(headers or {})
+    if len(body) >= HTTP_COMPRESS_MIN_BYTES:
+        headers["Vary"] = "Accept-Encoding"
+        accepted = accepted_encodings(http_request)
+        encoding = "br" if brotli and "br" in accepted else "gzip" if "gzip" in accepted else None
+        if encoding:
+            if len(body) > 64 * 1024:
+                body = await asyncio.to_thread(compress_body, body, encoding)
+            else:
+                body = compress_body(body, encoding)
+            headers["Content-Encoding"] = encoding
+    return Response(body, media_type=media_type, headers=headers)
+
+def version_headers(version) -> dict:
+    # ETag débil: el cuerpo puede ir comprimido o no. no-cache: el navegador revalida cada vez
+    return {"ETag": f'W/"{version}"', "Cache-Control": "no-cache"} if version else {}
+
+def etag_headers(response: protocol.Message, version) -> dict:
+    """
+    ETag de una lectura OK, con la versión del servicio tomada antes de
+    enviar la transacción: si una escritura la invalida mientras tanto, la
+    próxima revalidación no coincide.
+    """
+    if response.status != "OK" or response.meta.get("ro") != "1" or response.meta.get("nc") == "1":
+        return {}
+    return version_headers(version)
+
+def read_version(requests: List[BusRequest]):
+    """
+    Versión de los datos que leen las solicitudes (la de su servicio, o la
+    combinación de varios), o None si alguna no es una lectura conocida.
+    """
+    if not all(response_cache.is_read_only(request.service, request.operation) for request in requests):
+        return None
+    versions = [response_cache.version(service) for service in sorted({request.service for request in requests})]
+    return "+".join(versions) if versions and None not in versions else None
+
+def not_modified(requests: List[BusRequest], http_request: Request):
+    """304 si las solicitudes son lecturas y el ETag del cliente es la versión vigente; si no, None."""
+    version = read_version(requests)
+    if not response_cache.matches(version, http_request.headers.get("if-none-match")):
+        return None
+    return Response(status_code=304, headers=version_headers(version))
+
+async def route_response(request: BusRequest, response: protocol.Message, http_request: Request, version) -> Response:
+    """Respuesta HTTP de /route para la respuesta del bus (o HTTPException si es NK)."""
+    headers = etag_headers(response, version)
+    body = raw_json_body(response, request.operation)
+    if body is not None:
+        return await http_response(body, http_request, codec.MEDIA_TYPES[codec.JSON], headers)
+    content_type = response.meta.get("ct", codec.JSON)
+    if content_type == codec.RAW and response.status == "OK":
+        # Un archivo: solo su primera parte; el archivo completo se pide con GET /download
+        return Response(bytes(response.data), media_type=response.meta.get("mt"),
+                        headers=download_headers(response))
+    if content_type != codec.JSON and response.status == "OK" and accepts_msgpack(http_request):
+        # El cliente HTTP entiende msgpack: se reenvía sin transcodificar
+        return await http_response(bytes(response.data), http_request, codec.MEDIA_TYPES[content_type], headers)
+    # NK (lanza la HTTPException) o transcodificación a JSON (los bytes quedan en base64, como antes)
+    parsed_data = parse_tcp_response(response, request.operation)
+    return await http_response(codec.dumps(parsed_data), http_request, codec.MEDIA_TYPES[codec.JSON], headers)
+
+# --- Endpoints ---
 @app.post("/route")
-async def proxy_route(request: BusRequest):
-    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    sock.settimeout(15.0) 
+async def proxy_route(request: BusRequest, http_request: Request):
+    http_request.state.operation = (request.service, request.operation)
+    try:
+        await check_rate(request, client_id(http_request))
+        cached = not_modified([request], http_request)
+        if cached is not None:
+            return cached
+        version = response_cache.version(request.service)
+        response = await request_bus(request)
+        return await route_response(request, response, http_request, version)
+
+    except Exception as e:
+        raise http_error(request, e)
+
+@app.get("/route/{service}/{operation}")
+async def proxy_route_read(service: str, operation: str, http_request: Request, payload: str = "{}"):
+    """
+    Lectura por GET (payload como JSON en el parámetro payload), para que el
+    navegador guarde la respuesta y la revalide con If-None-Match: si la
+    versión del servicio no cambió, el gateway responde 304 sin llamar al
+    bus. Solo las operaciones de GATEWAY_GET_OPERATIONS (listados): los
+    parámetros de la URL quedan en logs y en el historial del navegador.
+    Además el servicio rechaza las que no son read_only.
+    """
+    service = protocol.service_name(service)
+    http_request.state.operation = (service, operation)
+    if (service, operation) not in get_operations:
+        raise HTTPException(status_code=405, detail=f"La operación {operation} no se puede consultar por GET; usa POST /route",
+                            headers={"Allow": "POST"})
+    try:
+        request = BusRequest(service=service, operation=operation, payload=json.loads(payload))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="payload debe ser un objeto JSON")
+    try:
+        await check_rate(request, client_id(http_request))
+        cached = not_modified([request], http_request)
+        if cached is not None:
+            return cached
+        version = response_cache.version(service)
+        if response_cache.is_read_only(service, operation):
+            response = await request_bus(request)
+        else:
+            # Operación aún no vista: ro=1 en la solicitud para que el servicio no ejecute una escritura
+            response = await send_to_bus(request, response_cache.generation(service), read_only=True)
+        return await route_response(request, response, http_request, version)
+
+    except Exception as e:
+        raise http_error(request, e)
+
+async def route_batch_item(request: BusRequest, client: RateClient):
+    """Resultado de una solicitud del batch: (status HTTP, JSON con los datos o el error)."""
+    started = time.perf_counter()
+    status, body = await batch_item_result(request, client)
+    record_operation(request.service, request.operation, status, time.perf_counter() - started)
+    return status, body
+
+async def batch_item_result(request: BusRequest, client: RateClient):
     try:
-        sock.connect(BUS_ADDRESS)
-        sock.sendall(format_tcp_request(request.service, request.operation, request.payload))
-        
-        # Leer longitud (5 bytes)
-        length_bytes = sock.recv(5)
-        if not length_bytes:
-             raise HTTPException(status_code=502, detail="El Bus SOA cerró la conexión inesperadamente.")
-        amount_expected = int(length_bytes.decode('utf-8'))
-        
-        # Leer datos completos
-        data_received = b''
-        while len(data_received) < amount_expected:
-            chunk = sock.recv(min(4096, amount_expected - len(data_received)))
-            if not chunk: break
-            data_received += chunk
-            
-        return parse_tcp_response(length_bytes + data_received)
-
-    except ConnectionRefusedError:
-        raise HTTPException(status_code=503, detail="No se pudo conectar al Bus SOA (localhost:5000). ¿Está encendido?")
-    except socket.timeout:
-        raise HTTPException(status_code=504, detail="Timeout esperando respuesta del Bus SOA.")
+        wait = await rate_limiter.check_operation(client.for_operation(request), request.service, request.operation, request.payload)
+        if wait:
+            raise too_many_requests(wait)
+        response = await request_bus(request)
+        body = raw_json_body(response, request.operation)
+        if body is not None:
+            # Los datos JSON del servicio se insertan sin volver a serializarlos
+            return 200, b'{"status":200,"data":' + body + b'}'
+        # codec.dumps: los bytes de respuestas msgpack van en base64, como en /route
+        return 200, codec.dumps({"status": 200, "data": parse_tcp_response(response, request.operation)})
     except Exception as e:
-        # Si ya es HTTPException, lo dejamos pasar
-        if isinstance(e, HTTPException): raise e
-        print(f"[Gateway] Error interno: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
+        error = http_error(request, e)
+        return error.status_code, codec.dumps({"status": error.status_code, "error": error.detail})
+
+@app.post("/route/batch")
+async def proxy_route_batch(requests: List[BusRequest], http_request: Request):
+    """
+    Varias transacciones en un solo request HTTP. Se envían en paralelo por
+    el pool de conexiones al bus (pasando por la caché y el single-flight) y
+    se responde un arreglo en el mismo orden: {"status": 200, "data": ...}
+    o {"status": 4xx/5xx, "error": ...} por solicitud.
+
+    Si todas son lecturas ya conocidas, la respuesta lleva un ETag con la
+    versión de los servicios involucrados y se responde 304 a If-None-Match
+    sin llamar al bus mientras no cambie.
+    """
+    if len(requests) > BATCH_MAX_REQUESTS:
+        raise HTTPException(status_code=400, detail=f"Máximo {BATCH_MAX_REQUESTS} solicitudes por batch")
+    # Cada solicitud gasta una ficha de la cuota general; las reglas por operación se aplican a cada una
+    client = client_id(http_request)
+    wait = await rate_limiter.check_client(client.key, len(requests))
+    if wait:
+        raise too_many_requests(wait)
+    cached = not_modified(requests, http_request)
+    if cached is not None:
+        return cached
+    version = read_version(requests)
+    results = await asyncio.gather(*[route_batch_item(request, client) for request in requests])
+    # Un error del gateway o del bus (5xx) o un 429 es transitorio: esa respuesta no se revalida
+    headers = version_headers(version) if all(status < 500 and status != 429 for status, _ in results) else {}
+    body = b"[" + b",".join(result for _, result in results) + b"]"
+    return await http_response(body, http_request, codec.MEDIA_TYPES[codec.JSON], headers)
+
+def download_headers(response: protocol.Message) -> dict:
+    filename = response.meta.get("fn")
+    return {"Content-Disposition": f'attachment; filename="{filename}"'} if filename else {}
+
+async def stream_download(request: BusRequest, response: protocol.Message):
+    """
+    Bytes del archivo en bloques de DOWNLOAD_BLOCK_SIZE. Mientras la parte
+    recibida traiga cursor (next en el meta) se pide la siguiente, así el
+    gateway tiene una sola parte en memoria a la vez.
+    """
+    while True:
+        data = response.data
+        for start in range(0, len(data), DOWNLOAD_BLOCK_SIZE):
+            yield bytes(data[start:start + DOWNLOAD_BLOCK_SIZE])
+        cursor = response.meta.get("next")
+        if not cursor:
+            return
+        part = BusRequest(service=request.service, operation=request.operation,
+                          payload=dict(request.payload, cursor=cursor))
+        response = await call_bus(part, read_only=True)
+        if response.status != "OK":
+            # El status HTTP ya se envió: se corta la conexión para que el cliente no guarde un archivo truncado
+            error = truncate(response.text())
+            log.error("Descarga interrumpida", service=request.service, op=request.operation, error=error)
+            raise RuntimeError(f"Descarga interrumpida: {error}")
+
+@app.get("/download/{service}/{operation}")
+async def download(service: str, operation: str, http_request: Request):
+    """
+    Descarga un archivo que produce un servicio (respuesta ct=raw), por
+    ejemplo GET /download/gerep/export_historial?usuario_id=7&formato=csv.
+    Los parámetros de la URL forman el payload. La respuesta HTTP se
+    transmite a medida que llegan las partes, con el tipo de contenido y el
+    nombre de archivo que indica el servicio.
+
+    Solo las operaciones de GATEWAY_DOWNLOAD_OPERATIONS, y cada parte va con
+    ro=1: un GET (prefetch de un enlace, un <img src>) no ejecuta escrituras.
+    """
+    service = protocol.service_name(service)
+    http_request.state.operation = (service, operation)
+    if (service, operation) not in download_operations:
+        raise HTTPException(status_code=405, detail=f"La operación {operation} no se puede descargar",
+                            headers={"Allow": "POST"})
+    request = BusRequest(service=service, operation=operation, payload=dict(http_request.query_params))
+    try:
+        await check_rate(request, client_id(http_request))
+        # La primera parte se pide antes de responder: un NK aún puede ser un error HTTP
+        response = await call_bus(request, read_only=True)
+        if response.status == "OK" and response.meta.get("ct") == codec.RAW:
+            return StreamingResponse(stream_download(request, response),
+                                     media_type=response.meta.get("mt", "application/octet-stream"),
+                                     headers=download_headers(response))
+        body = raw_json_body(response, operation)
+        if body is not None:
+            return Response(body, media_type=codec.MEDIA_TYPES[codec.JSON])
+        return Response(codec.dumps(parse_tcp_response(response, operation)), media_type=codec.MEDIA_TYPES[codec.JSON])
+
+    except Exception as e:
+        raise http_error(request, e)
+
+def session_user(token: str):
+    """Usuario de un token de sesión firmado por regist (common.session), o None si no es válido o venció."""
+    return session.verify(token)
+
+async def stream_events(http_request: Request, usuario_id: str, queue: asyncio.Queue):
+    """Eventos del usuario en formato SSE, con un comentario de ping cada EVENTS_PING segundos."""
+    try:
+        yield "retry: 3000\n\n"
+        while True:
+            try:
+                event = await asyncio.wait_for(queue.get(), EVENTS_PING)
+            except asyncio.TimeoutError:
+                if await http_request.is_disconnected():
+                    return
+                yield ": ping\n\n"
+                continue
+            data = json.dumps(event.get("data"), separators=(",", ":"), default=str)
+            yield f"event: {event.get('tipo')}\ndata: {data}\n\n"
     finally:
-        sock.close()
+        event_hub.unsubscribe(usuario_id, queue)
+
+@app.get("/events")
+async def events_stream(http_request: Request, token: str = ""):
+    """
+    Canal de eventos del usuario (server-sent events): notificaciones nuevas,
+    cambios de posición en listas de espera y solicitudes aprobadas o
+    rechazadas. EventSource no permite encabezados, así que el token de
+    sesión va en la URL (o en Authorization para otros clientes).
+    """
+    if not token:
+        token = http_request.headers.get("authorization", "").partition(" ")[2]
+    usuario_id = session_user(token.strip())
+    if usuario_id is None:
+        raise HTTPException(status_code=401, detail="Token de sesión requerido")
+    wait = await rate_limiter.check_client(f"user:{usuario_id}")
+    if wait:
+        raise too_many_requests(wait)
+    queue = event_hub.subscribe(usuario_id)
+    return StreamingResponse(stream_events(http_request, usuario_id, queue), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.get("/stats")
+async def gateway_stats():
+    """Estado del cliente del bus, contadores de la caché, de lecturas compartidas, circuit breakers, límites de tasa y eventos."""
+    return {"bus": bus_pool.stats(), "cache": response_cache.stats(), "single_flight": single_flight.stats(),
+            "breakers": breakers.stats(), "rate_limits": rate_limiter.stats(), "events": event_hub.stats()}
+
+def state_metrics() -> list:
+    """Muestras de lo que ya cuentan el pool, la caché, los breakers, los límites de tasa y los eventos."""
+    blocks = []
+    pool = bus_pool.stats()
+    for key, value in pool.items():
+        blocks.append(metrics.gauge(f"gateway_bus_pool_{key}", f"Cliente del bus: {key}", value))
+    used, capacity = (pool["in_use"], pool["size"]) if "size" in pool else (pool["in_flight"], pool["max_in_flight"])
+    blocks.append(metrics.gauge("gateway_bus_pool_utilization", "Fracción del pool (o de los cupos en vuelo) ocupada",
+                                used / capacity if capacity else 0))
+
+    cache = response_cache.stats()
+    blocks.append(metrics.gauge("gateway_cache_entries", "Entradas en la caché de lecturas", cache["entries"]))
+    blocks.append(metrics.gauge("gateway_cache_hit_ratio", "Aciertos / consultas de la caché de lecturas", cache["hit_rate"]))
+    for key in ("hits", "misses", "evictions", "expirations", "invalidations", "not_modified"):
+        blocks.append(metrics.gauge(f"gateway_cache_{key}_total", f"Caché de lecturas: {key}", cache[key], kind="counter"))
+    flights = single_flight.stats()
+    blocks.append(metrics.gauge("gateway_single_flight_leaders_total", "Lecturas enviadas al bus por single-flight",
+                                flights["leaders"], kind="counter"))
+    blocks.append(metrics.gauge("gateway_single_flight_shared_total", "Lecturas que reutilizaron una transacción en curso",
+                                flights["shared"], kind="counter"))
+
+    circuits = breakers.stats()
+    blocks.append(metrics.gauge("gateway_breaker_state", "Estado del circuit breaker de cada servicio (1 en el estado actual)",
+                                [((service, state), int(stats["state"] == state))
+                                 for service, stats in circuits.items() for state in (CLOSED, OPEN, HALF_OPEN)],
+                                labels=("service", "state")))
+    blocks.append(metrics.gauge("gateway_breaker_consecutive_failures", "Fallos consecutivos por servicio",
+                                [((service,), stats["consecutive_failures"]) for service, stats in circuits.items()],
+                                labels=("service",)))
+    for key in ("successes", "failures", "rejected", "trips"):
+        blocks.append(metrics.gauge(f"gateway_breaker_{key}_total", f"Circuit breaker: {key}",
+                                    [((service,), stats[key]) for service, stats in circuits.items()],
+                                    labels=("service",), kind="counter"))
+
+    limits = rate_limiter.stats()
+    blocks.append(metrics.gauge("gateway_rate_limit_allowed_total", "Transacciones permitidas por los límites de tasa",
+                                limits["allowed"], kind="counter"))
+    blocks.append(metrics.gauge("gateway_rate_limited_total", "Solicitudes rechazadas con 429, por regla",
+                                [((rule,), count) for rule, count in sorted(limits["limited"].items())],
+                                labels=("rule",), kind="counter"))
+
+    hub = event_hub.stats()
+    blocks.append(metrics.gauge("gateway_events_connections", "Conexiones abiertas a GET /events", hub["connections"]))
+    for key in ("published", "delivered", "dropped"):
+        blocks.append(metrics.gauge(f"gateway_events_{key}_total", f"Eventos {key}", hub[key], kind="counter"))
+    return blocks
+
+@app.get("/metrics")
+async def gateway_metrics():
+    """
+    Métricas en el formato de texto de Prometheus: requests y latencia por
+    ruta y por servicio/operación, fases de las transacciones al bus y el
+    estado del pool, la caché, los breakers, los límites de tasa y los eventos.
+    """
+    body = metrics.render(http_requests.render(), http_latency.render(), operation_requests.render(),
+                          operation_latency.render(), bus_timings.render(), *state_metrics())
+    return Response(body, media_type=metrics.CONTENT_TYPE)
 
 if __name__ == "__main__":
-    print("--- Gateway HTTP-TCP activo en puerto 8001 ---")
+    log.info("Gateway HTTP-TCP activo", port=8001)
     uvicorn.run(app, host="0.0.0.0", port=8001)
\ No newline at end of file